@@ -0,0 +1,135 @@
+"""
+Общий HTTP-клиент с пулом keep-alive соединений для всех источников цен
+"""
+import atexit
+import os
+import threading
+from typing import Optional
+
+import httpx
+
+# Лимиты пула соединений (можно переопределить через .env)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "10"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1"
+
+
+def _http2_available() -> bool:
+    """HTTP/2 в httpx требует пакет h2 (pip install httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HttpClientManager:
+    """Процессный менеджер общего httpx.Client.
+
+    httpx держит отдельный пул keep-alive соединений для каждого хоста,
+    поэтому один клиент на процесс переиспользует TCP/TLS соединения ко всем
+    источникам. HTTP/2 согласуется через ALPN там, где хост его поддерживает,
+    остальные хосты работают по HTTP/1.1.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections: int = HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        timeout: float = HTTP_DEFAULT_TIMEOUT,
+        http2: bool = HTTP2_ENABLED,
+    ):
+        self._lock = threading.Lock()
+        self._client: Optional[httpx.Client] = None
+        self.configure(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+            timeout=timeout,
+            http2=http2,
+        )
+
+    def configure(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        timeout: Optional[float] = None,
+        http2: Optional[bool] = None,
+    ) -> None:
+        """Изменить настройки пула. Текущий клиент закрывается и будет пересоздан."""
+        with self._lock:
+            if max_connections is not None:
+                self.max_connections = max_connections
+            if max_keepalive_connections is not None:
+                self.max_keepalive_connections = max_keepalive_connections
+            if keepalive_expiry is not None:
+                self.keepalive_expiry = keepalive_expiry
+            if timeout is not None:
+                self.timeout = timeout
+            if http2 is not None:
+                self.http2 = http2 and _http2_available()
+            self._close_locked()
+
+    def get_client(self) -> httpx.Client:
+        """Получить общий клиент (создается лениво при первом обращении)."""
+        client = self._client
+        if client is not None and not client.is_closed:
+            return client
+        with self._lock:
+            if self._client is None or self._client.is_closed:
+                self._client = httpx.Client(
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_keepalive_connections,
+                        keepalive_expiry=self.keepalive_expiry,
+                    ),
+                    http2=self.http2,
+                    follow_redirects=True,
+                )
+            return self._client
+
+    def close(self) -> None:
+        """Закрыть клиент и все соединения пула"""
+        with self._lock:
+            self._close_locked()
+
+    def _close_locked(self) -> None:
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
+
+    def get_stats(self) -> dict:
+        """Текущие настройки пула"""
+        return {
+            "active": self._client is not None and not self._client.is_closed,
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "timeout": self.timeout,
+        }
+
+
+# Глобальный экземпляр менеджера
+http_client_manager = HttpClientManager()
+
+
+def get_http_client() -> httpx.Client:
+    """Общий HTTP-клиент процесса"""
+    return http_client_manager.get_client()
+
+
+def close_http_client() -> None:
+    """Закрыть общий HTTP-клиент (вызывается при завершении приложения)"""
+    http_client_manager.close()
+
+
+atexit.register(close_http_client)
@@ -0,0 +1,205 @@
+"""
+Потокобезопасный кэш цен с разбиением блокировок по ключу (lock striping)
+
+Кэш читают и пишут поток UI, фоновая предзагрузка, потоки обновления цен,
+монитор уведомлений и поток сохранения в БД. Ключи (монета, валюта)
+распределены по сегментам, у каждого сегмента своя блокировка, поэтому
+обращения к разным монетам не ждут друг друга.
+"""
+import threading
+import time
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from .single_flight import SingleFlight
+
+PriceKey = Tuple[str, str]
+
+
+class CacheEntry:
+    """Запись в кэше с метаданными"""
+
+    __slots__ = ("price", "timestamp", "source", "ttl")
+
+    def __init__(self, price: float, timestamp: float, source: str, ttl: int = 300):
+        self.price: float = price
+        self.timestamp: float = timestamp
+        self.source: str = source
+        self.ttl: int = ttl  # 5 минут по умолчанию
+
+    def is_valid(self, now: Optional[float] = None) -> bool:
+        """Не истек ли TTL записи"""
+        return (now if now is not None else time.time()) - self.timestamp < self.ttl
+
+    def __repr__(self) -> str:
+        return (
+            f"CacheEntry(price={self.price!r}, timestamp={self.timestamp!r}, "
+            f"source={self.source!r}, ttl={self.ttl!r})"
+        )
+
+
+class _Stripe:
+    """Сегмент кэша: записи, ключи в обновлении и измененные ключи под одной блокировкой"""
+
+    __slots__ = ("lock", "entries", "refreshing", "dirty")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: Dict[PriceKey, CacheEntry] = {}
+        self.refreshing: set[PriceKey] = set()
+        self.dirty: set[PriceKey] = set()
+
+
+class PriceCache:
+    """Кэш цен по ключу (монета, валюта).
+
+    Все чтения и записи идут через методы класса. Записи неизменяемы после
+    вставки (новая цена — новая запись), поэтому читатель получает
+    согласованный снимок без копирования. get_or_refresh атомарно проверяет
+    кэш и выполняет не более одного сетевого запроса на ключ.
+    """
+
+    def __init__(self, name: str = "price", stripes: int = 16):
+        self._stripes = [_Stripe() for _ in range(stripes)]
+        self._flight = SingleFlight(name)
+        self._success_lock = threading.Lock()
+        self._last_success: Optional[float] = None
+
+    @property
+    def flight(self) -> SingleFlight:
+        return self._flight
+
+    def _stripe(self, key: Hashable) -> _Stripe:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    # Чтение и запись
+
+    def get(self, key: PriceKey) -> Optional[CacheEntry]:
+        """Запись по ключу (в том числе истекшая)"""
+        stripe = self._stripe(key)
+        with stripe.lock:
+            return stripe.entries.get(key)
+
+    def get_price(self, key: PriceKey, allow_expired: bool = False, max_age: Optional[float] = None) -> Optional[float]:
+        """Цена из кэша: актуальная по TTL (или max_age), либо любая при allow_expired"""
+        entry = self.get(key)
+        if entry is None:
+            return None
+        if allow_expired:
+            return entry.price
+        if max_age is not None:
+            return entry.price if time.time() - entry.timestamp < max_age else None
+        return entry.price if entry.is_valid() else None
+
+    def put(self, key: PriceKey, entry: CacheEntry, persist: bool = True) -> None:
+        """Записать цену; persist помечает ключ для сохранения в БД"""
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.entries[key] = entry
+            if persist:
+                stripe.dirty.add(key)
+
+    def put_if_newer(self, key: PriceKey, entry: CacheEntry) -> bool:
+        """Записать цену, если в кэше нет более свежей (загрузка сохраненных цен)"""
+        stripe = self._stripe(key)
+        with stripe.lock:
+            current = stripe.entries.get(key)
+            if current is not None and current.timestamp >= entry.timestamp:
+                return False
+            stripe.entries[key] = entry
+            return True
+
+    def purge_expired(self) -> int:
+        """Удалить истекшие записи, вернуть их число"""
+        now = time.time()
+        removed = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                expired = [key for key, entry in stripe.entries.items() if not entry.is_valid(now)]
+                for key in expired:
+                    del stripe.entries[key]
+                removed += len(expired)
+        return removed
+
+    def items(self) -> List[Tuple[PriceKey, CacheEntry]]:
+        """Снимок всех записей"""
+        result = []
+        for stripe in self._stripes:
+            with stripe.lock:
+                result.extend(stripe.entries.items())
+        return result
+
+    def __len__(self) -> int:
+        return sum(len(stripe.entries) for stripe in self._stripes)
+
+    # Получение с обновлением
+
+    def get_or_refresh(
+        self, key: PriceKey, fetch: Callable[..., Optional[float]], *args, **kwargs
+    ) -> Optional[float]:
+        """Актуальная цена из кэша или результат fetch (один вызов на ключ).
+
+        Параллельные вызовы по тому же ключу ждут один запрос. Лидер повторно
+        проверяет кэш: запрос мог завершиться, пока он получал лидерство.
+        """
+        price = self.get_price(key)
+        if price is not None:
+            return price
+
+        def _refresh():
+            fresh = self.get_price(key)
+            if fresh is not None:
+                return fresh
+            return fetch(*args, **kwargs)
+
+        return self._flight.do(key, _refresh)
+
+    def try_begin_refresh(self, keys: Iterable[PriceKey]) -> List[PriceKey]:
+        """Отметить ключи как обновляемые в фоне; вернуть те, что не обновлялись"""
+        claimed = []
+        for key in keys:
+            stripe = self._stripe(key)
+            with stripe.lock:
+                if key in stripe.refreshing:
+                    continue
+                stripe.refreshing.add(key)
+            claimed.append(key)
+        return claimed
+
+    def end_refresh(self, keys: Iterable[PriceKey]) -> None:
+        """Снять отметку фонового обновления"""
+        for key in keys:
+            stripe = self._stripe(key)
+            with stripe.lock:
+                stripe.refreshing.discard(key)
+
+    # Сохранение в БД
+
+    def pop_dirty(self) -> List[Tuple[PriceKey, CacheEntry]]:
+        """Забрать измененные записи для сохранения"""
+        result = []
+        for stripe in self._stripes:
+            with stripe.lock:
+                for key in stripe.dirty:
+                    entry = stripe.entries.get(key)
+                    if entry is not None:
+                        result.append((key, entry))
+                stripe.dirty.clear()
+        return result
+
+    def mark_dirty(self, keys: Iterable[PriceKey]) -> None:
+        """Вернуть ключи в очередь сохранения (после неудачной записи)"""
+        for key in keys:
+            stripe = self._stripe(key)
+            with stripe.lock:
+                stripe.dirty.add(key)
+
+    # Время последнего успешного запроса
+
+    def mark_success(self, timestamp: Optional[float] = None) -> None:
+        with self._success_lock:
+            self._last_success = timestamp if timestamp is not None else time.time()
+
+    @property
+    def last_success(self) -> Optional[float]:
+        with self._success_lock:
+            return self._last_success
@@ -1,25 +1,25 @@
+import atexit
 import json
 import random
 import time
 from typing import Dict, Tuple, Optional
-from dataclasses import dataclass
 import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import httpx
 
-@dataclass
-class CacheEntry:
-    """Запись в кэше с метаданными"""
-    price: float
-    timestamp: float
-    source: str
-    ttl: int = 300  # 5 минут по умолчанию
-
-# Улучшенный кэш с метаданными
-_cache: Dict[Tuple[str, str], CacheEntry] = {}
-_refresh_in_progress: set[Tuple[str, str]] = set()
+from .http_client import get_http_client
+from .price_cache import CacheEntry, PriceCache
+from .single_flight import SingleFlight
+from .source_health import source_registry
+
+# Кэш цен с метаданными; все чтения и записи идут через него
+price_cache = PriceCache("price")
 _preload_started = False
-_last_success_timestamp: Optional[float] = None
+
+# Объединение одновременных сетевых запросов расширенной информации о цене
+# (запросы цены объединяет сам price_cache.get_or_refresh)
+_price_info_flight = SingleFlight("price_info")
 
 # TTL для разных типов монет (в секундах)
 CACHE_TTL = {
@@ -29,24 +29,106 @@ CACHE_TTL = {
     'DEFAULT': 300 # 5 минут для остальных
 }
 
+# Write-behind сохранение кэша цен в таблицу PriceStore
+PRICE_STORE_FLUSH_INTERVAL = 30  # секунд
+_flusher_lock = threading.Lock()
+_flusher_started = False
+
+
+def _set_cache_entry(key: Tuple[str, str], entry: CacheEntry) -> None:
+    """Записать цену в кэш и пометить ее для сохранения в БД"""
+    price_cache.put(key, entry)
+    _ensure_price_store_flusher()
+
+
+def flush_price_store() -> int:
+    """Сохранить измененные записи кэша в PriceStore. Возвращает число записей."""
+    dirty = price_cache.pop_dirty()
+    rows = [
+        {
+            "coin": key[0],
+            "quote": key[1],
+            "price": entry.price,
+            "source": entry.source,
+            "ttl": entry.ttl,
+            "timestamp": entry.timestamp,
+        }
+        for key, entry in dirty
+    ]
+    if not rows:
+        return 0
+    try:
+        from app.storage.price_store import save_prices
+        return save_prices(rows)
+    except Exception as e:
+        # print(f"⚠️ Не удалось сохранить цены: {e}")
+        # Вернем ключи, чтобы сохранить их при следующей попытке
+        price_cache.mark_dirty(key for key, _ in dirty)
+        return 0
+
+
+def _ensure_price_store_flusher() -> None:
+    """Запускает фоновый поток периодического сохранения (один раз)."""
+    global _flusher_started
+    if _flusher_started:
+        return
+    with _flusher_lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+
+    def _runner():
+        while True:
+            time.sleep(PRICE_STORE_FLUSH_INTERVAL)
+            flush_price_store()
+
+    threading.Thread(target=_runner, daemon=True).start()
+
+
+def warm_start_price_cache() -> int:
+    """Загружает сохраненные цены в кэш при старте.
+
+    Записи сохраняют исходное время получения, поэтому устаревшие цены
+    отдаются как «stale» и обновляются в фоне при первом обращении.
+    """
+    from app.storage.price_store import load_prices
+
+    loaded = 0
+    for row in load_prices():
+        key = (row["coin"].upper(), row["quote"].lower())
+        entry = CacheEntry(
+            price=row["price"],
+            timestamp=row["timestamp"],
+            source=row["source"],
+            ttl=row["ttl"],
+        )
+        if price_cache.put_if_newer(key, entry):
+            loaded += 1
+    return loaded
+
+
+atexit.register(flush_price_store)
+
+
 def get_cache_ttl(symbol: str) -> int:
     """Получить TTL для символа"""
     return CACHE_TTL.get(symbol.upper(), CACHE_TTL['DEFAULT'])
 
 def is_cache_valid(entry: CacheEntry) -> bool:
     """Проверить, действителен ли кэш"""
-    return time.time() - entry.timestamp < entry.ttl
+    return entry.is_valid()
 
 def get_cache_stats() -> Dict[str, any]:
     """Получить статистику кэша"""
     now = time.time()
-    total_entries = len(_cache)
-    valid_entries = sum(1 for entry in _cache.values() if is_cache_valid(entry))
+    entries = [entry for _, entry in price_cache.items()]
+    total_entries = len(entries)
+    valid_entries = sum(1 for entry in entries if entry.is_valid(now))
     expired_entries = total_entries - valid_entries
     
     # Статистика по источникам
     sources = {}
-    for entry in _cache.values():
+    for entry in entries:
         source = entry.source
         sources[source] = sources.get(source, 0) + 1
     
@@ -55,40 +137,33 @@ def get_cache_stats() -> Dict[str, any]:
         'valid_entries': valid_entries,
         'expired_entries': expired_entries,
         'hit_rate': valid_entries / total_entries if total_entries > 0 else 0,
-        'sources': sources
+        'sources': sources,
+        'coalescing': get_coalescing_stats(),
+    }
+
+
+def get_coalescing_stats() -> Dict[str, Dict[str, int]]:
+    """Счетчики объединенных (coalesced) запросов цен"""
+    return {
+        flight.name: flight.get_stats()
+        for flight in (price_cache.flight, _price_info_flight)
     }
 
 def clean_expired_cache():
     """Очистить устаревшие записи из кэша"""
-    expired_keys = []
-    for key, entry in _cache.items():
-        if not is_cache_valid(entry):
-            expired_keys.append(key)
-    
-    for key in expired_keys:
-        del _cache[key]
-    
-    return len(expired_keys)
+    return price_cache.purge_expired()
 
 def preload_popular_coins():
     """Предзагрузить цены популярных монет"""
     popular_coins = ['BTC', 'ETH', 'LINK', 'ADA', 'DOT', 'MATIC', 'AVAX', 'SOL']
     
     # print("🔄 Предзагрузка популярных монет...")
-    loaded_count = 0
-    
-    for coin in popular_coins:
-        try:
-            price = get_current_price(coin)
-            if price:
-                loaded_count += 1
-                # print(f"✅ {coin}: ${price:.2f}")
-            else:
-                # print(f"❌ {coin}: не удалось загрузить")
-                pass
-        except Exception as e:
-            # print(f"❌ {coin}: ошибка - {e}")
-            pass
+    # Все монеты загружаются одним пакетным запросом
+    try:
+        loaded_count = len(get_current_prices(popular_coins))
+    except Exception as e:
+        # print(f"❌ Ошибка предзагрузки: {e}")
+        loaded_count = 0
     
     # print(f"🎯 Предзагружено {loaded_count}/{len(popular_coins)} монет")
     return loaded_count
@@ -201,39 +276,51 @@ ID_MAP = {
 }
 
 
+# CoinGecko Simple Price API
+COINGECKO_SIMPLE_PRICE_URL = "https://api.coingecko.com/api/v3/simple/price"
+
+# Максимум ID монет в одном пакетном запросе (ограничение длины URL)
+BULK_CHUNK_SIZE = 100
+
+
 def get_cached_price(symbol: str, quote: str = "USD", allow_expired: bool = False) -> Optional[float]:
     """Возвращает цену из кэша без сетевых вызовов."""
-    key = (symbol.upper(), quote.lower())
-    entry = _cache.get(key)
-    if not entry:
-        return None
-    if allow_expired or is_cache_valid(entry):
-        return entry.price
-    return None
+    return price_cache.get_price((symbol.upper(), quote.lower()), allow_expired=allow_expired)
 
 
 def get_cache_entry(symbol: str, quote: str = "USD") -> Optional[CacheEntry]:
     """Возвращает объект CacheEntry из кэша, если он есть."""
-    key = (symbol.upper(), quote.lower())
-    entry = _cache.get(key)
-    if entry and isinstance(entry, CacheEntry):
-        return entry
-    return None
+    return price_cache.get((symbol.upper(), quote.lower()))
 
 
 def _schedule_refresh(symbol: str, quote: str = "USD") -> None:
     """Запускает обновление цены в фоне, чтобы не блокировать UI."""
-    key = (symbol.upper(), quote.lower())
-    if key in _refresh_in_progress:
+    keys = price_cache.try_begin_refresh([(symbol.upper(), quote.lower())])
+    if not keys:
         return
 
     def _refresh():
         try:
             get_current_price(symbol, quote)
         finally:
-            _refresh_in_progress.discard(key)
+            price_cache.end_refresh(keys)
+
+    threading.Thread(target=_refresh, daemon=True).start()
+
+
+def refresh_prices_in_background(symbols: list[str], quote: str = "USD") -> None:
+    """Обновляет цены нескольких монет одним пакетным запросом в фоне."""
+    q = quote.lower()
+    keys = price_cache.try_begin_refresh(dict.fromkeys((s.upper(), q) for s in symbols if s))
+    if not keys:
+        return
+
+    def _refresh():
+        try:
+            get_current_prices([sym for sym, _ in keys], quote)
+        finally:
+            price_cache.end_refresh(keys)
 
-    _refresh_in_progress.add(key)
     threading.Thread(target=_refresh, daemon=True).start()
 
 
@@ -253,18 +340,24 @@ def get_current_price(symbol: str, quote: str = "USD") -> float | None:
     sym = symbol.upper()
     q = quote.lower()
     key = (sym, q)
-    now = time.time()
 
-    # Проверяем кэш с умным TTL
-    entry = _cache.get(key)
-    if entry:
-        if is_cache_valid(entry):
-            return entry.price
-        # устаревшую запись не удаляем, чтобы можно было использовать как «stale»
+    # Проверяем кэш с умным TTL (устаревшая запись остается для «stale»)
+    price = price_cache.get_price(key)
+    if price is not None:
+        return price
 
     # Запускаем предзагрузку популярных монет в фоне (однократно)
     ensure_preload_popular_coins()
 
+    # Параллельные запросы той же монеты ждут один сетевой вызов
+    return price_cache.get_or_refresh(key, _fetch_current_price, sym, q)
+
+
+def _fetch_current_price(sym: str, q: str) -> float | None:
+    """Сетевой запрос цены в CoinGecko с сохранением в кэш."""
+    key = (sym, q)
+    now = time.time()
+
     # Получаем ID монеты для CoinGecko API
     coin_id = ID_MAP.get(sym, sym.lower())
 
@@ -278,33 +371,32 @@ def get_current_price(symbol: str, quote: str = "USD") -> float | None:
     }
 
     try:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.get(url, params=params)
-            r.raise_for_status()
-            data = r.json()
-
-            if coin_id in data:
-                coin_data = data[coin_id]
-                price = float(coin_data.get(q, 0.0))
-
-                if price > 0:
-                    # Сохраняем в кэш с метаданными
-                    ttl = get_cache_ttl(sym)
-                    global _last_success_timestamp
-                    _cache[key] = CacheEntry(
-                        price=price,
-                        timestamp=now,
-                        source="CoinGecko",
-                        ttl=ttl
-                    )
-                    _last_success_timestamp = now
-                    return price
-                else:
-                    # print(f"⚠️ Получена нулевая цена для {sym}")
-                    return None
+        client = get_http_client()
+        r = client.get(url, params=params, timeout=10.0)
+        r.raise_for_status()
+        data = r.json()
+
+        if coin_id in data:
+            coin_data = data[coin_id]
+            price = float(coin_data.get(q, 0.0))
+
+            if price > 0:
+                # Сохраняем в кэш с метаданными
+                ttl = get_cache_ttl(sym)
+                _set_cache_entry(key, CacheEntry(
+                    price=price,
+                    timestamp=now,
+                    source="CoinGecko",
+                    ttl=ttl
+                ))
+                price_cache.mark_success(now)
+                return price
             else:
-                # print(f"⚠️ Монета {sym} не найдена в ответе API")
+                # print(f"⚠️ Получена нулевая цена для {sym}")
                 return None
+        else:
+            # print(f"⚠️ Монета {sym} не найдена в ответе API")
+            return None
 
     except httpx.TimeoutException:
         # print(f"⏰ Таймаут при получении цены для {sym}")
@@ -317,6 +409,93 @@ def get_current_price(symbol: str, quote: str = "USD") -> float | None:
         return None
 
 
+def _fetch_simple_prices(coin_ids: list[str], quote: str) -> dict:
+    """Один запрос к CoinGecko Simple Price сразу для нескольких ID монет."""
+    params = {
+        "ids": ",".join(coin_ids),
+        "vs_currencies": quote,
+        "include_24hr_change": "true",
+        "include_last_updated_at": "true",
+    }
+    client = get_http_client()
+    r = client.get(COINGECKO_SIMPLE_PRICE_URL, params=params, timeout=10.0)
+    r.raise_for_status()
+    return r.json()
+
+
+def get_current_prices(
+    symbols: list[str], quote: str = "USD", max_retries: int = 2
+) -> Dict[str, float]:
+    """Возвращает текущие цены сразу для нескольких монет.
+
+    Монеты с актуальным кэшем берутся из кэша, остальные ID из ID_MAP
+    упаковываются в пакетные запросы по BULK_CHUNK_SIZE штук, а полученные
+    цены сохраняются в кэш для каждой монеты.
+
+    Args:
+        symbols: Символы криптовалют (например, ['BTC', 'ETH'])
+        quote: Валюта для отображения цены (по умолчанию 'USD')
+        max_retries: Максимальное количество попыток для каждого пакета
+
+    Returns:
+        Dict[str, float]: Цены по символам (только успешно полученные)
+    """
+    q = quote.lower()
+    prices: Dict[str, float] = {}
+    # coin_id -> символы (несколько символов могут ссылаться на один ID)
+    missing: Dict[str, list[str]] = {}
+
+    for symbol in symbols:
+        if not symbol:
+            continue
+        sym = symbol.upper()
+        cached_price = price_cache.get_price((sym, q))
+        if cached_price is not None:
+            prices[sym] = cached_price
+            continue
+        coin_id = ID_MAP.get(sym, sym.lower())
+        syms = missing.setdefault(coin_id, [])
+        if sym not in syms:
+            syms.append(sym)
+
+    coin_ids = list(missing)
+    for start in range(0, len(coin_ids), BULK_CHUNK_SIZE):
+        chunk = coin_ids[start:start + BULK_CHUNK_SIZE]
+        data = None
+        for attempt in range(max_retries):
+            if attempt > 0:
+                # Случайная задержка для избежания rate limiting
+                time.sleep(random.uniform(0.3, 0.7) * (attempt + 1))
+            try:
+                data = _fetch_simple_prices(chunk, q)
+                break
+            except Exception as e:
+                # print(f"⚠️ Пакетный запрос, попытка {attempt + 1} неудачна: {e}")
+                continue
+        if not data:
+            continue
+
+        now = time.time()
+        for coin_id in chunk:
+            coin_data = data.get(coin_id)
+            if not coin_data:
+                continue
+            price = float(coin_data.get(q, 0.0) or 0.0)
+            if price <= 0:
+                continue
+            for sym in missing[coin_id]:
+                _set_cache_entry((sym, q), CacheEntry(
+                    price=price,
+                    timestamp=now,
+                    source="CoinGecko",
+                    ttl=get_cache_ttl(sym),
+                ))
+                prices[sym] = price
+            price_cache.mark_success(now)
+
+    return prices
+
+
 def get_price_info(symbol: str, quote: str = "USD") -> dict | None:
     """Возвращает расширенную информацию о цене через CoinGecko API.
 
@@ -342,8 +521,8 @@ def get_price_info(symbol: str, quote: str = "USD") -> dict | None:
     now = time.time()
 
     # Проверяем кэш (актуален 5 минут для улучшения производительности)
-    entry = _cache.get(key)
-    if entry and isinstance(entry, CacheEntry) and now - entry.timestamp < 300:
+    entry = price_cache.get(key)
+    if entry is not None and now - entry.timestamp < 300:
         return {
             "price": entry.price,
             "change_24h": None,
@@ -351,6 +530,15 @@ def get_price_info(symbol: str, quote: str = "USD") -> dict | None:
             "cached": True,
         }
 
+    # Параллельные запросы той же монеты ждут один сетевой вызов
+    return _price_info_flight.do(key, _fetch_price_info, sym, q)
+
+
+def _fetch_price_info(sym: str, q: str) -> dict | None:
+    """Сетевой запрос расширенной информации о цене с сохранением в кэш."""
+    key = (sym, q)
+    now = time.time()
+
     # Получаем ID монеты для CoinGecko API
     coin_id = ID_MAP.get(sym, sym.lower())
 
@@ -364,42 +552,69 @@ def get_price_info(symbol: str, quote: str = "USD") -> dict | None:
     }
 
     try:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.get(url, params=params)
-            r.raise_for_status()
-            data = r.json()
+        client = get_http_client()
+        r = client.get(url, params=params, timeout=10.0)
+        r.raise_for_status()
+        data = r.json()
+
+        if coin_id in data:
+            coin_data = data[coin_id]
+            price = float(coin_data.get(q, 0.0))
+            change_24h = coin_data.get(f"{q}_24h_change")
+            last_updated = coin_data.get("last_updated_at")
+
+            if price > 0:
+                # Сохраняем в кэш
+                _set_cache_entry(key, CacheEntry(
+                    price=price,
+                    timestamp=now,
+                    source="CoinGecko",
+                    ttl=get_cache_ttl(sym),
+                ))
 
-            if coin_id in data:
-                coin_data = data[coin_id]
-                price = float(coin_data.get(q, 0.0))
-                change_24h = coin_data.get(f"{q}_24h_change")
-                last_updated = coin_data.get("last_updated_at")
-
-                if price > 0:
-                    # Сохраняем в кэш
-                    _cache[key] = CacheEntry(
-                        price=price,
-                        timestamp=now,
-                        source="CoinGecko",
-                        ttl=get_cache_ttl(sym),
-                    )
-
-                    return {
-                        "price": price,
-                        "change_24h": change_24h,
-                        "last_updated": last_updated,
-                        "cached": False,
-                    }
-                else:
-                    return None
+                return {
+                    "price": price,
+                    "change_24h": change_24h,
+                    "last_updated": last_updated,
+                    "cached": False,
+                }
             else:
                 return None
+        else:
+            return None
 
     except Exception as e:
         # print(f"❌ Ошибка при получении информации о цене для {sym}: {e}")
         return None
 
 
+def get_market_chart(
+    symbol: str, start_ts: int, end_ts: int, quote: str = "USD"
+) -> list[tuple[int, float, float]]:
+    """Исторические цены CoinGecko (market_chart/range) за период.
+
+    Детализация выбирается API: почасовая для периодов до 90 дней,
+    дневная для более длинных.
+
+    Returns:
+        list[tuple[int, float, float]]: (timestamp в мс, цена, объем)
+    """
+    coin_id = ID_MAP.get(symbol.upper(), symbol.lower())
+    url = f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart/range"
+    params = {"vs_currency": quote.lower(), "from": int(start_ts), "to": int(end_ts)}
+
+    client = get_http_client()
+    r = client.get(url, params=params, timeout=20.0)
+    r.raise_for_status()
+    data = r.json()
+    volumes = {int(ts): float(v) for ts, v in data.get("total_volumes", [])}
+    return [
+        (int(ts), float(price), volumes.get(int(ts), 0.0))
+        for ts, price in data.get("prices", [])
+        if price is not None
+    ]
+
+
 def get_price_from_binance(symbol: str, quote: str = "USD") -> float | None:
     """Получает цену с Binance API как альтернативный источник."""
     try:
@@ -408,11 +623,11 @@ def get_price_from_binance(symbol: str, quote: str = "USD") -> float | None:
         url = "https://api.binance.com/api/v3/ticker/price"
         params = {"symbol": binance_symbol}
 
-        with httpx.Client(timeout=5.0) as client:
-            r = client.get(url, params=params)
-            r.raise_for_status()
-            data = r.json()
-            return float(data.get("price", 0))
+        client = get_http_client()
+        r = client.get(url, params=params, timeout=5.0)
+        r.raise_for_status()
+        data = r.json()
+        return float(data.get("price", 0))
     except Exception as e:
         # print(f"⚠️ Binance API ошибка для {symbol}: {e}")
         return None
@@ -436,13 +651,13 @@ def get_price_from_coinpaprika(symbol: str, quote: str = "USD") -> float | None:
         coin_id = coin_id_map.get(symbol.upper(), symbol.lower())
         url = f"https://api.coinpaprika.com/v1/tickers/{coin_id}"
 
-        with httpx.Client(timeout=5.0) as client:
-            r = client.get(url)
-            r.raise_for_status()
-            data = r.json()
-            quotes = data.get("quotes", {})
-            usd_quote = quotes.get("USD", {})
-            return float(usd_quote.get("price", 0))
+        client = get_http_client()
+        r = client.get(url, timeout=5.0)
+        r.raise_for_status()
+        data = r.json()
+        quotes = data.get("quotes", {})
+        usd_quote = quotes.get("USD", {})
+        return float(usd_quote.get("price", 0))
     except Exception as e:
         # print(f"⚠️ CoinPaprika API ошибка для {symbol}: {e}")
         return None
@@ -455,15 +670,15 @@ def get_price_from_coinbase(symbol: str, quote: str = "USD") -> float | None:
         url = f"https://api.coinbase.com/v2/exchange-rates"
         params = {"currency": symbol.upper()}
 
-        with httpx.Client(timeout=5.0) as client:
-            r = client.get(url, params=params)
-            r.raise_for_status()
-            data = r.json()
-            rates = data.get("data", {}).get("rates", {})
-            usd_rate = rates.get("USD")
-            if usd_rate:
-                return float(usd_rate)
-            return None
+        client = get_http_client()
+        r = client.get(url, params=params, timeout=5.0)
+        r.raise_for_status()
+        data = r.json()
+        rates = data.get("data", {}).get("rates", {})
+        usd_rate = rates.get("USD")
+        if usd_rate:
+            return float(usd_rate)
+        return None
     except Exception as e:
         # print(f"⚠️ Coinbase API ошибка для {symbol}: {e}")
         return None
@@ -491,16 +706,16 @@ def get_price_from_kraken(symbol: str, quote: str = "USD") -> float | None:
         url = "https://api.kraken.com/0/public/Ticker"
         params = {"pair": kraken_symbol}
 
-        with httpx.Client(timeout=5.0) as client:
-            r = client.get(url, params=params)
-            r.raise_for_status()
-            data = r.json()
-            result = data.get("result", {})
-            if kraken_symbol in result:
-                ticker = result[kraken_symbol]
-                price = ticker.get("c", [0])[0]  # c[0] = last trade closed price
-                return float(price)
-            return None
+        client = get_http_client()
+        r = client.get(url, params=params, timeout=5.0)
+        r.raise_for_status()
+        data = r.json()
+        result = data.get("result", {})
+        if kraken_symbol in result:
+            ticker = result[kraken_symbol]
+            price = ticker.get("c", [0])[0]  # c[0] = last trade closed price
+            return float(price)
+        return None
     except Exception as e:
         # print(f"⚠️ Kraken API ошибка для {symbol}: {e}")
         return None
@@ -514,16 +729,16 @@ def get_price_from_okx(symbol: str, quote: str = "USD") -> float | None:
         url = "https://www.okx.com/api/v5/market/ticker"
         params = {"instId": okx_symbol}
 
-        with httpx.Client(timeout=5.0) as client:
-            r = client.get(url, params=params)
-            r.raise_for_status()
-            data = r.json()
-            if data.get("code") == "0":
-                tickers = data.get("data", [])
-                if tickers:
-                    ticker = tickers[0]
-                    return float(ticker.get("last", 0))
-            return None
+        client = get_http_client()
+        r = client.get(url, params=params, timeout=5.0)
+        r.raise_for_status()
+        data = r.json()
+        if data.get("code") == "0":
+            tickers = data.get("data", [])
+            if tickers:
+                ticker = tickers[0]
+                return float(ticker.get("last", 0))
+        return None
     except Exception as e:
         # print(f"⚠️ OKX API ошибка для {symbol}: {e}")
         return None
@@ -559,14 +774,14 @@ def get_price_from_coinmarketcap(symbol: str, quote: str = "USD") -> float | Non
         headers = {"X-CMC_PRO_API_KEY": "YOUR_API_KEY_HERE"}  # Нужен API ключ
 
         # Пробуем без API ключа (ограниченный доступ)
-        with httpx.Client(timeout=5.0) as client:
-            r = client.get(url, params=params)
-            if r.status_code == 200:
-                data = r.json()
-                if "data" in data and cmc_id in data["data"]:
-                    quote_data = data["data"][cmc_id]["quote"][quote.upper()]
-                    return float(quote_data["price"])
-            return None
+        client = get_http_client()
+        r = client.get(url, params=params, timeout=5.0)
+        if r.status_code == 200:
+            data = r.json()
+            if "data" in data and cmc_id in data["data"]:
+                quote_data = data["data"][cmc_id]["quote"][quote.upper()]
+                return float(quote_data["price"])
+        return None
     except Exception as e:
         # print(f"⚠️ CoinMarketCap API ошибка для {symbol}: {e}")
         return None
@@ -595,8 +810,78 @@ def get_smart_rounded_price(price: float, symbol: str) -> float:
         return round(price, 6)
 
 
-def get_aggregated_price(symbol: str, quote: str = "USD") -> dict | None:
-    """Получает агрегированную цену из нескольких источников с фильтрацией."""
+# Источники цен для агрегатора (опрашиваются параллельно)
+PRICE_SOURCES = [
+    ("CoinGecko", get_current_price),
+    ("Binance", get_price_from_binance),
+    ("CoinPaprika", get_price_from_coinpaprika),
+    ("Coinbase", get_price_from_coinbase),
+    ("Kraken", get_price_from_kraken),
+    ("OKX", get_price_from_okx),
+    ("CoinMarketCap", get_price_from_coinmarketcap),
+]
+
+# Общий дедлайн опроса всех источников (секунды)
+AGGREGATE_DEADLINE = 6.0
+# Сколько согласованных котировок достаточно, чтобы не ждать остальные источники
+AGGREGATE_QUORUM = 3
+# Допустимое отклонение котировки от медианы, чтобы считать ее согласованной
+AGGREGATE_AGREEMENT = 0.01
+
+# Пул потоков для параллельного опроса источников (общий на процесс)
+_fanout_executor = ThreadPoolExecutor(
+    max_workers=len(PRICE_SOURCES) * 2, thread_name_prefix="price-fanout"
+)
+
+
+def _has_quorum(prices: list[float], quorum: int) -> bool:
+    """Проверяет, что минимум quorum котировок согласуются с медианой."""
+    if len(prices) < quorum:
+        return False
+    median_price = sorted(prices)[len(prices) // 2]
+    if median_price <= 0:
+        return False
+    agreeing = [
+        p for p in prices if abs(p - median_price) / median_price <= AGGREGATE_AGREEMENT
+    ]
+    return len(agreeing) >= quorum
+
+
+def _timed_source_call(
+    source_name: str, source_func, sym: str, q: str
+) -> Tuple[float | None, float]:
+    """Вызывает источник, учитывает результат в реестре здоровья и
+    возвращает (цена, задержка в мс)."""
+    started = time.perf_counter()
+    try:
+        price = source_func(sym, q)
+    except Exception:
+        price = None
+    latency_ms = (time.perf_counter() - started) * 1000
+    if price and price > 0:
+        source_registry.record_success(source_name, latency_ms, sym)
+    else:
+        # Учитывается по паре (источник, символ): отсутствие котировки
+        # редкой монеты не отключает источник для остальных
+        source_registry.record_failure(source_name, latency_ms, sym)
+    return price, latency_ms
+
+
+def get_aggregated_price(
+    symbol: str,
+    quote: str = "USD",
+    deadline: float = AGGREGATE_DEADLINE,
+    quorum: int = AGGREGATE_QUORUM,
+) -> dict | None:
+    """Получает агрегированную цену из нескольких источников с фильтрацией.
+
+    Доступные источники (с закрытым circuit breaker, см. source_registry)
+    опрашиваются параллельно с общим дедлайном в порядке оценки здоровья.
+    Как только набирается quorum согласованных котировок, ожидание
+    прекращается, а оставшиеся запросы отменяются (уже запущенные завершатся
+    в фоне, их результат игнорируется). Такие источники возвращаются в
+    skipped_sources, а не успевшие к дедлайну без кворума — в timed_out_sources.
+    """
     if not symbol:
         return None
 
@@ -606,9 +891,8 @@ def get_aggregated_price(symbol: str, quote: str = "USD") -> dict | None:
     now = time.time()
 
     # Проверяем кэш (актуален 5 минут для улучшения производительности)
-    entry = _cache.get(key)
-    if entry and isinstance(entry, CacheEntry) and now - entry.timestamp < 300:
-        cached_price = entry.price
+    cached_price = price_cache.get_price(key, max_age=300)
+    if cached_price is not None:
         return {
             "price": cached_price,
             "sources": ["Кэш"],
@@ -617,36 +901,47 @@ def get_aggregated_price(symbol: str, quote: str = "USD") -> dict | None:
             "cached": True,
         }
 
-    # Все доступные источники
-    sources = [
-        ("CoinGecko", lambda: get_current_price(sym, q)),
-        ("Binance", lambda: get_price_from_binance(sym, q)),
-        ("CoinPaprika", lambda: get_price_from_coinpaprika(sym, q)),
-        ("Coinbase", lambda: get_price_from_coinbase(sym, q)),
-        ("Kraken", lambda: get_price_from_kraken(sym, q)),
-        ("OKX", lambda: get_price_from_okx(sym, q)),
-        ("CoinMarketCap", lambda: get_price_from_coinmarketcap(sym, q)),
-    ]
+    # Источники с открытым circuit breaker пропускаются, остальные
+    # запускаются в порядке убывания оценки здоровья
+    source_funcs = dict(PRICE_SOURCES)
+    ordered_sources = source_registry.order_by_health(list(source_funcs), sym)
+    futures = {
+        _fanout_executor.submit(
+            _timed_source_call, source_name, source_funcs[source_name], sym, q
+        ): source_name
+        for source_name in ordered_sources
+    }
 
     prices = []
     working_sources = []
-
-    # Убираем отладочные сообщения для улучшения производительности
-    # print(f"🔍 Собираем цены для {sym} из {len(sources)} источников...")
-
-    for source_name, source_func in sources:
-        try:
-            price = source_func()
+    latencies: Dict[str, float] = {}
+    pending = set(futures)
+    deadline_at = time.monotonic() + deadline
+    quorum_reached = False
+
+    while pending:
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            source_name = futures[future]
+            price, latency_ms = future.result()
+            latencies[source_name] = round(latency_ms, 1)
             if price and price > 0:
                 prices.append(price)
                 working_sources.append(source_name)
-                # print(f"✅ {source_name}: ${price:,.2f}")
-            else:
-                # print(f"⚠️ {source_name}: недоступно")
-                pass
-        except Exception as e:
-            # print(f"❌ {source_name}: {e}")
-            continue
+        if _has_quorum(prices, quorum):
+            quorum_reached = True
+            break
+
+    # Оставшиеся запросы отменяем: после кворума они просто не нужны
+    # (skipped), а без кворума не уложились в дедлайн (timed out)
+    unanswered = [futures[f] for f in pending]
+    timed_out_sources = [] if quorum_reached else unanswered
+    skipped_sources = unanswered if quorum_reached else []
+    for future in pending:
+        future.cancel()
 
     if not prices:
         # print(f"❌ Все источники недоступны для {sym}")
@@ -661,7 +956,6 @@ def get_aggregated_price(symbol: str, quote: str = "USD") -> dict | None:
         ]
         if filtered_prices:
             prices = filtered_prices
-            # print(f"🔍 Отфильтровано {len(prices)} из {len(prices) + len(sources) - len(working_sources)} цен")
 
     # Вычисляем среднюю цену
     average_price = sum(prices) / len(prices)
@@ -670,7 +964,13 @@ def get_aggregated_price(symbol: str, quote: str = "USD") -> dict | None:
     rounded_price = get_smart_rounded_price(average_price, sym)
 
     # Сохраняем в кэш (округляем для кэша тоже)
-    _cache[key] = (rounded_price, now)
+    _set_cache_entry(key, CacheEntry(
+        price=rounded_price,
+        timestamp=now,
+        source="Агрегатор",
+        ttl=get_cache_ttl(sym),
+    ))
+    price_cache.mark_success(now)
 
     result = {
         "price": rounded_price,
@@ -683,6 +983,9 @@ def get_aggregated_price(symbol: str, quote: str = "USD") -> dict | None:
             "max": get_smart_rounded_price(max(prices), sym),
             "spread": get_smart_rounded_price(max(prices) - min(prices), sym),
         },
+        "latency_ms": latencies,
+        "timed_out_sources": timed_out_sources,
+        "skipped_sources": skipped_sources,
     }
 
     # print(f"📊 Средняя цена {sym}: ${average_price:,.2f} (из {len(working_sources)} источников)")
@@ -737,8 +1040,7 @@ def get_current_price_with_retry(
 
             price = get_current_price(symbol, quote)
             if price:
-                global _last_success_timestamp
-                _last_success_timestamp = time.time()
+                price_cache.mark_success()
                 return price
 
         except Exception as e:
@@ -758,4 +1060,4 @@ def get_current_price_with_retry(
 
 def get_last_success_timestamp() -> Optional[float]:
     """Возвращает timestamp последнего успешного запроса цены"""
-    return _last_success_timestamp
+    return price_cache.last_success
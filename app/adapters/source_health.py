@@ -0,0 +1,202 @@
+"""
+Учет состояния источников цен: успешность, задержки и circuit breaker
+
+Состояние ведется по паре (источник, символ): источник, который не
+котирует редкую монету, отключается только для нее, а не для BTC/ETH.
+"""
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+# Сколько ошибок подряд открывают circuit breaker
+FAILURE_THRESHOLD = 3
+# Начальная и максимальная пауза открытого circuit breaker (секунды)
+BASE_COOLDOWN = 30.0
+MAX_COOLDOWN = 30 * 60.0
+# Сколько последних задержек хранить для расчета перцентилей
+LATENCY_WINDOW = 100
+# Сколько секунд действует выданный пробный запрос half_open (если его
+# результат так и не записан — например, запрос отменен — выдается новый)
+PROBE_TIMEOUT = 10.0
+
+
+def health_key(name: str, symbol: Optional[str] = None) -> str:
+    """Ключ состояния: источник или пара источник:символ"""
+    return f"{name}:{symbol.upper()}" if symbol else name
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+class SourceHealth:
+    """Статистика и состояние circuit breaker одного источника"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.open_count = 0  # сколько раз подряд открывался breaker
+        self.open_until = 0.0
+        self.probe_until = 0.0  # пробный запрос half_open выдан до этого момента
+        self.last_error_at: Optional[float] = None
+        self.last_success_at: Optional[float] = None
+
+    @property
+    def total_calls(self) -> int:
+        return self.successes + self.failures
+
+    @property
+    def success_rate(self) -> float:
+        # Новый источник считается здоровым, пока нет статистики
+        return self.successes / self.total_calls if self.total_calls else 1.0
+
+    def state(self, now: float) -> str:
+        """closed / open / half_open"""
+        if self.open_count == 0:
+            return "closed"
+        return "open" if now < self.open_until else "half_open"
+
+    def try_acquire(self, now: float) -> bool:
+        """Можно ли обратиться: в half_open — только один пробный запрос"""
+        state = self.state(now)
+        if state == "closed":
+            return True
+        if state == "open" or now < self.probe_until:
+            return False
+        self.probe_until = now + PROBE_TIMEOUT
+        return True
+
+    def score(self, now: float) -> float:
+        """Оценка здоровья: доля успехов с поправкой на медианную задержку"""
+        if self.state(now) == "open":
+            return 0.0
+        p50 = _percentile(list(self.latencies), 50) or 0.0
+        return self.success_rate / (1.0 + p50 / 1000.0)
+
+
+class SourceRegistry:
+    """Потокобезопасный реестр здоровья источников цен"""
+
+    def __init__(
+        self,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        base_cooldown: float = BASE_COOLDOWN,
+        max_cooldown: float = MAX_COOLDOWN,
+    ):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._sources: Dict[str, SourceHealth] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str) -> SourceHealth:
+        health = self._sources.get(name)
+        if health is None:
+            health = self._sources[name] = SourceHealth(name)
+        return health
+
+    def is_available(self, name: str, symbol: Optional[str] = None) -> bool:
+        """Можно ли обращаться к источнику за символом.
+
+        Breaker закрыт, или полуоткрыт и пробный запрос еще не выдан (вызов
+        резервирует его за вызывающим).
+        """
+        with self._lock:
+            return self._get(health_key(name, symbol)).try_acquire(time.time())
+
+    def record_success(self, name: str, latency_ms: float, symbol: Optional[str] = None) -> None:
+        """Успешный ответ закрывает circuit breaker"""
+        with self._lock:
+            health = self._get(health_key(name, symbol))
+            health.successes += 1
+            health.consecutive_failures = 0
+            health.open_count = 0
+            health.open_until = 0.0
+            health.probe_until = 0.0
+            health.latencies.append(latency_ms)
+            health.last_success_at = time.time()
+
+    def record_failure(self, name: str, latency_ms: float, symbol: Optional[str] = None) -> None:
+        """Ошибка; после failure_threshold ошибок подряд breaker открывается.
+
+        Каждое повторное открытие (неудачная пробная попытка в half_open)
+        удваивает паузу вплоть до max_cooldown. Ошибки, пришедшие при уже
+        открытом breaker (запросы, начатые до открытия), учитываются в
+        статистике, но не продлевают паузу.
+        """
+        with self._lock:
+            now = time.time()
+            health = self._get(health_key(name, symbol))
+            state = health.state(now)
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.latencies.append(latency_ms)
+            health.last_error_at = now
+            if state == "half_open" or (
+                state == "closed" and health.consecutive_failures >= self.failure_threshold
+            ):
+                health.open_count += 1
+                cooldown = min(
+                    self.base_cooldown * (2 ** (health.open_count - 1)), self.max_cooldown
+                )
+                health.open_until = now + cooldown
+                health.probe_until = 0.0
+
+    def order_by_health(self, names: List[str], symbol: Optional[str] = None) -> List[str]:
+        """Доступные для символа источники по убыванию оценки здоровья.
+
+        Полуоткрытый источник попадает в список только как единственный
+        пробный запрос (см. is_available).
+        """
+        with self._lock:
+            now = time.time()
+            available = [n for n in names if self._get(health_key(n, symbol)).try_acquire(now)]
+            return sorted(
+                available, key=lambda n: self._get(health_key(n, symbol)).score(now), reverse=True
+            )
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Статистика по всем источникам для мониторинга"""
+        with self._lock:
+            now = time.time()
+            stats = {}
+            for name, health in self._sources.items():
+                latencies = list(health.latencies)
+                p50 = _percentile(latencies, 50)
+                p95 = _percentile(latencies, 95)
+                stats[name] = {
+                    "state": health.state(now),
+                    "score": round(health.score(now), 3),
+                    "success_rate": round(health.success_rate, 3),
+                    "successes": health.successes,
+                    "failures": health.failures,
+                    "consecutive_failures": health.consecutive_failures,
+                    "p50_ms": round(p50, 1) if p50 is not None else None,
+                    "p95_ms": round(p95, 1) if p95 is not None else None,
+                    "cooldown_left": max(0.0, round(health.open_until - now, 1)),
+                }
+            return stats
+
+    def reset(self) -> None:
+        """Сбросить статистику всех источников"""
+        with self._lock:
+            self._sources.clear()
+
+
+# Глобальный реестр источников цен
+source_registry = SourceRegistry()
+
+
+def get_source_health_stats() -> Dict[str, Dict[str, Any]]:
+    """Статистика здоровья источников цен"""
+    return source_registry.get_stats()
@@ -7,19 +7,22 @@ from datetime import datetime
 from decimal import Decimal
 from typing import Dict, List, Optional
 
-import requests
+from .http_client import get_http_client
 
 
 class StockPriceAdapter:
     """Адаптер для получения цен акций с различных источников"""
 
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update(
-            {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            }
-        )
+        # Заголовки передаются в каждом запросе общего клиента
+        self.headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+        }
+
+    @property
+    def client(self):
+        """Общий HTTP-клиент процесса с пулом keep-alive соединений"""
+        return get_http_client()
 
     def get_price_alpha_vantage(self, symbol: str) -> Optional[Dict]:
         """Получает цену акции через Alpha Vantage API"""
@@ -30,7 +33,9 @@ class StockPriceAdapter:
             url = f"https://www.alphavantage.co/query"
             params = {"function": "GLOBAL_QUOTE", "symbol": symbol, "apikey": api_key}
 
-            response = self.session.get(url, params=params, timeout=10)
+            response = self.client.get(
+                url, params=params, headers=self.headers, timeout=10
+            )
             response.raise_for_status()
 
             data = response.json()
@@ -60,7 +65,9 @@ class StockPriceAdapter:
             url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
             params = {"range": "1d", "interval": "1m", "includePrePost": "true"}
 
-            response = self.session.get(url, params=params, timeout=10)
+            response = self.client.get(
+                url, params=params, headers=self.headers, timeout=10
+            )
             response.raise_for_status()
 
             data = response.json()
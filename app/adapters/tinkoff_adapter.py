@@ -4,11 +4,11 @@
 
 import os
 import time
-import requests
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import logging
 
+from app.adapters.http_client import get_http_client
 from app.models.broker_models import Broker, StockInstrument, BrokerIn, StockInstrumentIn
 
 logger = logging.getLogger(__name__)
@@ -20,11 +20,11 @@ class TinkoffAdapter:
     def __init__(self):
         self.api_url = "https://invest-public-api.tinkoff.ru/rest"
         self.token = os.getenv("TINKOFF_TOKEN", "")
-        self.session = requests.Session()
-        self.session.headers.update({
+        # Заголовки передаются в каждом запросе общего клиента
+        self.headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
-        })
+        }
         
         # Кэш для инструментов и цен
         self._instruments_cache = {}
@@ -34,6 +34,11 @@ class TinkoffAdapter:
             "prices": 5 * 60,  # 5 минут
         }
     
+    @property
+    def client(self):
+        """Общий HTTP-клиент процесса с пулом keep-alive соединений"""
+        return get_http_client()
+    
     def _is_cache_valid(self, cache_key: str, ttl_key: str) -> bool:
         """Проверяет валидность кэша"""
         if cache_key not in self._instruments_cache:
@@ -59,7 +64,10 @@ class TinkoffAdapter:
     def authenticate(self) -> bool:
         """Проверяет аутентификацию в API"""
         try:
-            response = self.session.get(f"{self.api_url}/tinkoff.public.invest.api.contract.v1.InstrumentsService/GetCountries")
+            response = self.client.get(
+                f"{self.api_url}/tinkoff.public.invest.api.contract.v1.InstrumentsService/GetCountries",
+                headers=self.headers,
+            )
             return response.status_code == 200
         except Exception as e:
             logger.error(f"Ошибка аутентификации в Тинькофф API: {e}")
@@ -76,9 +84,10 @@ class TinkoffAdapter:
         
         try:
             # Получаем акции
-            response = self.session.post(
+            response = self.client.post(
                 f"{self.api_url}/tinkoff.public.invest.api.contract.v1.InstrumentsService/Shares",
-                json={"instrument_status": "INSTRUMENT_STATUS_BASE"}
+                json={"instrument_status": "INSTRUMENT_STATUS_BASE"},
+                headers=self.headers,
             )
             
             if response.status_code != 200:
@@ -122,9 +131,10 @@ class TinkoffAdapter:
                 return cached_data
         
         try:
-            response = self.session.post(
+            response = self.client.post(
                 f"{self.api_url}/tinkoff.public.invest.api.contract.v1.MarketDataService/GetLastPrices",
-                json={"figi": [ticker]}  # В реальном API нужно использовать FIGI
+                json={"figi": [ticker]},  # В реальном API нужно использовать FIGI
+                headers=self.headers,
             )
             
             if response.status_code != 200:
@@ -1,120 +1,214 @@
 """
 Модуль расширенной аналитики портфеля
 Включает P&L, ROI, статистику по стратегиям
+
+Сделки загружаются из БД один раз в TransactionSnapshot: колонки NumPy в
+хронологическом порядке, типы и стратегии нормализованы, время уже
+разобрано. Все метрики считаются по этому снимку, позиции с рыночными
+ценами запрашиваются один раз. get_comprehensive_analytics возвращает
+длительность каждого этапа в timings_ms.
 """
 
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Tuple
-from collections import defaultdict
-import statistics
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlmodel import Session, select
 
-from app.core.services import list_transactions, get_portfolio_stats, positions_fifo, enrich_positions_with_market
+from app.core.cache import TAG_PRICES, TAG_STRATEGIES, TAG_TRANSACTIONS, cache_manager, cached, strategy_tag
+from app.core.services import positions_fifo, enrich_positions_with_market
 from app.core.models import Transaction
-from app.core.taxonomy import INBOUND_POSITION_TYPES, OUTBOUND_POSITION_TYPES, normalize_transaction_type
-
-
-def calculate_realized_pnl() -> Dict[str, Any]:
-    """Расчет реализованной прибыли/убытка"""
-    transactions = list_transactions()
-    
-    # Группируем транзакции по монетам
-    coin_transactions = defaultdict(list)
-    for tx in transactions:
-        coin_transactions[tx['coin']].append(tx)
-    
+from app.core.cost_basis import match_lots
+from app.core.lot_engine import read_closed_lot_stats
+from app.core.fifo_vectorized import _factorize
+from app.core.taxonomy import INBOUND_POSITION_TYPES, OUTBOUND_POSITION_TYPES, normalize_strategy, normalize_transaction_type
+
+NS_PER_DAY = 86_400 * 10**9
+
+# Сколько секунд хранить метрики закрытых лотов стратегии (сбрасываются записью сделок)
+STRATEGY_CACHE_TTL = 3600
+
+# Периоды ROI: имя -> длительность
+ROI_PERIODS = {
+    '1d': timedelta(days=1),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+    '90d': timedelta(days=90),
+    '1y': timedelta(days=365),
+}
+
+
+@dataclass(frozen=True)
+class TransactionSnapshot:
+    """Сделки колонками в порядке (ts_utc, id)"""
+    ids: np.ndarray
+    ts: pd.DatetimeIndex  # UTC, наносекунды
+    coin_codes: np.ndarray
+    coins: np.ndarray  # уникальные монеты, индекс = код
+    strategy_codes: np.ndarray
+    strategies: np.ndarray  # уникальные стратегии, индекс = код
+    quantity: np.ndarray
+    price: np.ndarray
+    direction: np.ndarray  # +1 поступление, -1 выбытие, 0 прочее
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def amount(self) -> np.ndarray:
+        return self.quantity * self.price
+
+    @property
+    def inbound(self) -> np.ndarray:
+        return self.direction > 0
+
+    @property
+    def outbound(self) -> np.ndarray:
+        return self.direction < 0
+
+
+def load_snapshot(session: Optional[Session] = None, since: Optional[datetime] = None) -> TransactionSnapshot:
+    """Снимок сделок одним запросом (нормализация по уникальным значениям).
+
+    since — только сделки с ts_utc >= since (выборка по индексу ts_utc).
+    """
+    if session is None:
+        from app.storage.db import engine
+
+        with Session(engine) as own_session:
+            return load_snapshot(own_session, since)
+
+    query = select(
+        Transaction.id,
+        Transaction.ts_utc,
+        Transaction.coin,
+        Transaction.strategy,
+        Transaction.type,
+        Transaction.quantity,
+        Transaction.price,
+    )
+    if since is not None:
+        query = query.where(Transaction.ts_utc >= since)
+    rows = session.exec(query.order_by(Transaction.ts_utc.asc(), Transaction.id.asc())).all()
+    ids, ts, coins, strategies, types, quantities, prices = (
+        tuple(list(col) for col in zip(*rows)) if rows else ([],) * 7
+    )
+
+    coin_codes, coin_uniques = pd.factorize(np.asarray(coins, dtype=object))
+    strategy_codes, strategy_uniques = _factorize(strategies, normalize_strategy)
+    type_codes, type_uniques = _factorize(types, normalize_transaction_type)
+    type_direction = np.array(
+        [
+            1 if t in INBOUND_POSITION_TYPES else -1 if t in OUTBOUND_POSITION_TYPES else 0
+            for t in type_uniques
+        ],
+        dtype=np.int8,
+    )
+    return TransactionSnapshot(
+        ids=np.asarray(ids, dtype=np.int64),
+        ts=pd.DatetimeIndex(pd.to_datetime(ts, utc=True)).as_unit('ns'),
+        coin_codes=np.asarray(coin_codes, dtype=np.int64),
+        coins=np.asarray(coin_uniques, dtype=object),
+        strategy_codes=np.asarray(strategy_codes, dtype=np.int64),
+        strategies=strategy_uniques,
+        quantity=np.asarray(quantities, dtype=np.float64),
+        price=np.asarray(prices, dtype=np.float64),
+        direction=type_direction[type_codes] if len(type_codes) else np.zeros(0, dtype=np.int8),
+    )
+
+
+def load_market_positions() -> Tuple[List[dict], dict]:
+    """Позиции FIFO с рыночными ценами и итоги (один запрос цен)"""
+    return enrich_positions_with_market(positions_fifo())
+
+
+@contextmanager
+def _stage(timings: Dict[str, float], name: str):
+    """Записать длительность этапа в timings (мс)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+
+
+def _realized_pnl(snapshot: TransactionSnapshot, method: str = "fifo") -> Dict[str, Any]:
+    """Реализованный P&L по снимку"""
+    n_coins = len(snapshot.coins)
+    amount = snapshot.amount
+    inbound, outbound = snapshot.inbound, snapshot.outbound
+    # Объемы покупок/продаж и число транзакций по монетам
+    total_bought = np.bincount(snapshot.coin_codes, weights=amount * inbound, minlength=n_coins)
+    total_sold = np.bincount(snapshot.coin_codes, weights=amount * outbound, minlength=n_coins)
+    tx_count = np.bincount(snapshot.coin_codes, minlength=n_coins)
+
+    moves = snapshot.direction != 0
+    fills = zip(
+        snapshot.coin_codes[moves].tolist(),
+        snapshot.direction[moves].tolist(),
+        snapshot.quantity[moves].tolist(),
+        snapshot.price[moves].tolist(),
+    )
+    books = match_lots(fills, (method,))[method.lower()]
+
     realized_pnl = {}
     total_realized_pnl = 0.0
-    
-    for coin, txs in coin_transactions.items():
-        
-        # Сортируем по дате
-        txs.sort(key=lambda x: x['created_at'])
-        
-        # Применяем FIFO для расчета реализованного P&L
-        buy_queue = []
-        realized_pnl_coin = 0.0
-        total_bought = 0.0
-        total_sold = 0.0
-        
-        for tx in txs:
-        tx_type = normalize_transaction_type(tx['type'])
-        if tx_type in INBOUND_POSITION_TYPES:
-                qty = tx.get('quantity', 0)
-                buy_queue.append({
-                    'qty': qty,
-                    'price': tx['price'],
-                    'date': tx['created_at']
-                })
-                total_bought += qty * tx['price']
-        elif tx_type in OUTBOUND_POSITION_TYPES:
-                qty = tx.get('quantity', 0)
-                remaining_sell = qty
-                sell_price = tx['price']
-                
-                while remaining_sell > 0 and buy_queue:
-                    buy_order = buy_queue[0]
-                    
-                    if buy_order['qty'] <= remaining_sell:
-                        # Полностью закрываем покупку
-                        pnl = (sell_price - buy_order['price']) * buy_order['qty']
-                        realized_pnl_coin += pnl
-                        remaining_sell -= buy_order['qty']
-                        buy_queue.pop(0)
-                    else:
-                        # Частично закрываем покупку
-                        pnl = (sell_price - buy_order['price']) * remaining_sell
-                        realized_pnl_coin += pnl
-                        buy_order['qty'] -= remaining_sell
-                        remaining_sell = 0
-                
-                total_sold += qty * tx['price']
-        
-        if total_bought > 0 or total_sold > 0:
-            realized_pnl[coin] = {
-                'realized_pnl': realized_pnl_coin,
-                'total_bought': total_bought,
-                'total_sold': total_sold,
-                'realized_pnl_percent': (realized_pnl_coin / total_bought * 100) if total_bought > 0 else 0,
-                'transactions_count': len(txs)
+
+    for code, book in books.items():
+        bought = float(total_bought[code])
+        sold = float(total_sold[code])
+        if bought > 0 or sold > 0:
+            realized_pnl[snapshot.coins[code]] = {
+                'realized_pnl': book.realized,
+                'total_bought': bought,
+                'total_sold': sold,
+                'realized_pnl_percent': (book.realized / bought * 100) if bought > 0 else 0,
+                'transactions_count': int(tx_count[code])
             }
-            total_realized_pnl += realized_pnl_coin
-    
+            total_realized_pnl += book.realized
+
     return {
         'total_realized_pnl': total_realized_pnl,
         'by_coin': realized_pnl,
-        'coins_count': len(realized_pnl)
+        'coins_count': len(realized_pnl),
+        'method': method.lower()
     }
 
 
-def calculate_unrealized_pnl() -> Dict[str, Any]:
-    """Расчет нереализованной прибыли/убытка"""
-    positions = positions_fifo()
-    enriched_positions, totals = enrich_positions_with_market(positions)
-    
-    unrealized_pnl = {}
-    total_unrealized_pnl = 0.0
-    
+def _unrealized_pnl(enriched_positions: List[dict]) -> Dict[str, Any]:
+    """Нереализованный P&L по позициям с рыночными ценами (сумма по стратегиям монеты)"""
+    by_coin: Dict[str, Dict[str, float]] = {}
     for position in enriched_positions:
-        coin = position['coin']
         current_price = position.get('price', 0)
-        avg_cost = position.get('avg_cost', 0)
         qty = position.get('quantity', 0)
-        
-        if current_price > 0 and avg_cost > 0 and qty > 0:
-            unrealized_pnl_amount = (current_price - avg_cost) * qty
-            unrealized_pnl_percent = ((current_price - avg_cost) / avg_cost) * 100
-            
-            unrealized_pnl[coin] = {
-                'unrealized_pnl': unrealized_pnl_amount,
-                'current_price': current_price,
-                'avg_cost': avg_cost,
-                'qty': qty,
-                'current_value': current_price * qty,
-                'cost_basis': avg_cost * qty,
-                'unrealized_pnl_percent': unrealized_pnl_percent
-            }
-            total_unrealized_pnl += unrealized_pnl_amount
-    
+        if current_price > 0 and position.get('avg_cost', 0) > 0 and qty > 0:
+            item = by_coin.setdefault(position['coin'], {'qty': 0.0, 'cost_basis': 0.0, 'current_price': current_price})
+            item['qty'] += qty
+            item['cost_basis'] += position['avg_cost'] * qty
+
+    unrealized_pnl = {}
+    total_unrealized_pnl = 0.0
+
+    for coin, item in by_coin.items():
+        qty = item['qty']
+        current_price = item['current_price']
+        avg_cost = item['cost_basis'] / qty
+        unrealized_pnl_amount = (current_price - avg_cost) * qty
+        unrealized_pnl[coin] = {
+            'unrealized_pnl': unrealized_pnl_amount,
+            'current_price': current_price,
+            'avg_cost': avg_cost,
+            'qty': qty,
+            'current_value': current_price * qty,
+            'cost_basis': item['cost_basis'],
+            'unrealized_pnl_percent': ((current_price - avg_cost) / avg_cost) * 100
+        }
+        total_unrealized_pnl += unrealized_pnl_amount
+
     return {
         'total_unrealized_pnl': total_unrealized_pnl,
         'by_coin': unrealized_pnl,
@@ -122,239 +216,245 @@ def calculate_unrealized_pnl() -> Dict[str, Any]:
     }
 
 
-def calculate_roi_metrics() -> Dict[str, Any]:
-    """Расчет метрик ROI"""
-    transactions = list_transactions()
-    portfolio_stats = get_portfolio_stats()
-    
-    # Общие инвестиции
-    total_invested = 0.0
-    total_withdrawn = 0.0
-    
-    for tx in transactions:
-        qty = tx.get('quantity', tx.get('qty', 0))
-        if tx['type'] in ['buy', 'deposit', 'exchange_in']:
-            total_invested += qty * tx['price']
-        elif tx['type'] in ['sell', 'withdrawal', 'exchange_out']:
-            total_withdrawn += qty * tx['price']
-    
-    # Текущая стоимость портфеля
-    current_value = portfolio_stats.get('totals', {}).get('total_value', 0)
-    
-    # ROI расчеты
-    net_invested = total_invested - total_withdrawn
-    total_return = current_value - net_invested
-    
-    roi_percent = (total_return / net_invested * 100) if net_invested > 0 else 0
-    roi_absolute = total_return
-    
-    # ROI по периодам
-    roi_by_period = calculate_roi_by_periods()
-    
-    return {
-        'total_invested': total_invested,
-        'total_withdrawn': total_withdrawn,
-        'net_invested': net_invested,
-        'current_value': current_value,
-        'total_return': total_return,
-        'roi_percent': roi_percent,
-        'roi_absolute': roi_absolute,
-        'by_periods': roi_by_period
-    }
+def _roi_by_periods(snapshot: TransactionSnapshot, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """ROI по временным периодам"""
+    if not len(snapshot):
+        return {}
 
+    now = now or datetime.now(timezone.utc)
+    amount = snapshot.amount
+    inbound, outbound = snapshot.inbound, snapshot.outbound
+    # Снимок отсортирован по времени: начало периода — граница бинарного поиска
+    ts = snapshot.ts.asi8
 
-def calculate_roi_by_periods() -> Dict[str, Any]:
-    """Расчет ROI по временным периодам"""
-    transactions = list_transactions()
-    
-    if not transactions:
-        return {}
-    
-    # Определяем периоды
-    now = datetime.now()
-    periods = {
-        '1d': now - timedelta(days=1),
-        '7d': now - timedelta(days=7),
-        '30d': now - timedelta(days=30),
-        '90d': now - timedelta(days=90),
-        '1y': now - timedelta(days=365)
-    }
-    
     roi_by_period = {}
-    
-    for period_name, start_date in periods.items():
-        # Фильтруем транзакции по периоду
-        period_txs = [
-            tx for tx in transactions 
-            if datetime.fromisoformat(tx['created_at'].replace('Z', '+00:00')) >= start_date
-        ]
-        
-        if not period_txs:
+
+    for period_name, length in ROI_PERIODS.items():
+        start = int(np.searchsorted(ts, pd.Timestamp(now - length).value, side="left"))
+        if start == len(ts):
             continue
-        
+
         # Рассчитываем инвестиции за период
-        period_invested = 0.0
-        period_withdrawn = 0.0
-        
-        for tx in period_txs:
-            qty = tx.get('quantity', tx.get('qty', 0))
-        tx_type = normalize_transaction_type(tx['type'])
-        if tx_type in INBOUND_POSITION_TYPES:
-                period_invested += qty * tx['price']
-        elif tx_type in OUTBOUND_POSITION_TYPES:
-                period_withdrawn += qty * tx['price']
-        
+        period_invested = float(amount[start:][inbound[start:]].sum())
+        period_withdrawn = float(amount[start:][outbound[start:]].sum())
         period_net = period_invested - period_withdrawn
-        
+
         # Упрощенный расчет ROI за период (только по сделкам)
         if period_net > 0:
             period_roi = ((period_withdrawn - period_invested) / period_invested) * 100
         else:
             period_roi = 0
-        
+
         roi_by_period[period_name] = {
             'invested': period_invested,
             'withdrawn': period_withdrawn,
             'net': period_net,
             'roi_percent': period_roi,
-            'transactions_count': len(period_txs)
+            'transactions_count': len(ts) - start
         }
-    
+
     return roi_by_period
 
 
-def calculate_strategy_performance() -> Dict[str, Any]:
-    """Расчет эффективности стратегий"""
-    transactions = list_transactions()
-    
-    # Группируем по стратегиям
-    strategy_stats = defaultdict(lambda: {
-        'transactions': [],
-        'total_invested': 0.0,
-        'total_returned': 0.0,
-        'avg_hold_time': 0.0,
-        'win_rate': 0.0
-    })
-    
-    for tx in transactions:
-        strategy = tx.get('strategy', 'unknown')
-        strategy_stats[strategy]['transactions'].append(tx)
-        
-        qty = tx.get('quantity', tx.get('qty', 0))
-        if tx['type'] in ['buy', 'deposit', 'exchange_in']:
-            strategy_stats[strategy]['total_invested'] += qty * tx['price']
-        elif tx['type'] in ['sell', 'withdrawal', 'exchange_out']:
-            strategy_stats[strategy]['total_returned'] += qty * tx['price']
-    
-    # Рассчитываем метрики для каждой стратегии
+def _roi_metrics(snapshot: TransactionSnapshot, current_value: float, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Метрики ROI по снимку и текущей стоимости портфеля"""
+    amount = snapshot.amount
+    total_invested = float(amount[snapshot.inbound].sum())
+    total_withdrawn = float(amount[snapshot.outbound].sum())
+
+    # ROI расчеты
+    net_invested = total_invested - total_withdrawn
+    total_return = current_value - net_invested
+
+    roi_percent = (total_return / net_invested * 100) if net_invested > 0 else 0
+
+    return {
+        'total_invested': total_invested,
+        'total_withdrawn': total_withdrawn,
+        'net_invested': net_invested,
+        'current_value': current_value,
+        'total_return': total_return,
+        'roi_percent': roi_percent,
+        'roi_absolute': total_return,
+        'by_periods': _roi_by_periods(snapshot, now)
+    }
+
+
+def _time_weighted(roi: Dict[str, Any], portfolio_returns: Dict[str, Any]) -> Dict[str, Any]:
+    """Добавить TWR/XIRR портфеля (см. returns) к метрикам ROI и периодам"""
+    overall = portfolio_returns.get('all', {}).get('portfolio', {})
+    roi['twr_percent'] = overall.get('twr_percent')
+    roi['xirr_percent'] = overall.get('xirr_percent')
+    for period, item in roi['by_periods'].items():
+        period_returns = portfolio_returns.get(period, {}).get('portfolio', {})
+        item['twr_percent'] = period_returns.get('twr_percent')
+        item['xirr_percent'] = period_returns.get('xirr_percent')
+    return roi
+
+
+def strategy_lot_metrics(strategies: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Метрики закрытых лотов по стратегиям (журнал FIFO-списаний).
+
+    Результат каждой стратегии кэшируется до следующей записи ее сделок:
+    пересчитываются только стратегии, чей тег изменился.
+    """
+    result: Dict[str, Dict[str, Any]] = {}
+    missing = []
+    for strategy in strategies:
+        cached_metrics = cache_manager.get(f"strategy_lots:{strategy}")
+        if cached_metrics is None:
+            missing.append(strategy)
+        else:
+            result[strategy] = cached_metrics
+    if not missing:
+        return result
+
+    from app.storage.db import engine
+
+    generations = cache_manager.generations(
+        (TAG_STRATEGIES, *(strategy_tag(strategy) for strategy in missing))
+    )
+    with Session(engine) as session:
+        stats = read_closed_lot_stats(session, missing)
+    for strategy in missing:
+        item = stats.get(strategy, {})
+        closed = item.get('closed_lots', 0)
+        wins, losses = item.get('wins', 0), item.get('losses', 0)
+        gross_profit, gross_loss = item.get('gross_profit') or 0.0, item.get('gross_loss') or 0.0
+        metrics = {
+            'closed_lots': closed,
+            'realized_pnl': gross_profit + gross_loss,
+            'avg_hold_time_days': item.get('avg_hold_days') or 0,
+            'max_hold_time_days': item.get('max_hold_days') or 0,
+            'win_rate_percent': (wins / closed * 100) if closed else 0,
+            'avg_win': (gross_profit / wins) if wins else 0,
+            'avg_loss': (gross_loss / losses) if losses else 0,
+            # Без убыточных лотов profit factor не определен
+            'profit_factor': (gross_profit / -gross_loss) if gross_loss < 0 else None,
+        }
+        cache_manager.set(
+            f"strategy_lots:{strategy}", metrics, ttl=STRATEGY_CACHE_TTL,
+            tags=(TAG_STRATEGIES, strategy_tag(strategy)), tag_generations=generations,
+        )
+        result[strategy] = metrics
+    return result
+
+
+def _strategy_performance(snapshot: TransactionSnapshot) -> Dict[str, Any]:
+    """Эффективность стратегий: объемы по снимку, сделки — по закрытым лотам"""
+    n_strategies = len(snapshot.strategies)
+    amount = snapshot.amount
+    codes = snapshot.strategy_codes
+    tx_count = np.bincount(codes, minlength=n_strategies)
+    total_invested = np.bincount(codes, weights=amount * snapshot.inbound, minlength=n_strategies)
+    total_returned = np.bincount(codes, weights=amount * snapshot.outbound, minlength=n_strategies)
+    coins_traded = (
+        pd.DataFrame({'strategy': codes, 'coin': snapshot.coin_codes})
+        .drop_duplicates()['strategy']
+        .value_counts()
+    )
+    lot_metrics = strategy_lot_metrics(snapshot.strategies)
+
     strategy_performance = {}
-    
-    for strategy, stats in strategy_stats.items():
-        txs = stats['transactions']
-        if not txs:
-            continue
-        
-        # ROI стратегии
-        net_invested = stats['total_invested'] - stats['total_returned']
-        roi_percent = (stats['total_returned'] / stats['total_invested'] * 100) if stats['total_invested'] > 0 else 0
-        
-        # Время удержания позиций
-        hold_times = []
-        for i, tx in enumerate(txs):
-            if tx['type'] in ['buy', 'deposit', 'exchange_in']:
-                # Ищем соответствующую продажу
-                for j in range(i + 1, len(txs)):
-                    if (txs[j]['type'] in ['sell', 'withdrawal', 'exchange_out'] and 
-                        txs[j]['coin'] == tx['coin']):
-                        buy_date = datetime.fromisoformat(tx['created_at'].replace('Z', '+00:00'))
-                        sell_date = datetime.fromisoformat(txs[j]['created_at'].replace('Z', '+00:00'))
-                        hold_time = (sell_date - buy_date).days
-                        hold_times.append(hold_time)
-                        break
-        
-        avg_hold_time = statistics.mean(hold_times) if hold_times else 0
-        
-        # Win rate (упрощенный расчет)
-        profitable_trades = sum(1 for time in hold_times if time > 0)  # Упрощение
-        win_rate = (profitable_trades / len(hold_times) * 100) if hold_times else 0
-        
+
+    for code, strategy in enumerate(snapshot.strategies):
+        invested = float(total_invested[code])
+        returned = float(total_returned[code])
         strategy_performance[strategy] = {
-            'transactions_count': len(txs),
-            'total_invested': stats['total_invested'],
-            'total_returned': stats['total_returned'],
-            'net_invested': net_invested,
-            'roi_percent': roi_percent,
-            'avg_hold_time_days': avg_hold_time,
-            'win_rate_percent': win_rate,
-            'coins_traded': len(set(tx['coin'] for tx in txs))
+            'transactions_count': int(tx_count[code]),
+            'total_invested': invested,
+            'total_returned': returned,
+            'net_invested': invested - returned,
+            'roi_percent': (returned / invested * 100) if invested > 0 else 0,
+            'coins_traded': int(coins_traded.get(code, 0)),
+            **lot_metrics[strategy],
         }
-    
+
     return strategy_performance
 
 
+def _risk_metrics(snapshot: TransactionSnapshot) -> Dict[str, Any]:
+    """Метрики риска по дневной кривой капитала (см. equity_curve)"""
+    from app.core.equity_curve import get_equity_curve, risk_metrics
+
+    if not len(snapshot):
+        return {}
+    return risk_metrics(get_equity_curve(snapshot=snapshot))
+
+
+def calculate_realized_pnl(method: str = "fifo") -> Dict[str, Any]:
+    """Расчет реализованной прибыли/убытка выбранным методом учета (fifo/lifo/hifo/average)"""
+    return _realized_pnl(load_snapshot(), method)
+
+
+def calculate_unrealized_pnl() -> Dict[str, Any]:
+    """Расчет нереализованной прибыли/убытка"""
+    enriched_positions, _ = load_market_positions()
+    return _unrealized_pnl(enriched_positions)
+
+
+def calculate_roi_metrics() -> Dict[str, Any]:
+    """Расчет метрик ROI"""
+    from app.core.returns import calculate_returns
+
+    _, totals = load_market_positions()
+    snapshot = load_snapshot()
+    roi = _roi_metrics(snapshot, totals.get('total_value', 0))
+    return _time_weighted(roi, calculate_returns('portfolio', snapshot=snapshot))
+
+
+def calculate_roi_by_periods() -> Dict[str, Any]:
+    """Расчет ROI по временным периодам"""
+    return _roi_by_periods(load_snapshot())
+
+
+def calculate_strategy_performance() -> Dict[str, Any]:
+    """Расчет эффективности стратегий"""
+    return _strategy_performance(load_snapshot())
+
+
 def calculate_risk_metrics() -> Dict[str, Any]:
     """Расчет метрик риска"""
-    transactions = list_transactions()
-    portfolio_stats = get_portfolio_stats()
-    
-    if not transactions:
-        return {}
-    
-    # Волатильность портфеля (упрощенный расчет)
-    daily_returns = []
-    transaction_dates = []
-    
-    for tx in transactions:
-        date = datetime.fromisoformat(tx['created_at'].replace('Z', '+00:00')).date()
-        transaction_dates.append(date)
-    
-    # Группируем по дням
-    daily_pnl = defaultdict(float)
-    for tx in transactions:
-        date = datetime.fromisoformat(tx['created_at'].replace('Z', '+00:00')).date()
-        qty = tx.get('quantity', tx.get('qty', 0))
-        if tx['type'] in ['sell', 'withdrawal', 'exchange_out']:
-            daily_pnl[date] += qty * tx['price']
-        elif tx['type'] in ['buy', 'deposit', 'exchange_in']:
-            daily_pnl[date] -= qty * tx['price']
-    
-    # Рассчитываем волатильность
-    if len(daily_pnl) > 1:
-        pnl_values = list(daily_pnl.values())
-        volatility = statistics.stdev(pnl_values) if len(pnl_values) > 1 else 0
-    else:
-        volatility = 0
-    
-    # Максимальная просадка (упрощенный расчет)
-    cumulative_pnl = 0
-    max_drawdown = 0
-    peak = 0
-    
-    for date in sorted(daily_pnl.keys()):
-        cumulative_pnl += daily_pnl[date]
-        if cumulative_pnl > peak:
-            peak = cumulative_pnl
-        drawdown = peak - cumulative_pnl
-        if drawdown > max_drawdown:
-            max_drawdown = drawdown
-    
-    return {
-        'volatility': volatility,
-        'max_drawdown': max_drawdown,
-        'max_drawdown_percent': (max_drawdown / peak * 100) if peak > 0 else 0,
-        'trading_days': len(daily_pnl),
-        'avg_daily_pnl': statistics.mean(list(daily_pnl.values())) if daily_pnl else 0
-    }
+    return _risk_metrics(load_snapshot())
 
 
+@cached(ttl=60, stale_ttl=240, tags=(TAG_TRANSACTIONS, TAG_PRICES))
 def get_comprehensive_analytics() -> Dict[str, Any]:
-    """Полная аналитика портфеля"""
+    """Полная аналитика портфеля за один проход по снимку сделок"""
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    with _stage(timings, 'load'):
+        snapshot = load_snapshot()
+    with _stage(timings, 'market'):
+        enriched_positions, totals = load_market_positions()
+    with _stage(timings, 'realized_pnl'):
+        realized = _realized_pnl(snapshot)
+    with _stage(timings, 'unrealized_pnl'):
+        unrealized = _unrealized_pnl(enriched_positions)
+    with _stage(timings, 'roi_metrics'):
+        roi = _roi_metrics(snapshot, totals.get('total_value', 0))
+    with _stage(timings, 'returns'):
+        from app.core.equity_curve import CURVE_GROUPINGS
+        from app.core.returns import calculate_returns
+
+        returns = {by: calculate_returns(by, snapshot=snapshot) for by in CURVE_GROUPINGS}
+        _time_weighted(roi, returns['portfolio'])
+    with _stage(timings, 'strategy_performance'):
+        strategies = _strategy_performance(snapshot)
+    with _stage(timings, 'risk_metrics'):
+        risk = _risk_metrics(snapshot)
+    timings['total'] = round((time.perf_counter() - started) * 1000, 2)
+
     return {
-        'realized_pnl': calculate_realized_pnl(),
-        'unrealized_pnl': calculate_unrealized_pnl(),
-        'roi_metrics': calculate_roi_metrics(),
-        'strategy_performance': calculate_strategy_performance(),
-        'risk_metrics': calculate_risk_metrics(),
+        'realized_pnl': realized,
+        'unrealized_pnl': unrealized,
+        'roi_metrics': roi,
+        'returns': returns,
+        'strategy_performance': strategies,
+        'risk_metrics': risk,
+        'transactions_count': len(snapshot),
+        'timings_ms': timings,
         'generated_at': datetime.now().isoformat()
     }
 
@@ -362,10 +462,11 @@ def get_comprehensive_analytics() -> Dict[str, Any]:
 def get_analytics_summary() -> Dict[str, Any]:
     """Краткая сводка аналитики"""
     analytics = get_comprehensive_analytics()
-    
+    volatility = analytics['risk_metrics'].get('volatility', 0)
+
     return {
         'total_pnl': (
-            analytics['realized_pnl']['total_realized_pnl'] + 
+            analytics['realized_pnl']['total_realized_pnl'] +
             analytics['unrealized_pnl']['total_unrealized_pnl']
         ),
         'roi_percent': analytics['roi_metrics']['roi_percent'],
@@ -373,9 +474,7 @@ def get_analytics_summary() -> Dict[str, Any]:
             analytics['strategy_performance'].items(),
             key=lambda x: x[1]['roi_percent']
         )[0] if analytics['strategy_performance'] else 'N/A',
-        'risk_level': 'High' if analytics['risk_metrics']['volatility'] > 1000 else 'Medium' if analytics['risk_metrics']['volatility'] > 500 else 'Low',
-        'total_transactions': sum(
-            strategy['transactions_count'] 
-            for strategy in analytics['strategy_performance'].values()
-        )
+        # Годовая волатильность кривой капитала, %
+        'risk_level': 'High' if volatility > 80 else 'Medium' if volatility > 40 else 'Low',
+        'total_transactions': analytics['transactions_count']
     }
@@ -0,0 +1,172 @@
+"""
+Асинхронный сервисный слой поверх aiosqlite
+
+Функции повторяют синхронные сервисы из app.core.services, но не блокируют
+event loop NiceGUI: запросы к БД идут через асинхронный движок, а логика
+записи (лоты, контрольные точки) переиспользуется через AsyncSession.run_sync.
+Сетевые вызовы цен выполняются в пуле потоков.
+"""
+import asyncio
+from typing import Any
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.cache import (
+    TRANSACTIONS_CACHE_TAGS,
+    cache_manager,
+    cache_transactions,
+    get_cached_transactions,
+    invalidate_data_cache,
+)
+from app.core.lot_engine import read_positions
+from app.core.models import PriceAlert, PriceAlertIn, Transaction, TransactionIn
+from app.core.positions_history import positions_as_of_session
+from app.core.services import (
+    add_transaction_in_session,
+    delete_transaction_in_session,
+    get_portfolio_stats,
+    transaction_rows,
+    transactions_list_query,
+    trigger_price_alert,
+    update_transaction_in_session,
+)
+from app.storage.db import get_async_engine, retry_on_busy
+
+
+def _session() -> AsyncSession:
+    return AsyncSession(get_async_engine())
+
+
+async def list_transactions_async() -> list[dict]:
+    """Асинхронный list_transactions"""
+    cached_result = get_cached_transactions()
+    if cached_result is not None:
+        return cached_result
+
+    generations = cache_manager.generations(TRANSACTIONS_CACHE_TAGS)
+    async with _session() as session:
+        items = (await session.exec(transactions_list_query())).all()
+    rows = transaction_rows(items)
+    cache_transactions(rows, tag_generations=generations)
+    return rows
+
+
+@retry_on_busy
+async def add_transaction_async(data: TransactionIn) -> int:
+    """Асинхронный add_transaction"""
+    async with _session() as session:
+        t = await session.run_sync(add_transaction_in_session, data)
+        tx_id, strategy = t.id, t.strategy
+        await session.commit()
+    invalidate_data_cache({strategy})
+    return tx_id
+
+
+@retry_on_busy
+async def update_transaction_async(tx_id: int, data: TransactionIn) -> None:
+    """Асинхронный update_transaction"""
+    async with _session() as session:
+        strategies = await session.run_sync(update_transaction_in_session, tx_id, data)
+        if strategies:
+            await session.commit()
+    invalidate_data_cache(strategies)
+
+
+@retry_on_busy
+async def delete_transaction_async(tx_id: int) -> None:
+    """Асинхронный delete_transaction"""
+    async with _session() as session:
+        strategies = await session.run_sync(delete_transaction_in_session, tx_id)
+        if strategies:
+            await session.commit()
+    invalidate_data_cache(strategies)
+
+
+async def positions_fifo_async() -> list[dict]:
+    """Асинхронный positions_fifo (чтение сохраненного состояния лотов)"""
+    async with _session() as session:
+        return await session.run_sync(read_positions)
+
+
+async def positions_as_of_async(ts: Any) -> list[dict]:
+    """Асинхронный positions_as_of"""
+    async with _session() as session:
+        positions = await session.run_sync(positions_as_of_session, ts)
+        try:
+            # Сохраняем новые контрольные точки; ошибка записи не мешает ответу
+            await session.commit()
+        except Exception as e:
+            print(f"Ошибка сохранения контрольных точек: {e}")
+        return positions
+
+
+async def get_portfolio_stats_async() -> dict:
+    """Асинхронный get_portfolio_stats: расчет и его кэш общие с синхронной версией"""
+    return await asyncio.to_thread(get_portfolio_stats)
+
+
+async def get_price_alerts_async(active_only: bool = True) -> list[PriceAlert]:
+    """Асинхронный get_price_alerts"""
+    try:
+        async with _session() as session:
+            query = select(PriceAlert)
+            if active_only:
+                query = query.where(PriceAlert.is_active == True)
+            query = query.order_by(PriceAlert.created_at.desc())
+            return list((await session.exec(query)).all())
+    except Exception as e:
+        print(f"Ошибка получения алертов: {e}")
+        return []
+
+
+@retry_on_busy
+async def add_price_alert_async(data: PriceAlertIn) -> int:
+    """Асинхронный add_price_alert"""
+    async with _session() as session:
+        alert = PriceAlert(**data.model_dump())
+        session.add(alert)
+        await session.flush()
+        alert_id = alert.id
+        await session.commit()
+        return alert_id
+
+
+@retry_on_busy
+async def delete_price_alert_async(alert_id: int) -> bool:
+    """Асинхронный delete_price_alert"""
+    async with _session() as session:
+        alert = await session.get(PriceAlert, alert_id)
+        if not alert:
+            return False
+        await session.delete(alert)
+        await session.commit()
+        return True
+
+
+async def check_price_alerts_async() -> list[dict]:
+    """Асинхронный check_price_alerts: цены всех монет запрашиваются одним вызовом"""
+    from app.adapters.prices import get_current_prices
+
+    try:
+        async with _session() as session:
+            active_alerts = (
+                await session.exec(select(PriceAlert).where(PriceAlert.is_active == True))
+            ).all()
+            if not active_alerts:
+                return []
+
+            coins = list(dict.fromkeys(alert.coin.upper() for alert in active_alerts))
+            prices = await asyncio.to_thread(get_current_prices, coins)
+
+            triggered_alerts = []
+            for alert in active_alerts:
+                result = trigger_price_alert(alert, prices.get(alert.coin.upper()))
+                if result:
+                    session.add(alert)
+                    triggered_alerts.append(result)
+            await session.commit()
+            return triggered_alerts
+    except Exception as e:
+        print(f"Ошибка проверки алертов: {e}")
+        return []
@@ -1,106 +1,367 @@
 """
 Система кэширования для оптимизации производительности
 """
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import threading
 import time
-from typing import Any, Dict, Optional, Callable
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional, Callable
 from functools import wraps
 
+from app.adapters.single_flight import SingleFlight
+
+# Границы кэша: число записей и оценка занимаемой памяти
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Сколько элементов длинного списка обходить при оценке размера
+CACHE_SIZE_SAMPLE = 64
+# Потоки фонового пересчета устаревших значений @cached
+CACHE_REFRESH_WORKERS = 2
+
+
+# Теги зависимостей записей кэша
+TAG_TRANSACTIONS = "transactions"
+TAG_SOURCES = "sources"
+TAG_ALERTS = "alerts"
+TAG_PRICES = "prices"
+TAG_STRATEGIES = "strategies"
+
+
+def price_tag(coin: str) -> str:
+    """Тег цены конкретной монеты (например, prices:BTC)"""
+    return f"{TAG_PRICES}:{coin.upper()}"
+
+
+def strategy_tag(strategy: str) -> str:
+    """Тег сделок одной стратегии (например, strategies:long_term)"""
+    return f"{TAG_STRATEGIES}:{strategy}"
+
+
+def estimate_size(value: Any, sample: int = CACHE_SIZE_SAMPLE) -> int:
+    """Оценка занимаемой памяти в байтах (sys.getsizeof с обходом контейнеров).
+
+    Для длинных списков и словарей обходятся первые sample элементов, а
+    результат масштабируется на всю длину: оценка выполняется один раз при
+    записи и не должна стоить как полный обход больших выборок.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        count = len(value)
+        # Строковые ключи (имена полей) общие для всех строк — не учитываем
+        measured = sum(
+            estimate_size(v, sample) + (0 if isinstance(k, str) else estimate_size(k, sample))
+            for k, v in itertools.islice(value.items(), sample)
+        )
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        count = len(value)
+        measured = sum(estimate_size(item, sample) for item in itertools.islice(value, sample))
+    elif hasattr(value, "__dict__"):
+        # Объекты моделей: учитываем их атрибуты
+        return size + estimate_size(vars(value), sample)
+    else:
+        return size
+    if count > sample:
+        measured = measured * count // sample
+    return size + measured
+
 
 class CacheManager:
-    """Менеджер кэша с TTL (Time To Live)"""
+    """Менеджер кэша с TTL (Time To Live), LRU-вытеснением и инвалидацией по тегам.
+
+    Запись помнит поколения своих тегов на начало вычисления значения
+    (generations() перед вычислением, затем set(..., tag_generations=...)):
+    инвалидация во время вычисления делает результат устаревшим сразу.
+    Инвалидация тега только увеличивает его поколение (O(1)), а устаревшие
+    записи удаляются лениво — при следующем чтении или при очистке.
+
+    Размер записи оценивается один раз при записи; при превышении лимита
+    записей или байт вытесняются давно не читанные записи. Счетчики
+    попаданий, промахов, вытеснений и байт ведутся инкрементально.
+    """
     
-    def __init__(self):
-        self._cache: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
         self._default_ttl = 300  # 5 минут по умолчанию
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.RLock()
+    
+    def _is_stale(self, entry: Dict[str, Any]) -> bool:
+        """Изменился ли какой-либо тег записи после ее создания"""
+        return any(self._generations.get(tag, 0) != generation for tag, generation in entry['tags'])
+    
+    def _remove(self, key: str) -> None:
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry['size']
     
     def get(self, key: str) -> Optional[Any]:
         """Получить значение из кэша"""
-        if key not in self._cache:
-            return None
-        
-        cache_entry = self._cache[key]
-        if time.time() > cache_entry['expires_at']:
-            # Кэш истек
-            del self._cache[key]
-            return None
-        
-        return cache_entry['value']
+        with self._lock:
+            cache_entry = self._cache.get(key)
+            if cache_entry is None:
+                self._misses += 1
+                return None
+            
+            if time.time() > cache_entry['expires_at'] or self._is_stale(cache_entry):
+                # Кэш истек или устарел по тегу
+                self._remove(key)
+                self._misses += 1
+                return None
+            
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return cache_entry['value']
+    
+    def generations(self, tags: Iterable[str]) -> Dict[str, int]:
+        """Текущие поколения тегов: снять до вычисления значения для set()"""
+        with self._lock:
+            return {tag: self._generations.get(tag, 0) for tag in tags}
     
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
-        """Установить значение в кэш"""
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: Optional[int] = None,
+        tags: Iterable[str] = (),
+        tag_generations: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """Установить значение в кэш (tags — от каких данных зависит значение).
+
+        tag_generations — поколения тегов на начало вычисления value; без них
+        берутся текущие, и инвалидация во время вычисления будет потеряна.
+        """
+        tag_generations = tag_generations or {}
         if ttl is None:
             ttl = self._default_ttl
+        size = estimate_size(value)
         
-        self._cache[key] = {
-            'value': value,
-            'expires_at': time.time() + ttl,
-            'created_at': time.time()
-        }
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                # Значение больше всего кэша — не кэшируем
+                return
+            now = time.time()
+            self._cache[key] = {
+                'value': value,
+                'expires_at': now + ttl,
+                'created_at': now,
+                'tags': tuple(
+                    (tag, tag_generations.get(tag, self._generations.get(tag, 0))) for tag in tags
+                ),
+                'size': size,
+            }
+            self._bytes += size
+            
+            # Вытесняем давно не читанные записи
+            while len(self._cache) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._cache))
+                self._remove(oldest_key)
+                self._evictions += 1
     
     def invalidate(self, key: str) -> None:
         """Удалить значение из кэша"""
-        if key in self._cache:
-            del self._cache[key]
+        with self._lock:
+            self._remove(key)
+    
+    def invalidate_tags(self, *tags: str) -> None:
+        """Сделать устаревшими все записи с любым из тегов"""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
     
     def invalidate_pattern(self, pattern: str) -> None:
-        """Удалить все ключи, содержащие паттерн"""
-        keys_to_remove = [key for key in self._cache.keys() if pattern in key]
-        for key in keys_to_remove:
-            del self._cache[key]
+        """Удалить все ключи, содержащие паттерн (полный проход; для данных используйте теги)"""
+        with self._lock:
+            keys_to_remove = [key for key in self._cache.keys() if pattern in key]
+            for key in keys_to_remove:
+                self._remove(key)
+    
+    def purge(self) -> int:
+        """Удалить истекшие и устаревшие записи, вернуть их число"""
+        with self._lock:
+            current_time = time.time()
+            keys_to_remove = [
+                key for key, entry in self._cache.items()
+                if current_time > entry['expires_at'] or self._is_stale(entry)
+            ]
+            for key in keys_to_remove:
+                self._remove(key)
+            return len(keys_to_remove)
     
     def clear(self) -> None:
         """Очистить весь кэш"""
-        self._cache.clear()
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+    
+    def entries(self) -> list[tuple[str, Dict[str, Any]]]:
+        """Снимок записей (от давно не читанных к недавним) для мониторинга"""
+        with self._lock:
+            return list(self._cache.items())
     
     def get_stats(self) -> Dict[str, Any]:
         """Получить статистику кэша"""
-        current_time = time.time()
-        active_entries = 0
-        expired_entries = 0
-        
-        for entry in self._cache.values():
-            if current_time > entry['expires_at']:
-                expired_entries += 1
-            else:
-                active_entries += 1
-        
-        return {
-            'total_entries': len(self._cache),
-            'active_entries': active_entries,
-            'expired_entries': expired_entries,
-            'memory_usage': sum(len(str(entry['value'])) for entry in self._cache.values())
-        }
+        with self._lock:
+            current_time = time.time()
+            active_entries = 0
+            expired_entries = 0
+            stale_entries = 0
+            
+            for entry in self._cache.values():
+                if current_time > entry['expires_at']:
+                    expired_entries += 1
+                elif self._is_stale(entry):
+                    stale_entries += 1
+                else:
+                    active_entries += 1
+            
+            lookups = self._hits + self._misses
+            return {
+                'total_entries': len(self._cache),
+                'active_entries': active_entries,
+                'expired_entries': expired_entries + stale_entries,
+                'stale_entries': stale_entries,
+                'tag_generations': dict(self._generations),
+                'memory_usage': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': (self._hits / lookups * 100) if lookups else 0.0,
+                'evictions': self._evictions,
+            }
 
 
 # Глобальный экземпляр кэша
 cache_manager = CacheManager()
 
 
-def cached(ttl: int = 300, key_prefix: str = ""):
+def make_cache_key(prefix: str, args: tuple, kwargs: dict) -> str:
+    """Стабильный ключ кэша: blake2b от JSON-представления аргументов.
+
+    В отличие от hash(str(...)) не зависит от PYTHONHASHSEED и порядка
+    именованных аргументов.
+    """
+    payload = json.dumps([args, kwargs], sort_keys=True, default=repr, separators=(",", ":"))
+    return f"{prefix}:{hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()}"
+
+
+_refresh_lock = threading.Lock()
+_refreshing: set[str] = set()
+_refresh_executor: Optional[ThreadPoolExecutor] = None
+# Вычисления по одному ключу объединяются: при промахе считает один поток
+_compute_flight = SingleFlight("cached")
+
+
+def _submit_refresh(cache_key: str, refresh: Callable[[], Any]) -> None:
+    """Пересчитать значение в фоне (не более одного пересчета на ключ)"""
+    global _refresh_executor
+    with _refresh_lock:
+        if cache_key in _refreshing:
+            return
+        _refreshing.add(cache_key)
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(
+                max_workers=CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh"
+            )
+
+    def _run():
+        try:
+            refresh()
+        except Exception as e:
+            print(f"Ошибка фонового обновления кэша {cache_key}: {e}")
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(cache_key)
+
+    _refresh_executor.submit(_run)
+
+
+def cached(
+    ttl: int = 300,
+    key_prefix: str = "",
+    tags: Iterable[str] = (),
+    stale_ttl: int = 0,
+    beta: float = 1.0,
+):
     """
     Декоратор для кэширования результатов функций
     
+    Значение свежее ttl секунд (мягкий TTL) и хранится еще stale_ttl секунд
+    (жесткий TTL = ttl + stale_ttl). Устаревшее значение отдается сразу, а
+    один фоновый поток пересчитывает его. Незадолго до мягкого TTL пересчет
+    запускается заранее с вероятностью, растущей к истечению (XFetch: чем
+    дольше вычисление, тем раньше). При промахе вычисляет один поток на
+    ключ, остальные ждут его результат.
+    
     Args:
         ttl: Время жизни кэша в секундах
         key_prefix: Префикс для ключа кэша
+        tags: Теги данных, при инвалидации которых результат устаревает
+        stale_ttl: Сколько секунд после ttl отдавать устаревшее значение
+        beta: Коэффициент раннего обновления (0 — отключить)
     """
+    tags = tuple(tags)
+
     def decorator(func: Callable) -> Callable:
+        prefix = f"{key_prefix}{func.__module__}.{func.__qualname__}"
+
+        def compute(cache_key: str, args: tuple, kwargs: dict, force: bool) -> Any:
+            if not force:
+                # Значение могло появиться, пока поток ждал своей очереди
+                entry = cache_manager.get(cache_key)
+                if entry is not None and time.time() < entry[1]:
+                    return entry[0]
+            generations = cache_manager.generations(tags)
+            started = time.time()
+            result = func(*args, **kwargs)
+            finished = time.time()
+            # Запись: (значение, мягкий срок, длительность вычисления)
+            cache_manager.set(
+                cache_key, (result, finished + ttl, finished - started), ttl + stale_ttl,
+                tags=tags, tag_generations=generations,
+            )
+            return result
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             # Создаем ключ кэша на основе функции и аргументов
-            cache_key = f"{key_prefix}{func.__name__}:{hash(str(args) + str(sorted(kwargs.items())))}"
+            cache_key = make_cache_key(prefix, args, kwargs)
             
             # Пытаемся получить из кэша
-            cached_result = cache_manager.get(cache_key)
-            if cached_result is not None:
-                return cached_result
+            entry = cache_manager.get(cache_key)
+            if entry is not None:
+                value, soft_expires_at, delta = entry
+                # -log(u) > 0: ранний пересчет тем вероятнее, чем ближе срок
+                early = delta * beta * -math.log(1.0 - random.random())
+                if time.time() + early >= soft_expires_at:
+                    _submit_refresh(
+                        cache_key,
+                        lambda: _compute_flight.do(cache_key, compute, cache_key, args, kwargs, True),
+                    )
+                return value
             
-            # Выполняем функцию и кэшируем результат
-            result = func(*args, **kwargs)
-            cache_manager.set(cache_key, result, ttl)
-            
-            return result
+            # Выполняем функцию и кэшируем результат (один поток на ключ)
+            return _compute_flight.do(cache_key, compute, cache_key, args, kwargs, False)
+        
+        def invalidate(*args, **kwargs) -> None:
+            """Удалить закэшированный результат для этих аргументов"""
+            cache_manager.invalidate(make_cache_key(prefix, args, kwargs))
         
+        wrapper.invalidate = invalidate
         return wrapper
     return decorator
 
@@ -122,20 +383,19 @@ def invalidate_cache(pattern: str = None, key: str = None):
 
 
 # Специальные функции для кэширования данных портфеля
-def cache_portfolio_stats(stats: Dict[str, Any]) -> None:
-    """Кэшировать статистику портфеля"""
-    cache_manager.set("portfolio_stats", stats, ttl=60)  # 1 минута
+TRANSACTIONS_CACHE_TAGS = (TAG_TRANSACTIONS,)
+SOURCES_CACHE_TAGS = (TAG_TRANSACTIONS, TAG_SOURCES)
+ALERTS_CACHE_TAGS = (TAG_ALERTS,)
 
 
-def get_cached_portfolio_stats() -> Optional[Dict[str, Any]]:
-    """Получить кэшированную статистику портфеля"""
-    return cache_manager.get("portfolio_stats")
-
-
-def cache_transactions(transactions: list, limit: int = None) -> None:
-    """Кэшировать список сделок"""
+def cache_transactions(
+    transactions: list, limit: int = None, tag_generations: Optional[Dict[str, int]] = None
+) -> None:
+    """Кэшировать список сделок (tag_generations — снятые до чтения из БД)"""
     key = f"transactions_{limit}" if limit else "transactions_all"
-    cache_manager.set(key, transactions, ttl=120)  # 2 минуты
+    cache_manager.set(
+        key, transactions, ttl=120, tags=TRANSACTIONS_CACHE_TAGS, tag_generations=tag_generations
+    )  # 2 минуты
 
 
 def get_cached_transactions(limit: int = None) -> Optional[list]:
@@ -144,9 +404,11 @@ def get_cached_transactions(limit: int = None) -> Optional[list]:
     return cache_manager.get(key)
 
 
-def cache_sources(sources: list) -> None:
-    """Кэшировать список источников"""
-    cache_manager.set("sources", sources, ttl=600)  # 10 минут
+def cache_sources(sources: list, tag_generations: Optional[Dict[str, int]] = None) -> None:
+    """Кэшировать список источников (tag_generations — снятые до чтения из БД)"""
+    cache_manager.set(
+        "sources", sources, ttl=600, tags=SOURCES_CACHE_TAGS, tag_generations=tag_generations
+    )  # 10 минут
 
 
 def get_cached_sources() -> Optional[list]:
@@ -154,9 +416,11 @@ def get_cached_sources() -> Optional[list]:
     return cache_manager.get("sources")
 
 
-def cache_price_alerts(alerts: list) -> None:
-    """Кэшировать список алертов"""
-    cache_manager.set("price_alerts", alerts, ttl=60)  # 1 минута
+def cache_price_alerts(alerts: list, tag_generations: Optional[Dict[str, int]] = None) -> None:
+    """Кэшировать список алертов (tag_generations — снятые до чтения из БД)"""
+    cache_manager.set(
+        "price_alerts", alerts, ttl=60, tags=ALERTS_CACHE_TAGS, tag_generations=tag_generations
+    )  # 1 минута
 
 
 def get_cached_price_alerts() -> Optional[list]:
@@ -165,9 +429,20 @@ def get_cached_price_alerts() -> Optional[list]:
 
 
 # Функция для очистки кэша при изменении данных
-def invalidate_data_cache():
-    """Очистить кэш данных при изменении"""
-    cache_manager.invalidate_pattern("portfolio_*")
-    cache_manager.invalidate_pattern("transactions_*")
-    cache_manager.invalidate("sources")
-    cache_manager.invalidate("price_alerts")
+def invalidate_data_cache(strategies: Optional[Iterable[str]] = None):
+    """Очистить кэш данных при изменении (сделки, источники, алерты)
+
+    strategies — стратегии измененных сделок: кэш по остальным стратегиям
+    сохраняется. None — изменения могли затронуть любую стратегию.
+    """
+    tags = [TAG_TRANSACTIONS, TAG_SOURCES, TAG_ALERTS]
+    if strategies is None:
+        tags.append(TAG_STRATEGIES)
+    else:
+        tags.extend(strategy_tag(strategy) for strategy in strategies)
+    cache_manager.invalidate_tags(*tags)
+
+
+def invalidate_price_cache(coins: Iterable[str] = ()):
+    """Сделать устаревшими значения, зависящие от цен (всех или указанных монет)"""
+    cache_manager.invalidate_tags(TAG_PRICES, *(price_tag(coin) for coin in coins))
@@ -0,0 +1,254 @@
+"""
+Методы учета себестоимости (FIFO/LIFO/HIFO/средняя) и сопоставление лотов
+
+Движок проходит по упорядоченному потоку сделок один раз и ведет книги
+лотов сразу для всех запрошенных методов, поэтому сравнение методов не
+умножает стоимость чтения из БД и повтора истории.
+"""
+import heapq
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Sequence, Tuple
+
+from app.core.taxonomy import (
+    INBOUND_POSITION_TYPES,
+    OUTBOUND_POSITION_TYPES,
+    normalize_strategy,
+    normalize_transaction_type,
+)
+
+# Остаток лота, ниже которого лот считается закрытым
+LOT_EPSILON = 1e-12
+
+# Сделка для движка: (ключ позиции, направление +1/-1, количество, цена)
+Fill = Tuple[Hashable, int, float, float]
+
+
+class LotBook(ABC):
+    """Открытые лоты одной позиции для конкретного метода учета.
+
+    Наследники реализуют add, remove и open_lots (иначе книгу нельзя
+    создать). Продажа сверх остатка списывает только имеющееся количество,
+    излишек игнорируется.
+    """
+
+    __slots__ = ("realized",)
+
+    def __init__(self):
+        self.realized = 0.0
+
+    @abstractmethod
+    def add(self, qty: float, price: float) -> None:
+        """Добавляет лот"""
+
+    @abstractmethod
+    def remove(self, qty: float, price: float) -> None:
+        """Списывает qty по цене price, накапливая realized"""
+
+    @abstractmethod
+    def open_lots(self) -> Iterable[Tuple[float, float]]:
+        """Открытые лоты (количество, цена)"""
+
+    def totals(self) -> Tuple[float, float]:
+        """Остаток и его стоимость"""
+        lots = list(self.open_lots())
+        qty = sum(q for q, _ in lots)
+        cost = sum(q * p for q, p in lots)
+        return qty, cost
+
+
+class FifoBook(LotBook):
+    """FIFO: первыми списываются самые старые лоты"""
+
+    __slots__ = ("lots",)
+
+    def __init__(self):
+        super().__init__()
+        self.lots: deque = deque()
+
+    def add(self, qty: float, price: float) -> None:
+        self.lots.append([qty, price])
+
+    def remove(self, qty: float, price: float) -> None:
+        lots = self.lots
+        while qty > 0 and lots:
+            lot = lots[0]
+            take = min(qty, lot[0])
+            self.realized += take * (price - lot[1])
+            lot[0] -= take
+            qty -= take
+            if lot[0] <= LOT_EPSILON:
+                lots.popleft()
+
+    def open_lots(self) -> Iterable[Tuple[float, float]]:
+        return ((q, p) for q, p in self.lots)
+
+
+class LifoBook(FifoBook):
+    """LIFO: первыми списываются самые новые лоты"""
+
+    __slots__ = ()
+
+    def remove(self, qty: float, price: float) -> None:
+        lots = self.lots
+        while qty > 0 and lots:
+            lot = lots[-1]
+            take = min(qty, lot[0])
+            self.realized += take * (price - lot[1])
+            lot[0] -= take
+            qty -= take
+            if lot[0] <= LOT_EPSILON:
+                lots.pop()
+
+
+class HifoBook(LotBook):
+    """HIFO: первыми списываются самые дорогие лоты (куча по цене)"""
+
+    __slots__ = ("heap", "seq")
+
+    def __init__(self):
+        super().__init__()
+        self.heap: List[list] = []
+        self.seq = 0  # при равной цене списывается более старый лот
+
+    def add(self, qty: float, price: float) -> None:
+        heapq.heappush(self.heap, [-price, self.seq, qty])
+        self.seq += 1
+
+    def remove(self, qty: float, price: float) -> None:
+        heap = self.heap
+        while qty > 0 and heap:
+            lot = heap[0]
+            take = min(qty, lot[2])
+            self.realized += take * (price + lot[0])
+            lot[2] -= take
+            qty -= take
+            if lot[2] <= LOT_EPSILON:
+                heapq.heappop(heap)
+
+    def open_lots(self) -> Iterable[Tuple[float, float]]:
+        return ((qty, -neg_price) for neg_price, _, qty in sorted(self.heap, key=lambda lot: lot[1]))
+
+
+class AverageBook(LotBook):
+    """Средняя себестоимость: все лоты позиции сливаются в один"""
+
+    __slots__ = ("qty", "cost")
+
+    def __init__(self):
+        super().__init__()
+        self.qty = 0.0
+        self.cost = 0.0
+
+    def add(self, qty: float, price: float) -> None:
+        self.qty += qty
+        self.cost += qty * price
+
+    def remove(self, qty: float, price: float) -> None:
+        if self.qty <= 0:
+            return
+        take = min(qty, self.qty)
+        avg = self.cost / self.qty
+        self.realized += take * (price - avg)
+        self.qty -= take
+        self.cost -= take * avg
+        if self.qty <= LOT_EPSILON:
+            self.qty = self.cost = 0.0
+
+    def open_lots(self) -> Iterable[Tuple[float, float]]:
+        if self.qty > 0:
+            yield self.qty, self.cost / self.qty
+
+    def totals(self) -> Tuple[float, float]:
+        return self.qty, self.cost
+
+
+# Реестр методов учета; новые методы добавляются через register_cost_basis_method
+COST_BASIS_METHODS: Dict[str, Callable[[], LotBook]] = {
+    "fifo": FifoBook,
+    "lifo": LifoBook,
+    "hifo": HifoBook,
+    "average": AverageBook,
+}
+
+
+def register_cost_basis_method(name: str, factory: Callable[[], LotBook]) -> None:
+    """Зарегистрировать метод учета (фабрика возвращает новую книгу лотов)"""
+    COST_BASIS_METHODS[name.lower()] = factory
+
+
+def _resolve_methods(methods: Sequence[str]) -> List[str]:
+    resolved = [m.lower() for m in dict.fromkeys(methods)]
+    unknown = [m for m in resolved if m not in COST_BASIS_METHODS]
+    if unknown:
+        raise ValueError(f"unknown cost basis method(s) {unknown}, expected one of {list(COST_BASIS_METHODS)}")
+    return resolved
+
+
+def position_key(t) -> Tuple[str, str]:
+    """Ключ позиции по умолчанию: (монета, стратегия)"""
+    return (t.coin.upper(), normalize_strategy(t.strategy))
+
+
+def fills_from_transactions(
+    items: Iterable, key: Callable[[object], Hashable] = position_key
+) -> Iterator[Fill]:
+    """Поток сделок движка из объектов с полями Transaction (порядок сохраняется)"""
+    for t in items:
+        tx_type = normalize_transaction_type(t.type)
+        if tx_type in INBOUND_POSITION_TYPES:
+            yield key(t), 1, float(t.quantity), float(t.price)
+        elif tx_type in OUTBOUND_POSITION_TYPES:
+            yield key(t), -1, float(t.quantity), float(t.price)
+
+
+def match_lots(
+    fills: Iterable[Fill], methods: Sequence[str] = ("fifo",)
+) -> Dict[str, Dict[Hashable, LotBook]]:
+    """Сопоставляет лоты за один проход сразу для нескольких методов.
+
+    Возвращает {метод: {ключ позиции: книга лотов}}; ключи идут в порядке
+    первого появления в потоке.
+    """
+    methods = _resolve_methods(methods)
+    factories = [COST_BASIS_METHODS[m] for m in methods]
+    books: Dict[Hashable, List[LotBook]] = {}
+    for key, direction, qty, price in fills:
+        key_books = books.get(key)
+        if key_books is None:
+            key_books = books[key] = [factory() for factory in factories]
+        if direction > 0:
+            for book in key_books:
+                book.add(qty, price)
+        else:
+            for book in key_books:
+                book.remove(qty, price)
+    return {
+        method: {key: key_books[i] for key, key_books in books.items()}
+        for i, method in enumerate(methods)
+    }
+
+
+def book_to_position(key: Tuple[str, str], book: LotBook) -> dict:
+    """Позиция в формате positions_fifo"""
+    coin, strat = key
+    qty, cost = book.totals()
+    avg = (cost / qty) if qty > 0 else 0.0
+    return {
+        "key": f"{coin}:{strat}",
+        "coin": coin,
+        "strategy": strat,
+        "quantity": round(qty, 8),
+        "avg_cost": round(avg, 8),
+        "cost_basis": round(cost, 2),
+        "realized": round(book.realized, 2),
+    }
+
+
+def positions_by_method(items: Iterable, methods: Sequence[str] = ("fifo",)) -> Dict[str, List[dict]]:
+    """Позиции по каждому методу учета для сделок в хронологическом порядке"""
+    books = match_lots(fills_from_transactions(items), methods)
+    return {
+        method: [book_to_position(key, book) for key, book in method_books.items()]
+        for method, method_books in books.items()
+    }
@@ -0,0 +1,398 @@
+"""
+Дневные срезы портфеля (DailySnapshot) для графиков и дашбордов
+
+На каждый день хранятся остаток, вложенный капитал, реализованный P&L и
+стоимость на конец дня по каждой позиции (монета + стратегия) и сверткам:
+по монете (strategy="*"), по стратегии (coin="*") и по портфелю ("*", "*").
+Графики читают O(дней) строк диапазоном первичного ключа вместо пересчета
+всех сделок.
+
+Пересчет инкрементальный: запись сделки в той же транзакции отмечает
+первый затронутый день (mark_snapshots_dirty), а refresh_daily_snapshots
+пересчитывает дни от min(отметки, последнего построенного дня) до сегодня,
+продолжая накопленные значения из последних строк позиций перед ним.
+Фоновая задача APScheduler повторяет пересчет каждые
+DAILY_SNAPSHOT_INTERVAL_MINUTES минут, поэтому стоимость текущего дня
+следует за свежими свечами.
+"""
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import case, delete, func, insert, or_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from app.core.models import DailySnapshot, DailySnapshotState, RealizedPnlEntry, Transaction
+from app.core.positions_history import _to_utc
+from app.core.taxonomy import normalize_strategy
+from app.storage.db import engine, retry_on_busy
+
+# Свертка по всем монетам или стратегиям
+ALL = "*"
+# Период фонового пересчета срезов в минутах (0 — не запускать)
+DAILY_SNAPSHOT_INTERVAL_MINUTES = int(os.getenv("DAILY_SNAPSHOT_INTERVAL_MINUTES", "15"))
+# Валюта оценки стоимости
+SNAPSHOT_QUOTE = os.getenv("REPORT_CURRENCY", "USD").upper()
+# Остаток меньше этого считается закрытой позицией
+QUANTITY_EPS = 1e-12
+
+_EPOCH = date(1970, 1, 1)
+_SERIES_COLUMNS = (
+    "quantity", "invested", "bought", "sold", "realized_pnl",
+    "realized_total", "close_price", "value", "tx_count",
+)
+
+# Пересчеты из фоновой задачи и UI не выполняются одновременно
+_refresh_lock = threading.Lock()
+_scheduler = None
+
+
+def _day_start(day: date) -> datetime:
+    """Начало дня UTC"""
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def _ensure_state_row(session: Session) -> None:
+    session.execute(
+        sqlite_insert(DailySnapshotState).values(id=1, version=0).on_conflict_do_nothing()
+    )
+
+
+def mark_snapshots_dirty(session: Session, since: Optional[Any] = None) -> None:
+    """Отмечает срезы с дня since устаревшими в рамках сессии (без commit).
+
+    since=None — пересобрать все срезы (например, после полного пересчета лотов).
+    """
+    _ensure_state_row(session)
+    values: Dict[str, Any] = {"version": DailySnapshotState.version + 1}
+    if since is None:
+        values.update(built_through=None, dirty_from=None)
+    else:
+        day = _to_utc(since).date()
+        values["dirty_from"] = case(
+            (or_(DailySnapshotState.dirty_from.is_(None), DailySnapshotState.dirty_from > day), day),
+            else_=DailySnapshotState.dirty_from,
+        )
+    session.execute(update(DailySnapshotState).where(DailySnapshotState.id == 1).values(**values))
+
+
+@retry_on_busy
+def invalidate_daily_snapshots(since: Optional[Any] = None) -> None:
+    """mark_snapshots_dirty в отдельной транзакции (например, после загрузки свечей)"""
+    with Session(engine) as session:
+        mark_snapshots_dirty(session, since)
+        session.commit()
+
+
+def _base_rows(session: Session, start: date) -> pd.DataFrame:
+    """Последняя строка каждой позиции до дня start (накопленные значения)"""
+    # SQLite отдает остальные колонки из строки с max(day)
+    rows = session.execute(
+        select(
+            DailySnapshot.coin,
+            DailySnapshot.strategy,
+            func.max(DailySnapshot.day),
+            DailySnapshot.quantity,
+            DailySnapshot.invested,
+            DailySnapshot.realized_total,
+            DailySnapshot.close_price,
+        )
+        .where(DailySnapshot.day < start, DailySnapshot.coin != ALL, DailySnapshot.strategy != ALL)
+        .group_by(DailySnapshot.coin, DailySnapshot.strategy)
+    ).all()
+    return pd.DataFrame(
+        rows, columns=["coin", "strategy", "day", "quantity", "invested", "realized_total", "close_price"]
+    )
+
+
+def _realized_rows(session: Session, start: date) -> pd.DataFrame:
+    """Реализованный P&L журнала лотов по позициям и дням начиная с start"""
+    sell_day = func.date(RealizedPnlEntry.sell_ts)
+    rows = session.execute(
+        select(RealizedPnlEntry.coin, RealizedPnlEntry.strategy, sell_day, func.sum(RealizedPnlEntry.pnl))
+        .where(RealizedPnlEntry.sell_ts >= _day_start(start))
+        .group_by(RealizedPnlEntry.coin, RealizedPnlEntry.strategy, sell_day)
+    ).all()
+    return pd.DataFrame(rows, columns=["coin", "strategy", "day", "pnl"])
+
+
+def _emit(rows: List[dict], mask: np.ndarray, days: np.ndarray, coins: np.ndarray,
+          strategies: np.ndarray, columns: Dict[str, np.ndarray]) -> None:
+    """Добавляет строки для ячеек (день, группа), отмеченных в mask"""
+    day_idx, group_idx = np.nonzero(mask)
+    names = list(columns)
+    values = [columns[name][day_idx, group_idx].tolist() for name in names]
+    keys = ["day", "coin", "strategy", *names]
+    for row in zip(days[day_idx], coins[group_idx], strategies[group_idx], *values):
+        rows.append(dict(zip(keys, row)))
+
+
+def _build_rows(session: Session, start: date, end: date) -> List[dict]:
+    """Строки срезов за дни [start, end]: позиции и свертки"""
+    from app.core.analytics import NS_PER_DAY, load_snapshot
+    from app.core.price_history import get_price_series
+
+    snapshot = load_snapshot(session, since=_day_start(start))
+    base = _base_rows(session, start)
+    realized = _realized_rows(session, start)
+
+    tx_coins = np.array([c.upper() for c in snapshot.coins], dtype=object)[snapshot.coin_codes]
+    tx_strategies = np.asarray(snapshot.strategies, dtype=object)[snapshot.strategy_codes]
+    pair_codes, pairs = pd.MultiIndex.from_arrays([
+        np.concatenate([base["coin"].to_numpy(object), tx_coins, realized["coin"].to_numpy(object)]),
+        np.concatenate([base["strategy"].to_numpy(object), tx_strategies, realized["strategy"].to_numpy(object)]),
+    ]).factorize()
+    if not len(pairs):
+        return []
+    base_pairs = pair_codes[:len(base)]
+    tx_pairs = pair_codes[len(base):len(base) + len(snapshot)]
+    realized_pairs = pair_codes[len(base) + len(snapshot):]
+    pair_coin, coins = pd.factorize(pairs.get_level_values(0))
+    pair_strategy, strategies = pd.factorize(pairs.get_level_values(1))
+    coins = np.asarray(coins, dtype=object)
+    strategies = np.asarray(strategies, dtype=object)
+    n_days, n_pairs, n_coins = (end - start).days + 1, len(pairs), len(coins)
+    days = np.array([start + timedelta(days=i) for i in range(n_days)], dtype=object)
+
+    # Дневные изменения по позициям
+    first_day = (start - _EPOCH).days
+    tx_day = np.clip(snapshot.ts.asi8 // NS_PER_DAY - first_day, 0, n_days - 1)
+    amount = snapshot.amount
+    deltas = np.zeros((n_days, n_pairs))
+    bought = np.zeros((n_days, n_pairs))
+    sold = np.zeros((n_days, n_pairs))
+    tx_count = np.zeros((n_days, n_pairs), dtype=np.int64)
+    np.add.at(deltas, (tx_day, tx_pairs), snapshot.quantity * snapshot.direction)
+    np.add.at(bought, (tx_day, tx_pairs), np.where(snapshot.inbound, amount, 0.0))
+    np.add.at(sold, (tx_day, tx_pairs), np.where(snapshot.outbound, amount, 0.0))
+    np.add.at(tx_count, (tx_day, tx_pairs), 1)
+    realized_pnl = np.zeros((n_days, n_pairs))
+    if len(realized):
+        realized_day = np.array([(date.fromisoformat(d) - start).days for d in realized["day"]], dtype=np.int64)
+        np.add.at(realized_pnl, (np.clip(realized_day, 0, n_days - 1), realized_pairs), realized["pnl"].to_numpy(float))
+
+    # Накопленные значения продолжают последние строки перед start
+    def carried(column: str) -> np.ndarray:
+        values = np.zeros(n_pairs)
+        values[base_pairs] = base[column].to_numpy(float)
+        return values
+
+    quantity = carried("quantity") + np.cumsum(deltas, axis=0)
+    invested = carried("invested") + np.cumsum(bought - sold, axis=0)
+    realized_total = carried("realized_total") + np.cumsum(realized_pnl, axis=0)
+
+    # Цены: свечи (с последней известной), затем последняя сделка или
+    # прошлый срез, затем первая свеча периода
+    candles = get_price_series(
+        list(coins), _day_start(start), _day_start(end) + timedelta(days=1, seconds=-1), quote=SNAPSHOT_QUOTE
+    )
+    trade_prices = np.full((n_days + 1, n_coins), np.nan)
+    if len(base):
+        latest = base.assign(coin_code=pair_coin[base_pairs]).sort_values("day").drop_duplicates("coin_code", keep="last")
+        trade_prices[0, latest["coin_code"].to_numpy()] = latest["close_price"].to_numpy(float)
+    moves = snapshot.direction != 0
+    trades = pd.DataFrame(
+        {"day": tx_day[moves] + 1, "coin": pair_coin[tx_pairs[moves]], "price": snapshot.price[moves]}
+    ).drop_duplicates(["day", "coin"], keep="last")
+    trade_prices[trades["day"].to_numpy(), trades["coin"].to_numpy()] = trades["price"].to_numpy()
+    trade_prices = pd.DataFrame(trade_prices).ffill().to_numpy()[1:]
+    prices = candles.to_numpy()
+    prices = np.where(np.isnan(prices), trade_prices, prices)
+    prices = np.nan_to_num(np.where(np.isnan(prices), candles.bfill().to_numpy(), prices))
+
+    close_price = prices[:, pair_coin]
+    value = np.maximum(quantity, 0.0) * close_price
+    pair_columns = {
+        "quantity": quantity, "invested": invested, "bought": bought, "sold": sold,
+        "realized_pnl": realized_pnl, "realized_total": realized_total,
+        "close_price": close_price, "value": value, "tx_count": tx_count,
+    }
+    is_open = quantity > QUANTITY_EPS
+    active = is_open | (tx_count > 0) | (realized_pnl != 0)
+
+    rows: List[dict] = []
+    _emit(rows, active, days, coins[pair_coin], strategies[pair_strategy], pair_columns)
+
+    # Свертки: суммы позиций через матрицы принадлежности
+    def rollup(codes: np.ndarray, n_groups: int) -> Dict[str, np.ndarray]:
+        membership = np.zeros((n_pairs, n_groups))
+        membership[np.arange(n_pairs), codes] = 1.0
+        sums = {name: pair_columns[name] @ membership for name in pair_columns if name != "close_price"}
+        sums["tx_count"] = sums["tx_count"].round().astype(np.int64)
+        sums["open"] = is_open.astype(float) @ membership
+        return sums
+
+    by_coin = rollup(pair_coin, n_coins)
+    by_coin["close_price"] = prices
+    coin_mask = (by_coin.pop("open") > 0) | (by_coin["tx_count"] > 0) | (by_coin["realized_pnl"] != 0)
+    _emit(rows, coin_mask, days, coins, np.full(n_coins, ALL, dtype=object), by_coin)
+
+    portfolio = (np.zeros(n_pairs, dtype=np.int64), np.array([ALL], dtype=object), True)
+    for codes, labels, every_day in ((pair_strategy, strategies, False), portfolio):
+        sums = rollup(codes, len(labels))
+        mask = (sums.pop("open") > 0) | (sums["tx_count"] > 0) | (sums["realized_pnl"] != 0)
+        if every_day:
+            # Ряд портфеля непрерывный: строка на каждый день
+            mask[:] = True
+        # Остаток и цена разных монет не складываются
+        sums["quantity"] = np.zeros_like(sums["value"])
+        sums["close_price"] = np.zeros_like(sums["value"])
+        _emit(rows, mask, days, np.full(len(labels), ALL, dtype=object), labels, sums)
+    return rows
+
+
+@retry_on_busy
+def _refresh(today: date) -> Dict[str, Any]:
+    started = time.perf_counter()
+    with Session(engine) as session:
+        state = session.get(DailySnapshotState, 1)
+        version = state.version if state else 0
+        built = state.built_through if state else None
+        dirty = state.dirty_from if state else None
+        first_ts, last_ts = session.exec(select(func.min(Transaction.ts_utc), func.max(Transaction.ts_utc))).one()
+
+        start = end = None
+        rows: List[dict] = []
+        if first_ts is None or built is None:
+            session.execute(delete(DailySnapshot))
+        else:
+            start = min(built, dirty) if dirty is not None else built
+            session.execute(delete(DailySnapshot).where(DailySnapshot.day >= start))
+        if first_ts is not None:
+            first_day = _to_utc(first_ts).date()
+            start = max(start, first_day) if start is not None else first_day
+            end = max(today, _to_utc(last_ts).date(), start)
+            rows = _build_rows(session, start, end)
+            if rows:
+                session.execute(insert(DailySnapshot), rows)
+
+        _ensure_state_row(session)
+        session.execute(
+            update(DailySnapshotState)
+            .where(DailySnapshotState.id == 1)
+            .values(
+                built_through=end or today,
+                # Отметку, поставленную во время пересчета, оставляем до следующего
+                dirty_from=case((DailySnapshotState.version == version, None), else_=DailySnapshotState.dirty_from),
+            )
+        )
+        session.commit()
+    return {
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        "rows": len(rows),
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+def refresh_daily_snapshots(today: Optional[date] = None) -> Dict[str, Any]:
+    """Пересчитывает устаревшие дни срезов: границы пересчета, число строк, время"""
+    today = today or datetime.now(timezone.utc).date()
+    with _refresh_lock:
+        return _refresh(today)
+
+
+def ensure_daily_snapshots() -> None:
+    """Пересчитывает срезы, если есть отметка или текущий день еще не построен"""
+    today = datetime.now(timezone.utc).date()
+    with Session(engine) as session:
+        state = session.get(DailySnapshotState, 1)
+    if state is None or state.dirty_from is not None or state.built_through is None or state.built_through < today:
+        refresh_daily_snapshots(today)
+
+
+def get_daily_series(
+    coin: str = ALL,
+    strategy: str = ALL,
+    start: Optional[Any] = None,
+    end: Optional[Any] = None,
+    refresh: bool = True,
+) -> pd.DataFrame:
+    """Дневной ряд позиции или свертки (индекс — дни UTC).
+
+    По умолчанию ряд портфеля; coin="BTC" — монета по всем стратегиям,
+    strategy="long" — стратегия по всем монетам. Дни без строк (позиция
+    закрыта и без сделок) в ряд не попадают.
+    """
+    if refresh:
+        ensure_daily_snapshots()
+    coin = coin if coin == ALL else coin.upper()
+    strategy = strategy if strategy == ALL else normalize_strategy(strategy)
+    query = select(DailySnapshot.day, *(getattr(DailySnapshot, c) for c in _SERIES_COLUMNS)).where(
+        DailySnapshot.coin == coin, DailySnapshot.strategy == strategy
+    )
+    if start is not None:
+        query = query.where(DailySnapshot.day >= _to_utc(start).date())
+    if end is not None:
+        query = query.where(DailySnapshot.day <= _to_utc(end).date())
+    with Session(engine) as session:
+        rows = session.execute(query.order_by(DailySnapshot.day)).all()
+    frame = pd.DataFrame(rows, columns=["day", *_SERIES_COLUMNS])
+    frame.index = pd.DatetimeIndex(pd.to_datetime(frame.pop("day")), name="day").tz_localize("UTC")
+    return frame
+
+
+def get_rollup_totals(by: str = "strategy", refresh: bool = True) -> Dict[str, Dict[str, float]]:
+    """Итоги за всю историю по монетам или стратегиям из дневных сверток"""
+    if by not in ("coin", "strategy"):
+        raise ValueError("by must be 'coin' or 'strategy'")
+    if refresh:
+        ensure_daily_snapshots()
+    label = DailySnapshot.coin if by == "coin" else DailySnapshot.strategy
+    other = DailySnapshot.strategy if by == "coin" else DailySnapshot.coin
+    with Session(engine) as session:
+        rows = session.execute(
+            select(
+                label,
+                func.sum(DailySnapshot.tx_count),
+                func.sum(DailySnapshot.bought),
+                func.sum(DailySnapshot.sold),
+                func.sum(DailySnapshot.realized_pnl),
+            )
+            .where(other == ALL, label != ALL)
+            .group_by(label)
+        ).all()
+    return {
+        name: {"tx_count": int(count or 0), "bought": float(b or 0), "sold": float(s or 0), "realized_pnl": float(r or 0)}
+        for name, count, b, s, r in rows
+    }
+
+
+def _scheduled_refresh() -> None:
+    try:
+        refresh_daily_snapshots()
+    except Exception as e:
+        print(f"Ошибка обновления дневных срезов: {e}")
+
+
+def start_snapshot_scheduler() -> None:
+    """Запускает фоновый пересчет срезов (APScheduler), первый — сразу"""
+    global _scheduler
+    if _scheduler is not None or DAILY_SNAPSHOT_INTERVAL_MINUTES <= 0:
+        return
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    _scheduler = BackgroundScheduler(daemon=True)
+    _scheduler.add_job(
+        _scheduled_refresh,
+        "interval",
+        minutes=DAILY_SNAPSHOT_INTERVAL_MINUTES,
+        next_run_time=datetime.now(timezone.utc),
+        id="daily_snapshots",
+        max_instances=1,
+        coalesce=True,
+    )
+    _scheduler.start()
+
+
+def stop_snapshot_scheduler() -> None:
+    """Останавливает фоновый пересчет срезов"""
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.shutdown(wait=False)
+        _scheduler = None
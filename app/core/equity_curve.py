@@ -0,0 +1,228 @@
+"""
+Кривая капитала портфеля и метрики риска по ней
+
+Дневные остатки монет (матрица дни × монеты) умножаются на матрицу цен
+закрытия из price_history (отдельно по каждой паре группа × монета, если
+кривые строятся по монетам или стратегиям). Дневная доходность очищена от внешних потоков
+(покупки и поступления — взнос, продажи и выбытия — изъятие по цене сделки):
+r_t = (V_t - F_t) / V_{t-1} - 1. Метрики риска считаются векторно по ряду
+доходностей.
+"""
+import os
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.core.analytics import NS_PER_DAY, TransactionSnapshot, load_snapshot
+from app.core.cache import TAG_PRICES, TAG_TRANSACTIONS, cache_manager
+from app.core.price_history import _to_ts, get_price_series
+
+# Дней в году для приведения к годовым значениям (крипторынок работает без выходных)
+DAYS_PER_YEAR = 365
+# Безрисковая ставка (годовая, доля) для коэффициентов Шарпа и Сортино
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0"))
+# Уровень доверия исторических VaR/CVaR
+VAR_LEVEL = float(os.getenv("VAR_LEVEL", "0.95"))
+
+
+# Разрезы кривых капитала: весь портфель, по монетам, по стратегиям
+CURVE_GROUPINGS = ("portfolio", "coin", "strategy")
+# Сколько секунд хранить построенные кривые в кэше
+CURVE_CACHE_TTL = 3600
+
+
+def build_group_curves(
+    snapshot: TransactionSnapshot, by: str = "portfolio", end: Optional[Any] = None, quote: str = "USD"
+) -> Dict[str, pd.DataFrame]:
+    """Дневные кривые капитала по группам сделок.
+
+    Возвращает {"value", "flow", "return"} -> DataFrame (дни UTC × группы).
+    Пропуски в свечах заполняются последней известной ценой, до первой
+    свечи — первой свечой, а для монет без истории — ценой последней сделки.
+    """
+    if by not in CURVE_GROUPINGS:
+        raise ValueError(f"by must be one of {CURVE_GROUPINGS}")
+    if not len(snapshot):
+        empty = pd.DataFrame(index=pd.DatetimeIndex([], tz="UTC"), dtype=float)
+        return {"value": empty, "flow": empty, "return": empty}
+
+    # Монеты в верхнем регистре, как в price_history
+    column_codes, columns = pd.factorize(np.array([c.upper() for c in snapshot.coins], dtype=object))
+    tx_column = column_codes[snapshot.coin_codes]
+    n_columns = len(columns)
+    if by == "coin":
+        tx_group, labels = tx_column, list(columns)
+    elif by == "strategy":
+        tx_group, labels = snapshot.strategy_codes, list(snapshot.strategies)
+    else:
+        tx_group, labels = np.zeros(len(snapshot), dtype=np.int64), ["portfolio"]
+
+    first_day = int(snapshot.ts.asi8[0] // NS_PER_DAY)
+    end_ts = _to_ts(end) if end is not None else int(time.time())
+    end_day = max(end_ts // 86_400, int(snapshot.ts.asi8[-1] // NS_PER_DAY))
+    candles = get_price_series(list(columns), first_day * 86_400, end_day * 86_400 + 86_399, quote=quote)
+    n_days = len(candles)
+
+    tx_day = np.clip(snapshot.ts.asi8 // NS_PER_DAY - first_day, 0, n_days - 1)
+    signed_qty = snapshot.quantity * snapshot.direction
+    signed_amount = snapshot.amount * snapshot.direction
+
+    # Цена последней сделки дня по монете — запасной источник цены
+    moves = snapshot.direction != 0
+    trades = pd.DataFrame(
+        {"day": tx_day[moves], "column": tx_column[moves], "price": snapshot.price[moves]}
+    ).drop_duplicates(["day", "column"], keep="last")
+    trade_prices = np.full((n_days, n_columns), np.nan)
+    trade_prices[trades["day"].to_numpy(), trades["column"].to_numpy()] = trades["price"].to_numpy()
+    trade_prices = pd.DataFrame(trade_prices).ffill().to_numpy()
+
+    prices = candles.bfill().to_numpy()
+    prices = np.where(np.isnan(prices), trade_prices, prices)
+
+    # Остатки на конец дня по парам (группа, монета): накопленная сумма изменений
+    pair_codes, pairs = pd.factorize(tx_group * n_columns + tx_column)
+    deltas = np.zeros((n_days, len(pairs)))
+    np.add.at(deltas, (tx_day, pair_codes), signed_qty)
+    holdings = np.maximum(np.cumsum(deltas, axis=0), 0.0)
+    pair_values = np.nan_to_num(holdings * prices[:, pairs % n_columns])
+    membership = np.zeros((len(pairs), len(labels)))
+    membership[np.arange(len(pairs)), pairs // n_columns] = 1.0
+    values = pair_values @ membership
+
+    flows = np.zeros((n_days, len(labels)))
+    np.add.at(flows, (tx_day, tx_group), signed_amount)
+
+    previous = np.vstack([np.zeros((1, len(labels))), values[:-1]])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.where(previous > 0, (values - flows) / previous - 1.0, np.nan)
+
+    curves = {
+        name: pd.DataFrame(data, index=candles.index, columns=labels)
+        for name, data in (("value", values), ("flow", flows), ("return", returns))
+    }
+    curves["value"].attrs["unpriced_coins"] = [
+        str(c) for c in candles.columns[candles.isna().all().to_numpy()]
+    ]
+    return curves
+
+
+def build_equity_curve(
+    snapshot: TransactionSnapshot, end: Optional[Any] = None, quote: str = "USD"
+) -> pd.DataFrame:
+    """Дневная кривая капитала портфеля: value, flow, return (индекс — дни UTC)"""
+    if not len(snapshot):
+        return pd.DataFrame(columns=["value", "flow", "return"], dtype=float)
+    curves = build_group_curves(snapshot, "portfolio", end, quote)
+    curve = pd.DataFrame({name: frame["portfolio"] for name, frame in curves.items()})
+    curve.attrs["unpriced_coins"] = curves["value"].attrs["unpriced_coins"]
+    return curve
+
+
+def get_group_curves(
+    by: str = "portfolio",
+    quote: str = "USD",
+    end_day: Optional[int] = None,
+    snapshot: Optional[TransactionSnapshot] = None,
+) -> Dict[str, Any]:
+    """Кривые по группам на конец дня end_day (номер дня UTC), из кэша или заново.
+
+    Возвращает labels, days (номера дней), матрицы value/flow/return и
+    unpriced_coins. Кэш сбрасывается при изменении сделок и цен.
+    """
+    end_day = end_day if end_day is not None else int(time.time() // 86_400)
+    key = f"equity_curves:{by}:{quote}:{end_day}"
+    curves = cache_manager.get(key)
+    if curves is None:
+        generations = cache_manager.generations((TAG_TRANSACTIONS, TAG_PRICES))
+        snapshot = snapshot if snapshot is not None else load_snapshot()
+        frames = build_group_curves(snapshot, by, end_day * 86_400, quote)
+        curves = {
+            "labels": list(frames["value"].columns),
+            "days": frames["value"].index.as_unit("ns").asi8 // NS_PER_DAY,
+            # Копии владеют данными: так их размер виден оценке памяти кэша
+            "value": frames["value"].to_numpy(copy=True),
+            "flow": frames["flow"].to_numpy(copy=True),
+            "return": frames["return"].to_numpy(copy=True),
+            "unpriced_coins": frames["value"].attrs.get("unpriced_coins", []),
+        }
+        cache_manager.set(
+            key, curves, ttl=CURVE_CACHE_TTL, tags=(TAG_TRANSACTIONS, TAG_PRICES), tag_generations=generations
+        )
+    return curves
+
+
+def get_equity_curve(quote: str = "USD", snapshot: Optional[TransactionSnapshot] = None) -> pd.DataFrame:
+    """Кривая капитала портфеля на сегодня (через кэш get_group_curves)"""
+    curves = get_group_curves("portfolio", quote, snapshot=snapshot)
+    if not len(curves["days"]):
+        return pd.DataFrame(columns=["value", "flow", "return"], dtype=float)
+    curve = pd.DataFrame(
+        {name: curves[name][:, 0] for name in ("value", "flow", "return")},
+        index=pd.to_datetime(curves["days"] * 86_400, unit="s", utc=True),
+    )
+    curve.attrs["unpriced_coins"] = curves["unpriced_coins"]
+    return curve
+
+
+def risk_metrics(
+    curve: pd.DataFrame, risk_free_rate: float = RISK_FREE_RATE, var_level: float = VAR_LEVEL
+) -> Dict[str, Any]:
+    """Волатильность, Шарп/Сортино, максимальная просадка с датами, VaR/CVaR (в %)"""
+    returns = curve["return"].to_numpy(dtype=float) if len(curve) else np.zeros(0)
+    observed = returns[~np.isnan(returns)]
+    result = {
+        'volatility': 0.0,
+        'daily_volatility': 0.0,
+        'sharpe_ratio': 0.0,
+        'sortino_ratio': 0.0,
+        'max_drawdown_percent': 0.0,
+        'drawdown_peak': None,
+        'drawdown_trough': None,
+        'drawdown_recovery': None,
+        'var_percent': 0.0,
+        'cvar_percent': 0.0,
+        'var_level': var_level,
+        'trading_days': len(observed),
+        'avg_daily_return': float(observed.mean() * 100) if len(observed) else 0.0,
+        'current_value': float(curve["value"].iloc[-1]) if len(curve) else 0.0,
+        'unpriced_coins': curve.attrs.get("unpriced_coins", []),
+    }
+    if len(observed) < 2:
+        return result
+
+    # Доходности и волатильность
+    std = float(observed.std(ddof=1))
+    excess = observed - ((1 + risk_free_rate) ** (1 / DAYS_PER_YEAR) - 1)
+    downside = float(np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2)))
+    annualize = float(np.sqrt(DAYS_PER_YEAR))
+
+    # Просадка по индексу благосостояния (без влияния взносов и изъятий)
+    wealth = np.cumprod(1.0 + np.nan_to_num(returns))
+    peaks = np.maximum.accumulate(wealth)
+    drawdowns = wealth / peaks - 1.0
+    trough = int(np.argmin(drawdowns))
+    peak = int(np.argmax(wealth[:trough + 1]))
+    recovered = np.flatnonzero(wealth[trough:] >= wealth[peak])
+    dates = curve.index
+
+    # Исторические VaR/CVaR: квантиль и среднее хвоста дневных доходностей
+    cutoff = float(np.quantile(observed, 1 - var_level))
+
+    result.update({
+        'volatility': std * annualize * 100,
+        'daily_volatility': std * 100,
+        'sharpe_ratio': float(excess.mean() / std * annualize) if std > 0 else 0.0,
+        'sortino_ratio': float(excess.mean() / downside * annualize) if downside > 0 else 0.0,
+        'max_drawdown_percent': float(-drawdowns[trough] * 100),
+        'drawdown_peak': dates[peak].date().isoformat() if drawdowns[trough] < 0 else None,
+        'drawdown_trough': dates[trough].date().isoformat() if drawdowns[trough] < 0 else None,
+        'drawdown_recovery': (
+            dates[trough + int(recovered[0])].date().isoformat()
+            if drawdowns[trough] < 0 and len(recovered) else None
+        ),
+        'var_percent': -cutoff * 100,
+        'cvar_percent': float(-observed[observed <= cutoff].mean() * 100),
+    })
+    return result
@@ -6,11 +6,17 @@
 import csv
 import json
 import io
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 
-from app.core.services import list_transactions, get_portfolio_stats, get_sources_with_frequency, get_price_alerts
+from app.core.services import (
+    add_transactions_bulk,
+    get_portfolio_stats,
+    get_price_alerts,
+    get_sources_with_frequency,
+    list_transactions,
+)
 from app.core.models import TransactionIn, PriceAlertIn
 from sqlmodel import Session
 from app.storage.db import engine
@@ -100,19 +106,21 @@ def import_transactions_csv(csv_content: str) -> Dict[str, Any]:
     }
     
     try:
-        # Парсим CSV
+        # Парсим CSV и проверяем строки, вставка — одним пакетным вызовом
         csv_reader = csv.DictReader(io.StringIO(csv_content))
+        rows = []
         
         for row_num, row in enumerate(csv_reader, start=2):  # Начинаем с 2 (пропускаем заголовок)
             try:
                 # Валидация и преобразование данных
                 transaction_data = {
-                    'coin': row.get('Монета', '').strip(),
-                    'qty': float(row.get('Количество', 0)) if row.get('Количество') else 0.0,
+                    'coin': (row.get('Монета') or '').strip(),
+                    'quantity': float(row.get('Количество', 0)) if row.get('Количество') else 0.0,
                     'price': float(row.get('Цена', 0)) if row.get('Цена') else 0.0,
-                    'source': row.get('Источник', '').strip(),
-                    'type': row.get('Тип', 'buy').strip().lower(),
-                    'notes': row.get('Заметки', '').strip()
+                    'source': (row.get('Источник') or '').strip(),
+                    'type': (row.get('Тип') or 'buy').strip().lower(),
+                    'strategy': (row.get('Стратегия') or 'long_term').strip(),
+                    'notes': (row.get('Заметки') or '').strip()
                 }
                 
                 # Валидация обязательных полей
@@ -120,7 +128,7 @@ def import_transactions_csv(csv_content: str) -> Dict[str, Any]:
                     result['errors'].append(f"Строка {row_num}: Отсутствует название монеты")
                     continue
                 
-                if transaction_data['qty'] <= 0:
+                if transaction_data['quantity'] <= 0:
                     result['errors'].append(f"Строка {row_num}: Некорректное количество")
                     continue
                 
@@ -128,16 +136,25 @@ def import_transactions_csv(csv_content: str) -> Dict[str, Any]:
                     result['errors'].append(f"Строка {row_num}: Некорректная цена")
                     continue
                 
-                # Добавляем транзакцию
-                from app.core.services import add_transaction
-                transaction_id = add_transaction(TransactionIn(**transaction_data))
-                result['imported'] += 1
+                # Дата выгрузки — локальное время без зоны
+                if row.get('Дата'):
+                    transaction_data['ts_utc'] = datetime.strptime(
+                        row['Дата'].strip(), "%Y-%m-%d %H:%M:%S"
+                    ).astimezone(timezone.utc)
+                
+                rows.append(transaction_data)
                 
             except ValueError as e:
                 result['errors'].append(f"Строка {row_num}: Ошибка преобразования данных - {str(e)}")
             except Exception as e:
                 result['errors'].append(f"Строка {row_num}: Неожиданная ошибка - {str(e)}")
         
+        if rows:
+            bulk = add_transactions_bulk(rows)
+            result['imported'] = bulk['inserted']
+            result['rows_per_sec'] = bulk['rows_per_sec']
+            result['errors'].extend(bulk['errors'])
+        
         if result['errors']:
             result['success'] = False
             
@@ -164,26 +181,40 @@ def import_portfolio_json(json_data: Dict[str, Any]) -> Dict[str, Any]:
         if export_info.get('version') != '1.7.0':
             result['warnings'].append(f"Версия файла {export_info.get('version', 'неизвестна')} может быть несовместима с текущей версией 1.7.0")
         
-        # Импорт транзакций
+        # Импорт транзакций: строки проверяются по одной, вставка — одним пакетным вызовом
         transactions = json_data.get('transactions', [])
+        rows = []
         for tx_data in transactions:
             try:
-                # Преобразуем в формат TransactionIn
-                transaction_input = TransactionIn(
-                    coin=tx_data.get('coin', ''),
-                    qty=float(tx_data.get('qty', 0)),
-                    price=float(tx_data.get('price', 0)),
-                    source=tx_data.get('source', ''),
-                    type=tx_data.get('type', 'buy'),
-                    notes=tx_data.get('notes', '')
-                )
-                
-                from app.core.services import add_transaction
-                add_transaction(transaction_input)
-                result['imported_transactions'] += 1
-                
+                row = {
+                    'coin': tx_data.get('coin', ''),
+                    'quantity': float(tx_data.get('quantity', tx_data.get('qty', 0))),
+                    'price': float(tx_data.get('price', 0)),
+                    'source': tx_data.get('source', ''),
+                    'type': tx_data.get('type', 'buy'),
+                    'strategy': tx_data.get('strategy', 'long_term'),
+                    'notes': tx_data.get('notes', '')
+                }
+                if tx_data.get('ts_utc'):
+                    ts = datetime.fromisoformat(str(tx_data['ts_utc']).strip().replace('Z', '+00:00'))
+                    row['ts_utc'] = ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+                elif tx_data.get('created_at'):
+                    # created_at в выгрузке — локальное время без зоны
+                    row['ts_utc'] = datetime.strptime(
+                        tx_data['created_at'].strip(), "%Y-%m-%d %H:%M:%S"
+                    ).astimezone(timezone.utc)
+                rows.append((row, tx_data.get('id') or 0))
             except Exception as e:
-                result['errors'].append(f"Ошибка импорта транзакции: {str(e)}")
+                result['errors'].append(f"Ошибка импорта транзакции {tx_data.get('id', '')}: {str(e)}")
+        
+        # Выгрузка идет от новых к старым: вставляем в хронологическом
+        # порядке, чтобы id сделок с одинаковым временем сохранили очередность
+        rows.sort(key=lambda item: (item[0]['ts_utc'].timestamp() if 'ts_utc' in item[0] else float('inf'), item[1]))
+        rows = [row for row, _ in rows]
+        if rows:
+            bulk = add_transactions_bulk(rows)
+            result['imported_transactions'] = bulk['inserted']
+            result['errors'].extend(f"Ошибка импорта транзакции: {error}" for error in bulk['errors'])
         
         # Импорт алертов
         alerts = json_data.get('price_alerts', [])
@@ -0,0 +1,164 @@
+"""
+Векторизованный FIFO-расчет позиций на NumPy для больших историй сделок
+
+Сделки загружаются колонками, группируются по (монета, стратегия) через
+argsort, а сопоставление продаж с лотами выполняется на накопленных суммах:
+FIFO списывает лоты по порядку, поэтому к моменту k-й продажи списан
+префикс длины S_k очереди лотов. Результат совпадает с positions_fifo().
+"""
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlmodel import Session, select
+
+from app.core.models import Transaction
+from app.core.taxonomy import (
+    INBOUND_POSITION_TYPES,
+    OUTBOUND_POSITION_TYPES,
+    normalize_strategy,
+    normalize_transaction_type,
+)
+
+# Остаток лота, ниже которого лот считается закрытым (как в positions_fifo)
+LOT_EPSILON = 1e-12
+
+
+def _factorize(values: Sequence, func) -> tuple[np.ndarray, np.ndarray]:
+    """Коды и уникальные значения колонки после нормализации func.
+
+    func вызывается только для уникальных исходных значений; коды
+    нумеруются в порядке первого появления.
+    """
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    norm_codes, norm_uniques = pd.factorize(np.array([func(v) for v in uniques], dtype=object))
+    return norm_codes[codes], np.asarray(norm_uniques, dtype=object)
+
+
+def _consumed_cost(x: float, lot_end: np.ndarray, lot_cost_end: np.ndarray, lot_price: np.ndarray) -> float:
+    """Стоимость первых x единиц очереди лотов (кусочно-линейная функция)"""
+    if len(lot_end) == 0 or x <= 0:
+        return 0.0
+    i = min(int(np.searchsorted(lot_end, x, side="left")), len(lot_end) - 1)
+    qty_i = lot_end[i] - (lot_end[i - 1] if i else 0.0)
+    start_cost = lot_cost_end[i] - qty_i * lot_price[i]
+    return float(start_cost + (x - (lot_end[i] - qty_i)) * lot_price[i])
+
+
+def _fifo_group(direction: np.ndarray, qty: np.ndarray, price: np.ndarray) -> tuple[float, float, float]:
+    """FIFO одной позиции: (остаток, стоимость остатка, реализованный P&L)"""
+    inbound = direction > 0
+    outbound = direction < 0
+
+    lot_qty = qty[inbound]
+    lot_price = price[inbound]
+    lot_end = np.cumsum(lot_qty)
+    lot_cost_end = np.cumsum(lot_qty * lot_price)
+
+    # Доступно к моменту каждой продажи: все предшествующие поступления
+    available = np.cumsum(np.where(inbound, qty, 0.0))[outbound]
+    sell_qty = qty[outbound]
+    sell_price = price[outbound]
+
+    if len(sell_qty):
+        # S_k = min(S_{k-1} + q_k, B_k): превышение продажи над остатком
+        # отбрасывается, что сводится к накопленному минимуму
+        requested = np.cumsum(sell_qty)
+        shortfall = np.minimum.accumulate(np.minimum(available - requested, 0.0))
+        consumed = requested + shortfall
+        taken = np.diff(consumed, prepend=0.0)
+        total_consumed = float(consumed[-1])
+        proceeds = float(np.dot(taken, sell_price))
+    else:
+        total_consumed = 0.0
+        proceeds = 0.0
+
+    realized = proceeds - _consumed_cost(total_consumed, lot_end, lot_cost_end, lot_price)
+
+    lot_start = lot_end - lot_qty
+    remaining = np.clip(lot_end - np.maximum(lot_start, total_consumed), 0.0, None)
+    remaining[remaining <= LOT_EPSILON] = 0.0
+    return float(remaining.sum()), float(np.dot(remaining, lot_price)), realized
+
+
+def compute_positions_fifo(
+    coins: Sequence[str],
+    strategies: Sequence[str],
+    types: Sequence[str],
+    quantities: Sequence[float],
+    prices: Sequence[float],
+) -> list[dict]:
+    """FIFO-позиции по колонкам сделок в хронологическом порядке (формат positions_fifo)"""
+    if len(coins) == 0:
+        return []
+    type_codes, type_uniques = _factorize(types, normalize_transaction_type)
+    type_direction = np.array(
+        [
+            1 if t in INBOUND_POSITION_TYPES else -1 if t in OUTBOUND_POSITION_TYPES else 0
+            for t in type_uniques
+        ],
+        dtype=np.int8,
+    )
+    direction = type_direction[type_codes]
+
+    active = np.flatnonzero(direction)
+    if len(active) == 0:
+        return []
+    coin_codes, coin_uniques = _factorize(coins, str.upper)
+    strat_codes, strat_uniques = _factorize(strategies, normalize_strategy)
+    direction = direction[active]
+    qty = np.asarray(quantities, dtype=float)[active]
+    price = np.asarray(prices, dtype=float)[active]
+
+    # Ключ позиции как одно целое; коды групп идут в порядке первого появления
+    pair = coin_codes[active].astype(np.int64) * len(strat_uniques) + strat_codes[active]
+    key_code, key_pairs = pd.factorize(pair)
+    # Стабильная сортировка сохраняет хронологию внутри каждой группы
+    order = np.argsort(key_code, kind="stable")
+    bounds = np.searchsorted(key_code[order], np.arange(len(key_pairs) + 1))
+
+    positions = []
+    for code, pair_code in enumerate(key_pairs):
+        idx = order[bounds[code]:bounds[code + 1]]
+        quantity, cost, realized = _fifo_group(direction[idx], qty[idx], price[idx])
+        avg = (cost / quantity) if quantity > 0 else 0.0
+        coin = coin_uniques[pair_code // len(strat_uniques)]
+        strat = strat_uniques[pair_code % len(strat_uniques)]
+        positions.append(
+            {
+                "key": f"{coin}:{strat}",
+                "coin": coin,
+                "strategy": strat,
+                "quantity": round(quantity, 8),
+                "avg_cost": round(avg, 8),
+                "cost_basis": round(cost, 2),
+                "realized": round(realized, 2),
+            }
+        )
+    return positions
+
+
+def load_transaction_columns(session: Session) -> tuple[list, ...]:
+    """Колонки сделок (coin, strategy, type, quantity, price) в порядке FIFO"""
+    rows = session.exec(
+        select(
+            Transaction.coin,
+            Transaction.strategy,
+            Transaction.type,
+            Transaction.quantity,
+            Transaction.price,
+        ).order_by(Transaction.ts_utc.asc(), Transaction.id.asc())
+    ).all()
+    if not rows:
+        return [], [], [], [], []
+    return tuple(list(col) for col in zip(*rows))
+
+
+def positions_fifo_vectorized(session: Optional[Session] = None) -> list[dict]:
+    """FIFO-позиции по всей истории сделок из БД (векторизованный расчет)"""
+    if session is None:
+        from app.storage.db import engine
+
+        with Session(engine) as own_session:
+            return compute_positions_fifo(*load_transaction_columns(own_session))
+    return compute_positions_fifo(*load_transaction_columns(session))
@@ -0,0 +1,400 @@
+"""
+Инкрементальный FIFO-учет лотов с сохранением состояния в БД
+
+Открытые лоты (PositionLot), журнал реализованного P&L (RealizedPnlEntry)
+и сводное состояние позиций (PositionState) обновляются при каждой записи
+сделки. Чтение позиций стоит O(открытых лотов) вместо повтора всей истории.
+
+Новая сделка, идущая после последней учтенной сделки позиции, применяется
+инкрементально. Сделка «задним числом», изменение или удаление повторяют
+FIFO только для затронутой пары (монета, стратегия) начиная с точки
+изменения: журнал до этой точки остается контрольной точкой, по которой
+восстанавливаются остатки лотов.
+"""
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import and_, case, delete, func, insert, or_
+from sqlmodel import Session, select
+
+from app.core.models import PositionLot, PositionState, RealizedPnlEntry, Transaction
+from app.core.daily_snapshots import mark_snapshots_dirty
+from app.core.positions_history import clear_checkpoints
+from app.core.taxonomy import (
+    INBOUND_POSITION_TYPES,
+    OUTBOUND_POSITION_TYPES,
+    normalize_strategy,
+    normalize_transaction_type,
+)
+
+# Остаток лота, ниже которого лот считается закрытым
+LOT_EPSILON = 1e-12
+
+PositionKey = tuple[str, str]
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Приводит время к aware UTC (naive значения считаются UTC)"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def transaction_key(t: Transaction) -> PositionKey:
+    """Ключ позиции сделки: (монета, стратегия)"""
+    return (t.coin.upper(), normalize_strategy(t.strategy))
+
+
+def is_position_transaction(t: Transaction) -> bool:
+    """Влияет ли сделка на лоты (вход или выход позиции)"""
+    tx_type = normalize_transaction_type(t.type)
+    return tx_type in INBOUND_POSITION_TYPES or tx_type in OUTBOUND_POSITION_TYPES
+
+
+def _key_filter(model, key: PositionKey):
+    return and_(model.coin == key[0], model.strategy == key[1])
+
+
+def transactions_history_query():
+    """Запрос всей истории сделок в порядке FIFO (время, id)"""
+    return select(Transaction).order_by(Transaction.ts_utc.asc(), Transaction.id.asc())
+
+
+def key_transactions_query(key: PositionKey):
+    """Запрос сделок монеты позиции в порядке FIFO (стратегия фильтруется после нормализации)"""
+    return (
+        select(Transaction)
+        .where(func.upper(Transaction.coin) == key[0])
+        .order_by(Transaction.ts_utc.asc(), Transaction.id.asc())
+    )
+
+
+def open_lots_query(key: PositionKey):
+    """Запрос открытых лотов позиции в порядке FIFO"""
+    return (
+        select(PositionLot)
+        .where(_key_filter(PositionLot, key))
+        .order_by(PositionLot.ts_utc.asc(), PositionLot.tx_id.asc())
+    )
+
+
+def ledger_rollback_query(key: PositionKey, from_ts: datetime, from_id: int):
+    """Удаление записей журнала позиции начиная с (from_ts, from_id) включительно"""
+    return delete(RealizedPnlEntry).where(
+        _key_filter(RealizedPnlEntry, key),
+        or_(
+            RealizedPnlEntry.sell_ts > from_ts,
+            and_(RealizedPnlEntry.sell_ts == from_ts, RealizedPnlEntry.sell_tx_id >= from_id),
+        ),
+    )
+
+
+def _load_key_transactions(session: Session, key: PositionKey) -> list[Transaction]:
+    """Сделки позиции в порядке FIFO (время, id)"""
+    items = session.exec(key_transactions_query(key)).all()
+    return [t for t in items if transaction_key(t) == key and is_position_transaction(t)]
+
+
+def _load_open_lots(session: Session, key: PositionKey) -> list[PositionLot]:
+    return list(session.exec(open_lots_query(key)).all())
+
+
+def _new_state(key: PositionKey, ts: datetime, tx_id: int) -> PositionState:
+    return PositionState(
+        coin=key[0],
+        strategy=key[1],
+        realized=0.0,
+        tx_count=0,
+        first_ts=ts,
+        first_tx_id=tx_id,
+        last_ts=ts,
+        last_tx_id=tx_id,
+    )
+
+
+def _apply_transaction(
+    key: PositionKey, state: PositionState, lots: deque, t: Transaction, ledger: list[dict]
+) -> None:
+    """Применяет одну сделку к лотам позиции (FIFO).
+
+    Лоты — списки [tx_id, ts_utc, quantity, price] в порядке FIFO; списания
+    добавляются в ledger строками RealizedPnlEntry для пакетной вставки.
+    """
+    ts = _as_utc(t.ts_utc)
+    tx_type = normalize_transaction_type(t.type)
+    if tx_type in INBOUND_POSITION_TYPES:
+        lots.append([t.id, ts, float(t.quantity), float(t.price)])
+    elif tx_type in OUTBOUND_POSITION_TYPES:
+        qty_left = float(t.quantity)
+        sell_price = float(t.price)
+        while qty_left > 0 and lots:
+            lot = lots[0]
+            take = min(qty_left, lot[2])
+            pnl = take * (sell_price - lot[3])
+            state.realized += pnl
+            ledger.append(
+                {
+                    "coin": key[0],
+                    "strategy": key[1],
+                    "sell_tx_id": t.id,
+                    "sell_ts": ts,
+                    "lot_tx_id": lot[0],
+                    "lot_ts": lot[1],
+                    "quantity": take,
+                    "buy_price": lot[3],
+                    "sell_price": sell_price,
+                    "pnl": pnl,
+                }
+            )
+            lot[2] -= take
+            qty_left -= take
+            if lot[2] <= LOT_EPSILON:
+                lots.popleft()
+    state.tx_count += 1
+    state.last_ts = ts
+    state.last_tx_id = t.id
+
+
+def _lot_rows(key: PositionKey, lots: Iterable[list]) -> list[dict]:
+    return [
+        {"coin": key[0], "strategy": key[1], "tx_id": tx_id, "ts_utc": ts, "quantity": qty, "price": price}
+        for tx_id, ts, qty, price in lots
+    ]
+
+
+def _insert_rows(session: Session, lot_rows: list[dict], ledger: list[dict]) -> None:
+    """Пакетная вставка лотов и записей журнала (executemany)"""
+    if lot_rows:
+        session.execute(insert(PositionLot), lot_rows)
+    if ledger:
+        session.execute(insert(RealizedPnlEntry), ledger)
+
+
+def record_transaction(session: Session, t: Transaction) -> None:
+    """Учитывает новую сделку (t должна иметь id, т.е. после flush)"""
+    if not is_position_transaction(t):
+        return
+    key = transaction_key(t)
+    ts = _as_utc(t.ts_utc)
+    state = session.get(PositionState, key)
+    if state is not None and (ts, t.id) < (state.last_ts, state.last_tx_id):
+        # Сделка задним числом: повторяем FIFO позиции с ее момента
+        replay_key(session, key, ts, t.id)
+        return
+    if state is None:
+        state = _new_state(key, ts, t.id)
+        session.add(state)
+
+    open_lots = {lot.tx_id: lot for lot in _load_open_lots(session, key)}
+    lots = deque([lot.tx_id, lot.ts_utc, lot.quantity, lot.price] for lot in open_lots.values())
+    ledger: list[dict] = []
+    _apply_transaction(key, state, lots, t, ledger)
+
+    # Синхронизируем сохраненные лоты с результатом
+    remaining = {lot[0]: lot for lot in lots}
+    for tx_id, lot in open_lots.items():
+        if tx_id not in remaining:
+            session.delete(lot)
+        elif remaining[tx_id][2] != lot.quantity:
+            lot.quantity = remaining[tx_id][2]
+            session.add(lot)
+    _insert_rows(session, _lot_rows(key, (lot for lot in lots if lot[0] not in open_lots)), ledger)
+
+
+def replay_key(session: Session, key: PositionKey, from_ts: datetime, from_id: int) -> None:
+    """Повторяет FIFO одной позиции начиная с (from_ts, from_id) включительно.
+
+    Записи журнала до этой точки сохраняются и служат контрольной точкой:
+    остаток каждого лота = исходное количество минус списанное по журналу.
+    """
+    from_ts = _as_utc(from_ts)
+    cutoff = (from_ts, from_id)
+
+    session.execute(ledger_rollback_query(key, from_ts, from_id))
+    session.execute(delete(PositionLot).where(_key_filter(PositionLot, key)))
+
+    consumed = dict(
+        session.exec(
+            select(RealizedPnlEntry.lot_tx_id, func.sum(RealizedPnlEntry.quantity))
+            .where(_key_filter(RealizedPnlEntry, key))
+            .group_by(RealizedPnlEntry.lot_tx_id)
+        ).all()
+    )
+    realized = session.exec(
+        select(func.sum(RealizedPnlEntry.pnl)).where(_key_filter(RealizedPnlEntry, key))
+    ).one()
+
+    txs = _load_key_transactions(session, key)
+    state = session.get(PositionState, key)
+    if not txs:
+        if state is not None:
+            session.delete(state)
+        return
+    first_ts = _as_utc(txs[0].ts_utc)
+    if state is None:
+        state = _new_state(key, first_ts, txs[0].id)
+        session.add(state)
+    state.first_ts = first_ts
+    state.first_tx_id = txs[0].id
+    state.realized = float(realized or 0.0)
+    state.tx_count = 0
+
+    lots: deque = deque()
+    ledger: list[dict] = []
+    for t in txs:
+        ts = _as_utc(t.ts_utc)
+        if (ts, t.id) >= cutoff:
+            _apply_transaction(key, state, lots, t, ledger)
+            continue
+        # До контрольной точки: восстанавливаем остаток лота по журналу
+        if normalize_transaction_type(t.type) in INBOUND_POSITION_TYPES:
+            remaining = float(t.quantity) - float(consumed.get(t.id, 0.0))
+            if remaining > LOT_EPSILON:
+                lots.append([t.id, ts, remaining, float(t.price)])
+        state.tx_count += 1
+        state.last_ts = ts
+        state.last_tx_id = t.id
+    _insert_rows(session, _lot_rows(key, lots), ledger)
+
+
+def replay_keys(
+    session: Session, keys: Iterable[PositionKey], from_ts: datetime, from_id: int
+) -> None:
+    """Повторяет FIFO нескольких позиций (например, при смене монеты сделки)"""
+    for key in dict.fromkeys(keys):
+        replay_key(session, key, from_ts, from_id)
+
+
+def rebuild_lot_state(session: Session) -> int:
+    """Полностью пересчитывает лоты, журнал и состояния по всем сделкам"""
+    session.execute(delete(RealizedPnlEntry))
+    session.execute(delete(PositionLot))
+    session.execute(delete(PositionState))
+    # Контрольные точки as-of и дневные срезы строились по той же истории
+    clear_checkpoints(session)
+    mark_snapshots_dirty(session)
+
+    items = session.exec(transactions_history_query()).all()
+    states: dict[PositionKey, PositionState] = {}
+    lots: dict[PositionKey, deque] = defaultdict(deque)
+    ledger: list[dict] = []
+    applied = 0
+    for t in items:
+        if not is_position_transaction(t):
+            continue
+        key = transaction_key(t)
+        state = states.get(key)
+        if state is None:
+            state = states[key] = _new_state(key, _as_utc(t.ts_utc), t.id)
+            session.add(state)
+        _apply_transaction(key, state, lots[key], t, ledger)
+        applied += 1
+    _insert_rows(
+        session, [row for key, key_lots in lots.items() for row in _lot_rows(key, key_lots)], ledger
+    )
+    return applied
+
+
+def ensure_lot_state(session: Session) -> bool:
+    """Пересчитывает состояние, если оно не совпадает со сделками в БД.
+
+    Сверяется число учтенных сделок: так обнаруживаются сделки, записанные
+    в обход сервисного слоя (скрипты восстановления, старые версии).
+    Возвращает True, если был выполнен пересчет.
+    """
+    recorded = session.exec(select(func.sum(PositionState.tx_count))).one() or 0
+    types = session.exec(select(Transaction.type)).all()
+    expected = sum(
+        1
+        for tx_type in types
+        if normalize_transaction_type(tx_type) in INBOUND_POSITION_TYPES
+        or normalize_transaction_type(tx_type) in OUTBOUND_POSITION_TYPES
+    )
+    if recorded == expected:
+        return False
+    rebuild_lot_state(session)
+    session.commit()
+    return True
+
+
+def read_positions(session: Session) -> list[dict]:
+    """Позиции по сохраненному состоянию (формат positions_fifo)"""
+    states = session.exec(
+        select(PositionState).order_by(PositionState.first_ts.asc(), PositionState.first_tx_id.asc())
+    ).all()
+    lots_by_key: dict[PositionKey, list[PositionLot]] = defaultdict(list)
+    for lot in session.exec(
+        select(PositionLot).order_by(PositionLot.ts_utc.asc(), PositionLot.tx_id.asc())
+    ).all():
+        lots_by_key[(lot.coin, lot.strategy)].append(lot)
+
+    positions = []
+    for state in states:
+        key = (state.coin, state.strategy)
+        queue = lots_by_key.get(key, [])
+        qty = sum(lot.quantity for lot in queue)
+        cost = sum(lot.quantity * lot.price for lot in queue)
+        avg = (cost / qty) if qty > 0 else 0.0
+        positions.append(
+            {
+                "key": f"{state.coin}:{state.strategy}",
+                "coin": state.coin,
+                "strategy": state.strategy,
+                "quantity": round(qty, 8),
+                "avg_cost": round(avg, 8),
+                "cost_basis": round(cost, 2),
+                "realized": round(state.realized, 2),
+            }
+        )
+    return positions
+
+
+def read_closed_lot_stats(session: Session, strategies: Iterable[str]) -> dict[str, dict]:
+    """Сводка закрытых лотов по стратегиям из журнала реализованного P&L.
+
+    Каждая запись журнала — закрытая часть лота: срок удержания от покупки
+    до продажи и P&L. Агрегация выполняется одним запросом GROUP BY.
+    """
+    strategies = list(strategies)
+    if not strategies:
+        return {}
+    pnl = RealizedPnlEntry.pnl
+    hold_days = func.julianday(RealizedPnlEntry.sell_ts) - func.julianday(RealizedPnlEntry.lot_ts)
+    rows = session.exec(
+        select(
+            RealizedPnlEntry.strategy,
+            func.count(),
+            func.sum(case((pnl > 0, 1), else_=0)),
+            func.sum(case((pnl < 0, 1), else_=0)),
+            func.sum(case((pnl > 0, pnl), else_=0.0)),
+            func.sum(case((pnl < 0, pnl), else_=0.0)),
+            func.avg(hold_days),
+            func.max(hold_days),
+        )
+        .where(RealizedPnlEntry.strategy.in_(strategies))
+        .group_by(RealizedPnlEntry.strategy)
+    ).all()
+    return {
+        strategy: {
+            "closed_lots": count,
+            "wins": wins,
+            "losses": losses,
+            "gross_profit": gross_profit,
+            "gross_loss": gross_loss,
+            "avg_hold_days": avg_hold,
+            "max_hold_days": max_hold,
+        }
+        for strategy, count, wins, losses, gross_profit, gross_loss, avg_hold, max_hold in rows
+    }
+
+
+def list_realized_entries(
+    session: Session, key: Optional[PositionKey] = None
+) -> list[RealizedPnlEntry]:
+    """Записи журнала реализованного P&L (по позиции или все)"""
+    query = select(RealizedPnlEntry)
+    if key is not None:
+        query = query.where(_key_filter(RealizedPnlEntry, key))
+    query = query.order_by(RealizedPnlEntry.sell_ts.asc(), RealizedPnlEntry.sell_tx_id.asc(), RealizedPnlEntry.id.asc())
+    return session.exec(query).all()
@@ -1,22 +1,36 @@
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from typing import Optional
 
 from pydantic import BaseModel
+from sqlalchemy import Index, UniqueConstraint, func
 from sqlmodel import Field, SQLModel
 
 
 class Transaction(SQLModel, table=True):
+    __table_args__ = (
+        # Выборки сделок позиции в хронологическом порядке
+        Index("ix_transaction_coin_strategy_ts", "coin", "strategy", "ts_utc"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     coin: str
     type: str  # trade_buy/trade_sell/transfer_in/transfer_out/fiat_deposit/fiat_withdrawal/income_.../expense_...
     quantity: float
     price: float
-    ts_utc: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    ts_utc: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
     strategy: str  # long_term/swing/scalp/arbitrage/hedge/income_hold
-    source: Optional[str] = None
+    source: Optional[str] = Field(default=None, index=True)
     notes: Optional[str] = None
 
 
+# Монета сделок хранится как введена, а движок лотов ищет по upper(coin)
+Index(
+    "ix_transaction_upper_coin_ts",
+    func.upper(Transaction.__table__.c.coin),
+    Transaction.__table__.c.ts_utc,
+)
+
+
 class TransactionIn(BaseModel):
     coin: str
     type: str
@@ -27,6 +41,61 @@ class TransactionIn(BaseModel):
     notes: Optional[str] = None
 
 
+class PositionLot(SQLModel, table=True):
+    """Открытый лот позиции (остаток входящей сделки) для FIFO-учета."""
+    __table_args__ = (Index("ix_positionlot_key", "coin", "strategy", "ts_utc", "tx_id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    coin: str
+    strategy: str
+    tx_id: int = Field(index=True)  # входящая сделка, породившая лот
+    ts_utc: datetime
+    quantity: float  # оставшееся количество
+    price: float
+
+
+class RealizedPnlEntry(SQLModel, table=True):
+    """Журнал реализованного P&L: списание части лота исходящей сделкой."""
+    __table_args__ = (
+        Index("ix_realizedpnlentry_key", "coin", "strategy", "sell_ts", "sell_tx_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    coin: str
+    strategy: str
+    sell_tx_id: int = Field(index=True)
+    sell_ts: datetime
+    lot_tx_id: int = Field(index=True)
+    lot_ts: datetime
+    quantity: float
+    buy_price: float
+    sell_price: float
+    pnl: float
+
+
+class PositionState(SQLModel, table=True):
+    """Сводное состояние позиции (монета + стратегия) для инкрементального FIFO."""
+    coin: str = Field(primary_key=True)
+    strategy: str = Field(primary_key=True)
+    realized: float = 0.0
+    tx_count: int = 0
+    first_ts: datetime
+    first_tx_id: int
+    last_ts: datetime  # последняя учтенная сделка (граница инкрементального применения)
+    last_tx_id: int
+
+
+class PositionCheckpoint(SQLModel, table=True):
+    """Контрольная точка FIFO-лотов всех позиций для восстановления портфеля на дату."""
+    __table_args__ = (Index("ix_positioncheckpoint_ts_tx", "ts_utc", "tx_id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    ts_utc: datetime  # учтены все сделки до (ts_utc, tx_id) включительно
+    tx_id: int
+    tx_count: int
+    state: str  # JSON: [[coin, strategy, realized, [[qty, price], ...]], ...]
+
+
 class SourceMeta(SQLModel, table=True):
     """Персистентные настройки источников (название/порядок/скрыт)."""
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -49,6 +118,71 @@ class PriceAlert(SQLModel, table=True):
     notes: Optional[str] = None
 
 
+class PriceStore(SQLModel, table=True):
+    """Последние известные цены монет (кэш цен, переживающий перезапуск)."""
+    __table_args__ = (UniqueConstraint("coin", "quote"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    coin: str
+    quote: str
+    price: float
+    source: str
+    ttl: int
+    fetched_at: datetime
+
+
+class PriceCandle(SQLModel, table=True):
+    """Исторические свечи (OHLC) монеты в валюте котировки.
+
+    Таблица WITHOUT ROWID: строки хранятся прямо в B-дереве первичного
+    ключа (coin, quote, interval, ts), поэтому он же служит покрывающим
+    индексом для выборок диапазона по монете, валюте и времени.
+    """
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    coin: str = Field(primary_key=True)
+    quote: str = Field(primary_key=True)
+    interval: str = Field(primary_key=True)  # "1h" / "1d"
+    ts: int = Field(primary_key=True)  # начало свечи, unix time UTC (секунды)
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float = 0.0
+
+
+class DailySnapshot(SQLModel, table=True):
+    """Дневной срез позиции (монета + стратегия) или его свертки.
+
+    strategy="*" — свертка монеты по стратегиям, coin="*" — свертка
+    стратегии по монетам, ("*", "*") — весь портфель. Таблица WITHOUT
+    ROWID: ряд одной позиции или свертки читается диапазоном первичного
+    ключа (coin, strategy, day).
+    """
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    coin: str = Field(primary_key=True)
+    strategy: str = Field(primary_key=True)
+    day: date = Field(primary_key=True)  # день UTC
+    quantity: float = 0.0  # остаток на конец дня (0 в свертках по монетам)
+    invested: float = 0.0  # вложенный капитал нарастающим итогом: покупки - продажи
+    bought: float = 0.0  # покупки и поступления за день
+    sold: float = 0.0  # продажи и выбытия за день
+    realized_pnl: float = 0.0  # реализованный P&L за день (FIFO)
+    realized_total: float = 0.0  # реализованный P&L нарастающим итогом
+    close_price: float = 0.0  # цена на конец дня (0 в свертках по монетам)
+    value: float = 0.0  # стоимость на конец дня
+    tx_count: int = 0  # сделок за день
+
+
+class DailySnapshotState(SQLModel, table=True):
+    """Граница актуальности DailySnapshot (одна строка, id=1)."""
+    id: int = Field(default=1, primary_key=True)
+    built_through: Optional[date] = None  # последний пересчитанный день
+    dirty_from: Optional[date] = None  # первый день, измененный после пересчета
+    version: int = 0  # счетчик отметок: пересчет снимает только увиденную отметку
+
+
 class PriceAlertIn(BaseModel):
     """Входящие данные для создания алерта."""
     coin: str
@@ -0,0 +1,160 @@
+"""
+Восстановление портфеля на дату (as-of) по контрольным точкам FIFO-лотов
+
+Контрольная точка хранит открытые лоты и реализованный P&L всех позиций
+после очередных CHECKPOINT_INTERVAL сделок. Запрос на дату берет ближайшую
+точку не позже этой даты и повторяет только сделки между ней и датой
+(выборка по индексу Transaction.ts_utc), поэтому время ответа не зависит
+от длины истории. Точки создаются лениво во время таких повторов и
+удаляются, когда сделка задним числом меняет историю после них.
+"""
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Hashable, List, Optional
+
+from sqlalchemy import delete, tuple_
+from sqlmodel import Session, select
+
+from app.core.cost_basis import FifoBook, book_to_position
+from app.core.models import PositionCheckpoint, Transaction
+from app.core.taxonomy import (
+    INBOUND_POSITION_TYPES,
+    OUTBOUND_POSITION_TYPES,
+    normalize_strategy,
+    normalize_transaction_type,
+)
+
+# Через сколько сделок сохранять контрольную точку
+CHECKPOINT_INTERVAL = int(os.getenv("POSITION_CHECKPOINT_INTERVAL", "250"))
+
+
+def _to_utc(value: Any) -> datetime:
+    """Приводит момент (datetime, date или ISO-строку) к aware UTC"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if not isinstance(value, datetime):
+        # Дата без времени означает конец дня
+        value = datetime(value.year, value.month, value.day, 23, 59, 59, 999999)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _dump_books(books: Dict[Hashable, FifoBook]) -> str:
+    return json.dumps(
+        [[coin, strat, book.realized, list(book.lots)] for (coin, strat), book in books.items()]
+    )
+
+
+def _load_books(state: str) -> Dict[Hashable, FifoBook]:
+    books = {}
+    for coin, strat, realized, lots in json.loads(state):
+        book = FifoBook()
+        book.realized = realized
+        book.lots.extend([qty, price] for qty, price in lots)
+        books[(coin, strat)] = book
+    return books
+
+
+def nearest_checkpoint_query(ts: datetime):
+    """Запрос ближайшей контрольной точки не позже ts"""
+    return (
+        select(PositionCheckpoint)
+        .where(PositionCheckpoint.ts_utc <= ts)
+        .order_by(PositionCheckpoint.ts_utc.desc(), PositionCheckpoint.tx_id.desc())
+        .limit(1)
+    )
+
+
+def as_of_replay_query(ts: datetime, after: Optional[tuple] = None):
+    """Запрос сделок до ts включительно после ключа (ts_utc, id) контрольной точки"""
+    query = select(
+        Transaction.id,
+        Transaction.ts_utc,
+        Transaction.coin,
+        Transaction.strategy,
+        Transaction.type,
+        Transaction.quantity,
+        Transaction.price,
+    ).where(Transaction.ts_utc <= ts)
+    if after is not None:
+        # Сравнение пар (ts_utc, id) выполняется одним диапазоном по индексу
+        query = query.where(tuple_(Transaction.ts_utc, Transaction.id) > tuple_(*after))
+    return query.order_by(Transaction.ts_utc.asc(), Transaction.id.asc())
+
+
+def _nearest_checkpoint(session: Session, ts: datetime) -> Optional[PositionCheckpoint]:
+    return session.exec(nearest_checkpoint_query(ts)).first()
+
+
+def invalidate_checkpoints(session: Session, since: datetime) -> None:
+    """Удаляет контрольные точки, на которые влияет сделка в момент since"""
+    session.execute(delete(PositionCheckpoint).where(PositionCheckpoint.ts_utc >= _to_utc(since)))
+
+
+def clear_checkpoints(session: Session) -> None:
+    """Удаляет все контрольные точки (например, после полного пересчета)"""
+    session.execute(delete(PositionCheckpoint))
+
+
+def positions_as_of_session(session: Session, ts: Any) -> List[dict]:
+    """positions_as_of в рамках переданной сессии.
+
+    Созданные по пути контрольные точки только добавляются в сессию:
+    commit остается за вызывающим (вместе с его собственными изменениями).
+    """
+    ts = _to_utc(ts)
+    checkpoint = _nearest_checkpoint(session, ts)
+    books = _load_books(checkpoint.state) if checkpoint else {}
+    tx_count = checkpoint.tx_count if checkpoint else 0
+
+    after = (checkpoint.ts_utc, checkpoint.tx_id) if checkpoint else None
+    rows = session.exec(as_of_replay_query(ts, after)).all()
+
+    # Направление и ключ позиции считаются один раз на уникальное значение
+    directions: Dict[str, int] = {}
+    keys: Dict[tuple, tuple] = {}
+    for replayed, row in enumerate(rows, start=1):
+        direction = directions.get(row.type)
+        if direction is None:
+            tx_type = normalize_transaction_type(row.type)
+            direction = directions[row.type] = (
+                1 if tx_type in INBOUND_POSITION_TYPES else -1 if tx_type in OUTBOUND_POSITION_TYPES else 0
+            )
+        if direction:
+            key = keys.get((row.coin, row.strategy))
+            if key is None:
+                key = keys[(row.coin, row.strategy)] = (row.coin.upper(), normalize_strategy(row.strategy))
+            book = books.get(key)
+            if book is None:
+                book = books[key] = FifoBook()
+            if direction > 0:
+                book.add(float(row.quantity), float(row.price))
+            else:
+                book.remove(float(row.quantity), float(row.price))
+        tx_count += 1
+        if replayed % CHECKPOINT_INTERVAL == 0:
+            session.add(
+                PositionCheckpoint(
+                    ts_utc=row.ts_utc,
+                    tx_id=row.id,
+                    tx_count=tx_count,
+                    state=_dump_books(books),
+                )
+            )
+    return [book_to_position(key, book) for key, book in books.items()]
+
+
+def positions_as_of(ts: Any) -> List[dict]:
+    """Позиции портфеля (формат positions_fifo) с учетом сделок до момента ts включительно"""
+    from app.storage.db import engine
+
+    with Session(engine) as session:
+        positions = positions_as_of_session(session, ts)
+        try:
+            # Сохраняем новые контрольные точки; ошибка записи не мешает ответу
+            session.commit()
+        except Exception as e:
+            print(f"Ошибка сохранения контрольных точек: {e}")
+        return positions
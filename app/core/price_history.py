@@ -0,0 +1,235 @@
+"""
+Склад исторических цен: загрузка свечей (backfill) и выборка временных рядов
+"""
+import csv
+import json
+import os
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.core.cache import invalidate_price_cache
+from app.core.daily_snapshots import invalidate_daily_snapshots
+from app.storage.db import DB_PATH
+from app.storage.price_history import get_candle_coverage, load_candles, upsert_candles
+
+# Поддерживаемые интервалы свечей (длительность в секундах)
+INTERVALS = {"1h": 3600, "1d": 86400}
+
+# Каталог файлов-фикстур для офлайн-загрузки свечей
+PRICE_FIXTURES_DIR = os.path.join(os.path.dirname(DB_PATH), "price_history")
+
+# Сколько свечей до начала периода подгружать для заполнения пропусков
+FFILL_LOOKBACK = 7
+
+CANDLE_FIELDS = ("open", "high", "low", "close", "volume")
+
+
+def _to_ts(value: Any) -> int:
+    """Приводит дату/время к unix time в секундах (UTC).
+
+    Принимает datetime/date, ISO-строку или число (секунды или миллисекунды).
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    if isinstance(value, date):
+        return int(datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp())
+    if isinstance(value, (int, float)):
+        # Значения больше ~2286 года в секундах считаем миллисекундами
+        return int(value / 1000) if value > 1e11 else int(value)
+    text = str(value).strip()
+    if text.replace(".", "", 1).isdigit():
+        return _to_ts(float(text))
+    return _to_ts(datetime.fromisoformat(text.replace("Z", "+00:00")))
+
+
+def _check_interval(interval: str) -> int:
+    if interval not in INTERVALS:
+        raise ValueError(f"interval must be one of {list(INTERVALS)}")
+    return INTERVALS[interval]
+
+
+def _align(ts: int, step: int) -> int:
+    """Начало свечи, в которую попадает ts"""
+    return ts - ts % step
+
+
+def candles_from_points(
+    coin: str, points: List[tuple], interval: str = "1d", quote: str = "USD"
+) -> List[Dict[str, Any]]:
+    """Агрегирует точки (ts, цена[, объем]) в свечи OHLC заданного интервала."""
+    step = _check_interval(interval)
+    if not points:
+        return []
+    arr = np.asarray([(p[0], p[1], p[2] if len(p) > 2 else 0.0) for p in points], dtype=float)
+    ts = np.array([_to_ts(v) for v in arr[:, 0]], dtype=np.int64)
+    df = pd.DataFrame({"bucket": ts - ts % step, "ts": ts, "price": arr[:, 1], "volume": arr[:, 2]})
+    df = df.sort_values("ts", kind="stable")
+    grouped = df.groupby("bucket", sort=True)
+    ohlc = grouped["price"].agg(["first", "max", "min", "last"])
+    volume = grouped["volume"].last()
+    return [
+        {
+            "coin": coin.upper(),
+            "quote": quote.lower(),
+            "interval": interval,
+            "ts": int(bucket),
+            "open": float(row["first"]),
+            "high": float(row["max"]),
+            "low": float(row["min"]),
+            "close": float(row["last"]),
+            "volume": float(volume.loc[bucket]),
+        }
+        for bucket, row in ohlc.iterrows()
+    ]
+
+
+def _normalize_candle(item: Dict[str, Any], interval: str, quote: str) -> Dict[str, Any]:
+    """Приводит строку фикстуры к формату таблицы PriceCandle"""
+    row_interval = item.get("interval") or interval
+    step = _check_interval(row_interval)
+    close = float(item["close"])
+    return {
+        "coin": str(item["coin"]).upper(),
+        "quote": str(item.get("quote") or quote).lower(),
+        "interval": row_interval,
+        "ts": _align(_to_ts(item["ts"]), step),
+        "open": float(item.get("open") or close),
+        "high": float(item.get("high") or close),
+        "low": float(item.get("low") or close),
+        "close": close,
+        "volume": float(item.get("volume") or 0.0),
+    }
+
+
+def backfill_from_file(path: str, interval: str = "1d", quote: str = "USD") -> int:
+    """Загружает свечи из CSV или JSON файла.
+
+    Колонки/ключи: coin, ts, close и необязательные quote, interval, open,
+    high, low, volume. Значения interval/quote по умолчанию берутся из
+    аргументов.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith(".json"):
+            items = json.load(f)
+        else:
+            items = list(csv.DictReader(f))
+    rows = [_normalize_candle(item, interval, quote) for item in items]
+    loaded = upsert_candles(rows)
+    invalidate_price_cache({row["coin"] for row in rows})
+    if rows:
+        invalidate_daily_snapshots(datetime.fromtimestamp(min(row["ts"] for row in rows), timezone.utc))
+    return loaded
+
+
+def backfill_from_fixtures(directory: Optional[str] = None) -> Dict[str, int]:
+    """Загружает все CSV/JSON фикстуры из каталога (офлайн backfill)"""
+    directory = directory or PRICE_FIXTURES_DIR
+    if not os.path.isdir(directory):
+        return {}
+    loaded = {}
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith((".csv", ".json")):
+            loaded[name] = backfill_from_file(os.path.join(directory, name))
+    return loaded
+
+
+def backfill_from_coingecko(
+    coins: List[str],
+    start: Any,
+    end: Any = None,
+    interval: str = "1d",
+    quote: str = "USD",
+) -> Dict[str, int]:
+    """Догружает свечи из CoinGecko, начиная с последней сохраненной свечи."""
+    from app.adapters.prices import get_market_chart
+
+    step = _check_interval(interval)
+    start_ts = _align(_to_ts(start), step)
+    end_ts = _to_ts(end) if end is not None else int(datetime.now(timezone.utc).timestamp())
+    coverage = get_candle_coverage(quote.lower(), interval)
+
+    loaded = {}
+    earliest = end_ts
+    for coin in dict.fromkeys(c.upper() for c in coins):
+        coin_start = start_ts
+        if coin in coverage and coverage[coin][0] <= start_ts:
+            # Последнюю свечу перезагружаем: она могла быть неполной
+            coin_start = max(start_ts, coverage[coin][1])
+        if coin_start >= end_ts:
+            loaded[coin] = 0
+            continue
+        try:
+            points = get_market_chart(coin, coin_start, end_ts, quote)
+        except Exception as e:
+            print(f"Ошибка загрузки истории цен {coin}: {e}")
+            loaded[coin] = 0
+            continue
+        loaded[coin] = upsert_candles(candles_from_points(coin, points, interval, quote))
+        if loaded[coin]:
+            earliest = min(earliest, coin_start)
+    invalidate_price_cache([coin for coin, count in loaded.items() if count])
+    if earliest < end_ts:
+        invalidate_daily_snapshots(datetime.fromtimestamp(earliest, timezone.utc))
+    return loaded
+
+
+def get_price_series(
+    coins: List[str],
+    start: Any,
+    end: Any,
+    interval: str = "1d",
+    quote: str = "USD",
+    field: str = "close",
+    fill: bool = True,
+) -> pd.DataFrame:
+    """Возвращает матрицу цен: строки — свечи периода, колонки — монеты.
+
+    Все монеты читаются одним запросом по первичному ключу. При fill=True
+    пропуски заполняются последним известным значением (в том числе
+    свечой, предшествующей началу периода).
+    """
+    if field not in CANDLE_FIELDS:
+        raise ValueError(f"field must be one of {CANDLE_FIELDS}")
+    step = _check_interval(interval)
+    coins = list(dict.fromkeys(c.upper() for c in coins))
+    start_ts = _align(_to_ts(start), step)
+    end_ts = _to_ts(end)
+    grid = np.arange(start_ts, end_ts + 1, step, dtype=np.int64)
+
+    lookback_ts = start_ts - FFILL_LOOKBACK * step if fill else start_ts
+    rows = load_candles(coins, quote.lower(), interval, lookback_ts, end_ts, (field,))
+    if rows:
+        df = pd.DataFrame(rows, columns=["coin", "ts", field])
+        wide = df.pivot(index="ts", columns="coin", values=field)
+    else:
+        wide = pd.DataFrame(dtype=float)
+
+    if fill:
+        full_index = np.union1d(wide.index.to_numpy(dtype=np.int64), grid)
+        wide = wide.reindex(full_index).ffill()
+    wide = wide.reindex(index=grid, columns=coins).astype(float)
+    wide.index = pd.to_datetime(wide.index, unit="s", utc=True)
+    wide.index.name = "ts"
+    wide.columns.name = "coin"
+    return wide
+
+
+def get_price_at(
+    coins: List[str], moments: List[Any], interval: str = "1d", quote: str = "USD"
+) -> pd.DataFrame:
+    """Цены закрытия монет на заданные моменты (последняя свеча не позже момента)."""
+    if not moments:
+        return pd.DataFrame(columns=[c.upper() for c in coins], dtype=float)
+    ts = np.array([_to_ts(m) for m in moments], dtype=np.int64)
+    series = get_price_series(coins, int(ts.min()), int(ts.max()), interval, quote)
+    grid = series.index.as_unit("s").asi8
+    step = INTERVALS[interval]
+    positions = np.clip(np.searchsorted(grid, ts - ts % step, side="right") - 1, 0, len(grid) - 1)
+    result = series.iloc[positions]
+    result.index = pd.to_datetime(ts, unit="s", utc=True)
+    return result
@@ -0,0 +1,147 @@
+"""
+Доходность, взвешенная по времени (TWR) и по деньгам (XIRR)
+
+TWR — произведение дневных доходностей кривой капитала (оценки на конец
+каждого дня, потоки исключены). XIRR — годовая ставка, при которой
+дисконтированная сумма потоков периода равна нулю: стоимость на начало
+(взнос), дневные покупки/продажи и стоимость на конец (получение).
+Уравнение решается для всех групп сразу векторным методом Ньютона с
+защитой бисекцией.
+
+Результаты периода кэшируются по его границам (дням), поэтому повторное
+обновление дашборда в тот же день не пересчитывает неизменившиеся периоды.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+from app.core.analytics import ROI_PERIODS, TransactionSnapshot
+from app.core.cache import TAG_PRICES, TAG_TRANSACTIONS, cache_manager
+from app.core.equity_curve import CURVE_GROUPINGS, DAYS_PER_YEAR, get_group_curves
+
+# Периоды доходности: ROI_PERIODS и вся история
+RETURN_PERIODS = (*ROI_PERIODS, "all")
+# Сколько секунд хранить результаты периодов
+RETURNS_CACHE_TTL = 3600
+# Границы поиска для x = ln(1 + r): r от -99.995% до e^10 - 1
+XIRR_BOUNDS = (-10.0, 10.0)
+
+
+def xirr(cash_flows: Any, years: Any, tol: float = 1e-10, max_iter: int = 100) -> np.ndarray:
+    """Годовая ставка XIRR для каждой строки cash_flows.
+
+    cash_flows — матрица (группы × моменты), знак с точки зрения инвестора
+    (взнос < 0, получение > 0); years — моменты в годах от начала. Если у
+    потоков строки нет корня в допустимых границах, возвращается NaN.
+    """
+    flows = np.atleast_2d(np.asarray(cash_flows, dtype=float))
+    years = np.asarray(years, dtype=float)
+
+    def npv(x: np.ndarray):
+        discounted = flows * np.exp(-np.outer(x, years))
+        return discounted.sum(axis=1), -(discounted * years).sum(axis=1)
+
+    lo = np.full(len(flows), XIRR_BOUNDS[0])
+    hi = np.full(len(flows), XIRR_BOUNDS[1])
+    f_lo, _ = npv(lo)
+    f_hi, _ = npv(hi)
+    solvable = np.sign(f_lo) * np.sign(f_hi) < 0
+
+    x = np.zeros(len(flows))
+    for _ in range(max_iter):
+        f, df = npv(x)
+        # Сужаем скобку: x заменяет границу с тем же знаком NPV
+        on_lo_side = np.sign(f) == np.sign(f_lo)
+        lo = np.where(on_lo_side, x, lo)
+        hi = np.where(on_lo_side, hi, x)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = x - f / df
+        # Шаг Ньютона вне скобки — берем середину
+        inside = np.isfinite(newton) & (newton > lo) & (newton < hi)
+        next_x = np.where(inside, newton, (lo + hi) / 2)
+        converged = np.abs(next_x - x) < tol
+        x = next_x
+        if np.all(converged | ~solvable):
+            break
+    return np.where(solvable, np.expm1(x), np.nan)
+
+
+def _period_returns(curves: Dict[str, Any], start: int, end: int) -> Dict[str, Dict[str, Any]]:
+    """TWR и XIRR по группам за дни [start, end] (индексы строк кривых)"""
+    values, flows = curves["value"], curves["flow"]
+    base = values[start - 1] if start > 0 else np.zeros(values.shape[1])
+    n_days = end - start + 1
+
+    # TWR: до первой оценки (NaN) доходность нулевая
+    twr = np.prod(1.0 + np.nan_to_num(curves["return"][start:end + 1]), axis=0) - 1.0
+
+    # Потоки инвестора: стоимость на начало и покупки — взнос, продажи и
+    # стоимость на конец — получение
+    cash_flows = np.hstack([-base[:, None], -flows[start:end + 1].T])
+    cash_flows[:, -1] += values[end]
+    years = np.arange(n_days + 1) / DAYS_PER_YEAR
+    active = np.any(cash_flows != 0, axis=1)
+    rates = np.full(len(base), np.nan)
+    if active.any():
+        rates[active] = xirr(cash_flows[active], years)
+
+    days = curves["days"]
+    result = {}
+    for i, label in enumerate(curves["labels"]):
+        if not active[i]:
+            continue
+        rate = float(rates[i])
+        result[label] = {
+            'start': datetime.fromtimestamp(int(days[start]) * 86_400, timezone.utc).date().isoformat(),
+            'end': datetime.fromtimestamp(int(days[end]) * 86_400, timezone.utc).date().isoformat(),
+            'days': n_days,
+            'start_value': float(base[i]),
+            'end_value': float(values[end, i]),
+            'net_flow': float(flows[start:end + 1, i].sum()),
+            'twr_percent': float(twr[i] * 100),
+            'twr_annualized_percent': float(((1 + twr[i]) ** (DAYS_PER_YEAR / n_days) - 1) * 100) if twr[i] > -1 else -100.0,
+            # XIRR — годовая ставка, MWR — та же ставка за длину периода
+            'xirr_percent': rate * 100 if np.isfinite(rate) else None,
+            'mwr_percent': ((1 + rate) ** (n_days / DAYS_PER_YEAR) - 1) * 100 if np.isfinite(rate) else None,
+        }
+    return result
+
+
+def calculate_returns(
+    by: str = "portfolio",
+    periods: Iterable[str] = RETURN_PERIODS,
+    quote: str = "USD",
+    now: Optional[datetime] = None,
+    snapshot: Optional[TransactionSnapshot] = None,
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """TWR и XIRR по периодам: {период: {группа: метрики}}.
+
+    by — portfolio, coin или strategy. Период заканчивается текущим днем
+    (UTC); '7d' — последние 7 дневных доходностей, 'all' — вся история.
+    """
+    if by not in CURVE_GROUPINGS:
+        raise ValueError(f"by must be one of {CURVE_GROUPINGS}")
+    now = now or datetime.now(timezone.utc)
+    end_day = int(now.timestamp() // 86_400)
+    # Периоды считаются по кривым, прочитанным не раньше этих поколений
+    generations = cache_manager.generations((TAG_TRANSACTIONS, TAG_PRICES))
+    curves = get_group_curves(by, quote, end_day, snapshot)
+    if not len(curves["days"]):
+        return {}
+
+    end = len(curves["days"]) - 1
+    result = {}
+    for period in periods:
+        length = ROI_PERIODS[period].days if period != "all" else len(curves["days"])
+        start = max(0, end - length + 1)
+        key = f"returns:{by}:{quote}:{int(curves['days'][start])}:{int(curves['days'][end])}"
+        period_result = cache_manager.get(key)
+        if period_result is None:
+            period_result = _period_returns(curves, start, end)
+            cache_manager.set(
+                key, period_result, ttl=RETURNS_CACHE_TTL,
+                tags=(TAG_TRANSACTIONS, TAG_PRICES), tag_generations=generations,
+            )
+        result[period] = period_result
+    return result
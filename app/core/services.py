@@ -1,18 +1,21 @@
 import datetime as dt
 import os
-import shutil
+import sqlite3
 import time
-from collections import defaultdict, deque
 import json
 
+from sqlalchemy import func, insert, tuple_
 from sqlmodel import Session, select
 
 from app.core.models import Transaction, TransactionIn, SourceMeta, PriceAlert, PriceAlertIn
-from app.storage.db import DB_PATH, engine
+from app.storage.db import DB_PATH, engine, retry_on_busy
 from app.core.cache import (
+    SOURCES_CACHE_TAGS,
+    TAG_PRICES,
+    TAG_TRANSACTIONS,
+    TRANSACTIONS_CACHE_TAGS,
+    cache_manager,
     cached,
-    cache_portfolio_stats,
-    get_cached_portfolio_stats,
     cache_transactions,
     get_cached_transactions,
     cache_sources,
@@ -21,40 +24,211 @@ from app.core.cache import (
     get_cached_price_alerts,
     invalidate_data_cache,
 )
+from app.core.cost_basis import positions_by_method
+from app.core.lot_engine import (
+    _as_utc,
+    is_position_transaction,
+    read_positions,
+    record_transaction,
+    replay_key,
+    replay_keys,
+    transaction_key,
+    transactions_history_query,
+)
+from app.core.positions_history import invalidate_checkpoints, positions_as_of
+from app.core.daily_snapshots import mark_snapshots_dirty
 from app.core.taxonomy import (
-    INBOUND_POSITION_TYPES,
-    OUTBOUND_POSITION_TYPES,
     TYPE_META,
     STRATEGY_META,
+    TYPE_ALIASES,
+    STRATEGY_ALIASES,
+    INBOUND_POSITION_TYPES,
+    OUTBOUND_POSITION_TYPES,
     normalize_transaction_type,
     normalize_strategy,
 )
 
 CURRENCY = os.getenv("REPORT_CURRENCY", "USD").upper()
+# Размер пачки строк на одну транзакцию БД при массовом импорте
+BULK_INSERT_CHUNK_SIZE = int(os.getenv("BULK_INSERT_CHUNK_SIZE", "2000"))
 
 
-def add_transaction(data: TransactionIn) -> int:
+def _validate_transaction_input(data: TransactionIn) -> None:
     if not data.coin:
         raise ValueError("coin is required")
     if data.quantity <= 0:
         raise ValueError("quantity must be > 0")
     if data.price < 0:
         raise ValueError("price must be >= 0")
+
+
+def add_transaction_in_session(session: Session, data: TransactionIn) -> Transaction:
+    """Добавляет сделку и обновляет лоты в рамках сессии (без commit)"""
+    _validate_transaction_input(data)
+    tx_data = data.model_dump()
+    tx_data["type"] = normalize_transaction_type(tx_data.get("type"))
+    tx_data["strategy"] = normalize_strategy(tx_data.get("strategy"))
+    t = Transaction(**tx_data)
+    session.add(t)
+    session.flush()
+    record_transaction(session, t)
+    invalidate_checkpoints(session, t.ts_utc)
+    mark_snapshots_dirty(session, t.ts_utc)
+    return t
+
+
+def update_transaction_in_session(session: Session, tx_id: int, data: TransactionIn) -> set[str]:
+    """Изменяет сделку и пересчитывает лоты в рамках сессии (без commit).
+
+    Возвращает стратегии до и после изменения (пустое множество — сделки нет).
+    """
+    t = session.get(Transaction, tx_id)
+    if not t:
+        return set()
+    old_strategy = t.strategy
+    old_key = transaction_key(t) if is_position_transaction(t) else None
+    t.coin = data.coin
+    t.type = normalize_transaction_type(data.type)
+    t.quantity = data.quantity
+    t.price = data.price
+    t.strategy = normalize_strategy(data.strategy)
+    t.source = data.source
+    t.notes = data.notes
+    session.add(t)
+    session.flush()
+    # Пересчитываем лоты затронутых позиций начиная с этой сделки
+    keys = [old_key] if old_key else []
+    if is_position_transaction(t):
+        keys.append(transaction_key(t))
+    replay_keys(session, keys, t.ts_utc, t.id)
+    invalidate_checkpoints(session, t.ts_utc)
+    mark_snapshots_dirty(session, t.ts_utc)
+    return {old_strategy, t.strategy}
+
+
+def delete_transaction_in_session(session: Session, tx_id: int) -> set[str]:
+    """Удаляет сделку и пересчитывает лоты в рамках сессии (без commit).
+
+    Возвращает стратегию удаленной сделки (пустое множество — сделки нет).
+    """
+    t = session.get(Transaction, tx_id)
+    if not t:
+        return set()
+    strategy = t.strategy
+    key = transaction_key(t) if is_position_transaction(t) else None
+    ts_utc, t_id = t.ts_utc, t.id
+    session.delete(t)
+    session.flush()
+    if key:
+        replay_key(session, key, ts_utc, t_id)
+    invalidate_checkpoints(session, ts_utc)
+    mark_snapshots_dirty(session, ts_utc)
+    return {strategy}
+
+
+@retry_on_busy
+def add_transaction(data: TransactionIn) -> int:
     with Session(engine) as session:
-        tx_data = data.model_dump()
-        tx_data["type"] = normalize_transaction_type(tx_data.get("type"))
-        tx_data["strategy"] = normalize_strategy(tx_data.get("strategy"))
-        t = Transaction(**tx_data)
-        session.add(t)
+        t = add_transaction_in_session(session, data)
         session.commit()
         session.refresh(t)
         
         # Инвалидируем кэш после добавления транзакции
-        invalidate_data_cache()
+        invalidate_data_cache({t.strategy})
         
         return t.id
 
 
+@retry_on_busy
+def _insert_transaction_chunk(rows: list[dict]) -> None:
+    with engine.begin() as connection:
+        connection.execute(insert(Transaction), rows)
+
+
+def _parse_ts_utc(value) -> dt.datetime | None:
+    """ts_utc строки импорта: datetime или ISO-строка (naive считается UTC)"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = dt.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if not isinstance(value, dt.datetime):
+        raise ValueError(f"некорректное время ts_utc: {value!r}")
+    return _as_utc(value)
+
+
+def add_transactions_bulk(rows, chunk_size: int = BULK_INSERT_CHUNK_SIZE) -> dict:
+    """Массовое добавление сделок (импорт выгрузок бирж).
+
+    rows — TransactionIn или словари с полями TransactionIn и необязательным
+    ts_utc (datetime или ISO-строка). Строки проверяются заранее, вставляются
+    executemany пачками по chunk_size в отдельных транзакциях; лоты затронутых позиций пересчитываются
+    один раз с самой ранней новой сделки, кэш сбрасывается один раз в конце.
+    Возвращает число вставленных строк, ошибки по номерам строк и скорость.
+    """
+    started = time.perf_counter()
+    now = dt.datetime.now(dt.timezone.utc)
+    values: list[dict] = []
+    errors: list[str] = []
+    for index, row in enumerate(rows):
+        try:
+            data = row if isinstance(row, TransactionIn) else TransactionIn(**row)
+            _validate_transaction_input(data)
+            ts = _parse_ts_utc(row.get("ts_utc")) if isinstance(row, dict) else None
+        except Exception as e:
+            errors.append(f"Строка {index + 1}: {e}")
+            continue
+        values.append(
+            {
+                "coin": data.coin,
+                "type": normalize_transaction_type(data.type),
+                "quantity": data.quantity,
+                "price": data.price,
+                "ts_utc": ts or now,
+                "strategy": normalize_strategy(data.strategy),
+                "source": data.source,
+                "notes": data.notes,
+            }
+        )
+
+    inserted = 0
+    # Самая ранняя новая сделка каждой позиции: с нее пересчитываются лоты
+    replay_from: dict[tuple[str, str], dt.datetime] = {}
+    try:
+        for start in range(0, len(values), max(1, chunk_size)):
+            chunk = values[start : start + max(1, chunk_size)]
+            _insert_transaction_chunk(chunk)
+            inserted += len(chunk)
+            for value in chunk:
+                if value["type"] in INBOUND_POSITION_TYPES or value["type"] in OUTBOUND_POSITION_TYPES:
+                    key = (value["coin"].upper(), value["strategy"])
+                    if key not in replay_from or value["ts_utc"] < replay_from[key]:
+                        replay_from[key] = value["ts_utc"]
+    except Exception as e:
+        errors.append(f"Ошибка вставки после {inserted} строк: {e}")
+
+    if inserted:
+        try:
+            with Session(engine) as session:
+                for key, ts in replay_from.items():
+                    replay_key(session, key, ts, 0)
+                first_ts = min(value["ts_utc"] for value in values[:inserted])
+                invalidate_checkpoints(session, first_ts)
+                mark_snapshots_dirty(session, first_ts)
+                session.commit()
+        except Exception as e:
+            # Состояние лотов будет сверено и пересчитано при следующем init_db
+            print(f"Ошибка пересчета лотов после импорта: {e}")
+        invalidate_data_cache({value["strategy"] for value in values[:inserted]})
+
+    seconds = time.perf_counter() - started
+    return {
+        "inserted": inserted,
+        "errors": errors,
+        "seconds": seconds,
+        "rows_per_sec": inserted / seconds if seconds > 0 else 0.0,
+    }
+
+
 def get_transaction(tx_id: int) -> dict | None:
     with Session(engine) as session:
         t = session.get(Transaction, tx_id)
@@ -73,28 +247,32 @@ def get_transaction(tx_id: int) -> dict | None:
         }
 
 
+@retry_on_busy
 def update_transaction(tx_id: int, data: TransactionIn) -> None:
     with Session(engine) as session:
-        t = session.get(Transaction, tx_id)
-        if not t:
-            return
-        t.coin = data.coin
-        t.type = normalize_transaction_type(data.type)
-        t.quantity = data.quantity
-        t.price = data.price
-        t.strategy = normalize_strategy(data.strategy)
-        t.source = data.source
-        t.notes = data.notes
-        session.add(t)
-        session.commit()
+        strategies = update_transaction_in_session(session, tx_id, data)
+        if strategies:
+            session.commit()
+    invalidate_data_cache(strategies)
 
 
+@retry_on_busy
 def delete_transaction(tx_id: int) -> None:
     with Session(engine) as session:
-        t = session.get(Transaction, tx_id)
-        if t:
-            session.delete(t)
+        strategies = delete_transaction_in_session(session, tx_id)
+        if strategies:
             session.commit()
+    invalidate_data_cache(strategies)
+
+
+def transactions_list_query():
+    """Запрос списка сделок (новые первыми)"""
+    return select(Transaction).order_by(Transaction.id.desc())
+
+
+def transactions_by_source_query(source: str):
+    """Запрос сделок источника"""
+    return select(Transaction).where(Transaction.source == source)
 
 
 def list_transactions() -> list[dict]:
@@ -103,8 +281,20 @@ def list_transactions() -> list[dict]:
     if cached_result is not None:
         return cached_result
     
+    # Поколения тегов до чтения: запись во время чтения не даст закэшировать старое
+    generations = cache_manager.generations(TRANSACTIONS_CACHE_TAGS)
     with Session(engine) as session:
-        items = session.exec(select(Transaction).order_by(Transaction.id.desc())).all()
+        items = session.exec(transactions_list_query()).all()
+    rows = transaction_rows(items)
+    
+    # Кэшируем результат
+    cache_transactions(rows, tag_generations=generations)
+    
+    return rows
+
+
+def transaction_rows(items) -> list[dict]:
+    """Строки таблицы сделок (формат list_transactions)"""
     rows = []
     for t in items:
         ts_local = dt.datetime.fromtimestamp(t.ts_utc.timestamp())
@@ -121,69 +311,195 @@ def list_transactions() -> list[dict]:
                 "notes": t.notes or "",
             }
         )
-    
-    # Кэшируем результат
-    cache_transactions(rows)
-    
     return rows
 
 
-def positions_fifo() -> list[dict]:
+# Поля сортировки страницы сделок (created_at — имя колонки в таблице UI)
+TRANSACTION_SORT_FIELDS = {
+    "ts_utc": Transaction.ts_utc,
+    "created_at": Transaction.ts_utc,
+    "id": Transaction.id,
+    "coin": Transaction.coin,
+    "type": Transaction.type,
+    "quantity": Transaction.quantity,
+    "price": Transaction.price,
+    "strategy": Transaction.strategy,
+    "source": func.coalesce(Transaction.source, ""),
+}
+
+
+def _with_aliases(value: str, normalize, aliases: dict[str, str]) -> list[str]:
+    """Значение и все его синонимы (в БД могут храниться старые имена)"""
+    value = normalize(value)
+    return [value, *(alias for alias, target in aliases.items() if target == value)]
+
+
+def _day_bound(value, end: bool) -> dt.datetime:
+    """Граница периода в UTC: дата (или ISO-строка даты) — начало/конец локального дня"""
+    if isinstance(value, str):
+        value = dt.datetime.fromisoformat(value.strip())
+    if not isinstance(value, dt.datetime):
+        value = dt.datetime.combine(value, dt.time.max if end else dt.time.min)
+    return value.astimezone(dt.timezone.utc)
+
+
+def _transaction_filters(
+    coin: str | None = None,
+    tx_type: str | None = None,
+    strategy: str | None = None,
+    source: str | None = None,
+    date_from=None,
+    date_to=None,
+) -> list:
+    conditions = []
+    if coin:
+        conditions.append(func.upper(Transaction.coin) == coin.strip().upper())
+    if tx_type:
+        conditions.append(
+            Transaction.type.in_(_with_aliases(tx_type, normalize_transaction_type, TYPE_ALIASES))
+        )
+    if strategy:
+        conditions.append(
+            Transaction.strategy.in_(_with_aliases(strategy, normalize_strategy, STRATEGY_ALIASES))
+        )
+    if source:
+        conditions.append(Transaction.source == source)
+    if date_from:
+        conditions.append(Transaction.ts_utc >= _day_bound(date_from, end=False))
+    if date_to:
+        conditions.append(Transaction.ts_utc <= _day_bound(date_to, end=True))
+    return conditions
+
+
+def transactions_page_query(
+    limit: int = 50,
+    after: tuple | None = None,
+    before: tuple | None = None,
+    from_end: bool = False,
+    offset: int = 0,
+    sort_by: str = "ts_utc",
+    descending: bool = True,
+    coin: str | None = None,
+    tx_type: str | None = None,
+    strategy: str | None = None,
+    source: str | None = None,
+    date_from=None,
+    date_to=None,
+):
+    """Запрос страницы сделок (Transaction, значение поля сортировки), limit + 1 строка.
+
+    Назад и с конца строки идут в обратном порядке: страницу разворачивает
+    вызывающий (см. list_transactions_page).
+    """
+    sort_column = TRANSACTION_SORT_FIELDS.get(sort_by, Transaction.ts_utc)
+    conditions = _transaction_filters(coin, tx_type, strategy, source, date_from, date_to)
+    key = tuple_(sort_column, Transaction.id)
+    # Назад и с конца читаем в обратном порядке и разворачиваем страницу
+    backward = before is not None or from_end
+    reverse = descending != backward
+    if after is not None:
+        conditions.append(key < tuple_(*after) if descending else key > tuple_(*after))
+    if before is not None:
+        conditions.append(key > tuple_(*before) if descending else key < tuple_(*before))
+
+    order = (sort_column.desc(), Transaction.id.desc()) if reverse else (sort_column.asc(), Transaction.id.asc())
+    return (
+        select(Transaction, sort_column)
+        .where(*conditions)
+        .order_by(*order)
+        .offset(offset if not (after or before or from_end) else 0)
+        .limit(limit + 1)
+    )
+
+
+def list_transactions_page(
+    limit: int = 50,
+    after: tuple | None = None,
+    before: tuple | None = None,
+    from_end: bool = False,
+    offset: int = 0,
+    sort_by: str = "ts_utc",
+    descending: bool = True,
+    coin: str | None = None,
+    tx_type: str | None = None,
+    strategy: str | None = None,
+    source: str | None = None,
+    date_from=None,
+    date_to=None,
+) -> dict:
+    """Страница сделок с keyset-пагинацией по (поле сортировки, id).
+
+    after — ключ последней строки предыдущей страницы (следующая страница),
+    before — ключ первой строки текущей страницы (предыдущая страница),
+    from_end — последняя страница. Ключи строк страницы возвращаются в
+    first_key/last_key, поэтому переход на соседнюю страницу не зависит от
+    ее номера и не использует OFFSET. offset — запасной путь для прыжка на
+    произвольную страницу (без after/before/from_end).
+    """
+    backward = before is not None or from_end
     with Session(engine) as session:
         items = session.exec(
-            select(Transaction).order_by(Transaction.ts_utc.asc(), Transaction.id.asc())
+            transactions_page_query(
+                limit, after, before, from_end, offset, sort_by, descending,
+                coin, tx_type, strategy, source, date_from, date_to,
+            )
         ).all()
-    lots: dict[tuple[str, str], deque] = defaultdict(deque)
-    realized: dict[tuple[str, str], float] = defaultdict(float)
-    for t in items:
-        key = (t.coin.upper(), t.strategy)
-        tx_type = normalize_transaction_type(t.type)
-        strat = normalize_strategy(t.strategy)
-        key = (t.coin.upper(), strat)
-        if tx_type in INBOUND_POSITION_TYPES:
-            lots[key].append({"qty": float(t.quantity), "price": float(t.price)})
-        elif tx_type in OUTBOUND_POSITION_TYPES:
-            qty_left = float(t.quantity)
-            sell_price = float(t.price)
-            while qty_left > 0 and lots[key]:
-                lot = lots[key][0]
-                take = min(qty_left, lot["qty"])
-                realized[key] += take * (sell_price - lot["price"])
-                lot["qty"] -= take
-                qty_left -= take
-                if lot["qty"] <= 1e-12:
-                    lots[key].popleft()
-    positions = []
-    for key, queue in lots.items():
-        coin, strat = key
-        qty = sum(lot["qty"] for lot in queue)
-        cost = sum(lot["qty"] * lot["price"] for lot in queue)
-        avg = (cost / qty) if qty > 0 else 0.0
-        positions.append(
-            {
-                "key": f"{coin}:{strat}",
-                "coin": coin,
-                "strategy": strat,
-                "quantity": round(qty, 8),
-                "avg_cost": round(avg, 8),
-                "cost_basis": round(cost, 2),
-                "realized": round(realized[key], 2),
-            }
-        )
-    for key, rpnl in realized.items():
-        if rpnl != 0 and all(p["key"] != f"{key[0]}:{key[1]}" for p in positions):
-            positions.append(
-                {
-                    "key": f"{key[0]}:{key[1]}",
-                    "coin": key[0],
-                    "strategy": key[1],
-                    "quantity": 0.0,
-                    "avg_cost": 0.0,
-                    "cost_basis": 0.0,
-                    "realized": round(rpnl, 2),
-                }
+        total = session.exec(
+            select(func.count()).select_from(Transaction).where(
+                *_transaction_filters(coin, tx_type, strategy, source, date_from, date_to)
             )
-    return positions
+        ).one()
+
+    has_more = len(items) > limit
+    items = items[:limit]
+    if backward:
+        items.reverse()
+    keys = [(value, t.id) for t, value in items]
+    return {
+        "rows": transaction_rows([t for t, _ in items]),
+        "total": total,
+        "first_key": keys[0] if keys else None,
+        "last_key": keys[-1] if keys else None,
+        "has_prev": has_more if backward else (after is not None or offset > 0),
+        "has_next": before is not None or (has_more if not backward else False),
+    }
+
+
+def get_coin_frequency() -> list[tuple[str, int]]:
+    """Монеты сделок по числу сделок (по убыванию)"""
+    with Session(engine) as session:
+        coin = func.upper(Transaction.coin)
+        return [
+            (name, count)
+            for name, count in session.exec(
+                select(coin, func.count()).group_by(coin).order_by(func.count().desc())
+            ).all()
+        ]
+
+
+def positions_fifo() -> list[dict]:
+    """Позиции по FIFO из сохраненного состояния лотов (см. lot_engine)"""
+    with Session(engine) as session:
+        return read_positions(session)
+
+
+def positions_fifo_replay() -> list[dict]:
+    """Позиции по FIFO полным повтором истории сделок (эталон для сверки)"""
+    with Session(engine) as session:
+        items = session.exec(transactions_history_query()).all()
+    return replay_positions_fifo(items)
+
+
+def replay_positions_fifo(items) -> list[dict]:
+    """FIFO по сделкам в хронологическом порядке (объекты с полями Transaction)"""
+    return positions_by_method(items, ("fifo",))["fifo"]
+
+
+def positions_by_cost_basis(methods: tuple[str, ...] = ("fifo", "lifo", "hifo", "average")) -> dict[str, list[dict]]:
+    """Позиции по нескольким методам учета за одно чтение и один проход истории"""
+    with Session(engine) as session:
+        items = session.exec(transactions_history_query()).all()
+    return positions_by_method(items, methods)
 
 
 def enrich_positions_with_market(positions: list[dict], quote: str = "USD"):
@@ -191,19 +507,35 @@ def enrich_positions_with_market(positions: list[dict], quote: str = "USD"):
     total_unreal = 0.0
     total_realized = 0.0
     enriched = []
+
+    from app.adapters.prices import (
+        get_current_prices,
+        get_cached_price,
+        get_cache_entry,
+        is_cache_valid,
+        refresh_prices_in_background,
+    )
+
+    # Монеты без записи в кэше загружаем одним пакетным запросом
+    missing_coins = [p["coin"] for p in positions if get_cache_entry(p["coin"], quote) is None]
+    fetched_prices = get_current_prices(missing_coins, quote=quote) if missing_coins else {}
+
+    # Устаревшие цены (в т.ч. загруженные из БД при старте) показываем сразу,
+    # а обновляем в фоне
+    stale_coins = [
+        p["coin"]
+        for p in positions
+        if (entry := get_cache_entry(p["coin"], quote)) is not None and not is_cache_valid(entry)
+    ]
+    if stale_coins:
+        refresh_prices_in_background(stale_coins, quote=quote)
     
     for p in positions:
         coin = p["coin"]
-        # Используем функцию с повторными попытками для получения цены
-        from app.adapters.prices import (
-            get_current_price_with_retry,
-            get_cached_price,
-            get_cache_entry,
-        )
         cache_entry = get_cache_entry(coin, quote)
         price = cache_entry.price if cache_entry else 0.0
         if price == 0.0:
-            price = get_current_price_with_retry(coin, quote=quote) or 0.0
+            price = fetched_prices.get(coin.upper(), 0.0)
         
         # Если цена все еще 0, пытаемся выбрать из кэша
         if price == 0.0:
@@ -255,7 +587,16 @@ def backup_database() -> str:
     target = os.path.join(
         backup_dir, "portfolio_backup_" + time.strftime("%Y%m%d_%H%M%S") + ".db"
     )
-    shutil.copy(DB_PATH, target)
+    # Копия через backup API: в режиме WAL часть данных еще лежит в -wal файле
+    source = sqlite3.connect(DB_PATH)
+    try:
+        destination = sqlite3.connect(target)
+        try:
+            source.backup(destination)
+        finally:
+            destination.close()
+    finally:
+        source.close()
     return target
 
 
@@ -323,13 +664,12 @@ def export_positions_csv(positions: list[dict]) -> str:
     return filepath
 
 
+@cached(ttl=60, stale_ttl=240, tags=(TAG_TRANSACTIONS, TAG_PRICES))
 def get_portfolio_stats() -> dict:
-    """Возвращает детальную статистику портфеля"""
-    # Пытаемся получить из кэша
-    cached_result = get_cached_portfolio_stats()
-    if cached_result is not None:
-        return cached_result
-    
+    """Возвращает детальную статистику портфеля
+
+    Свежая 60 секунд; следующие 4 минуты отдается сразу, а пересчет идет в фоне.
+    """
     # Предзагружаем популярные монеты для лучшего получения цен
     try:
         from app.adapters.prices import ensure_preload_popular_coins
@@ -337,7 +677,11 @@ def get_portfolio_stats() -> dict:
     except Exception:
         pass  # Игнорируем ошибки предзагрузки
     
-    positions = positions_fifo()
+    return build_portfolio_stats(positions_fifo())
+
+
+def build_portfolio_stats(positions: list[dict]) -> dict:
+    """Статистика портфеля по позициям (обогащение рыночными ценами)"""
     enriched, totals = enrich_positions_with_market(positions)
 
     # Статистика по монетам
@@ -399,10 +743,6 @@ def get_portfolio_stats() -> dict:
         },
         "price_freshness": price_timestamp,
     }
-    
-    # Кэшируем результат
-    cache_portfolio_stats(result)
-    
     return result
 
 
@@ -616,6 +956,7 @@ def get_sources_with_frequency() -> list[tuple[str, int]]:
     if cached_result is not None:
         return cached_result
     
+    generations = cache_manager.generations(SOURCES_CACHE_TAGS)
     try:
         with Session(engine) as session:
             # Получаем все источники из транзакций
@@ -655,7 +996,7 @@ def get_sources_with_frequency() -> list[tuple[str, int]]:
             sorted_sources = sorted(source_counts.items(), key=sort_key)
             
             # Кэшируем результат
-            cache_sources(sorted_sources)
+            cache_sources(sorted_sources, tag_generations=generations)
             
             return sorted_sources
     except Exception as e:
@@ -675,7 +1016,7 @@ def update_source_name(old_name: str, new_name: str) -> bool:
             meta.updated_at = dt.datetime.now()
             session.add(meta)
             # Находим все транзакции с старым названием источника
-            statement = select(Transaction).where(Transaction.source == old_name)
+            statement = transactions_by_source_query(old_name)
             transactions = session.exec(statement).all()
             
             
@@ -685,8 +1026,8 @@ def update_source_name(old_name: str, new_name: str) -> bool:
             
             session.commit()
             
-            # Инвалидируем кэш после изменения источников
-            invalidate_data_cache()
+            # Инвалидируем кэш после изменения источников (лоты стратегий не меняются)
+            invalidate_data_cache(())
             
             return True
     except Exception as e:
@@ -713,7 +1054,7 @@ def delete_source_from_transactions(source_name: str) -> bool:
             meta.updated_at = dt.datetime.now()
             session.add(meta)
             # Находим все транзакции с указанным источником
-            statement = select(Transaction).where(Transaction.source == source_name)
+            statement = transactions_by_source_query(source_name)
             transactions = session.exec(statement).all()
             
             
@@ -723,8 +1064,8 @@ def delete_source_from_transactions(source_name: str) -> bool:
             
             session.commit()
             
-            # Инвалидируем кэш после удаления источника
-            invalidate_data_cache()
+            # Инвалидируем кэш после удаления источника (лоты стратегий не меняются)
+            invalidate_data_cache(())
             
             return True
     except Exception as e:
@@ -886,8 +1227,34 @@ def delete_price_alert(alert_id: int) -> bool:
         return False
 
 
+def trigger_price_alert(alert: PriceAlert, current_price: float | None) -> dict | None:
+    """Помечает алерт сработавшим, если цена достигла цели; возвращает описание"""
+    if current_price is None:
+        return None
+    triggered = False
+    if alert.alert_type == "above" and current_price >= alert.target_price:
+        triggered = True
+    elif alert.alert_type == "below" and current_price <= alert.target_price:
+        triggered = True
+    if not triggered:
+        return None
+    # Помечаем алерт как сработавший
+    alert.triggered_at = dt.datetime.now(dt.timezone.utc)
+    alert.is_active = False
+    return {
+        "alert_id": alert.id,
+        "coin": alert.coin,
+        "target_price": alert.target_price,
+        "current_price": current_price,
+        "alert_type": alert.alert_type,
+        "notes": alert.notes
+    }
+
+
 def check_price_alerts() -> list[dict]:
     """Проверяет все активные алерты и возвращает сработавшие."""
+    from app.adapters.prices import get_current_price
+
     triggered_alerts = []
     
     try:
@@ -898,31 +1265,10 @@ def check_price_alerts() -> list[dict]:
             
             for alert in active_alerts:
                 try:
-                    current_price = get_current_price(alert.coin)
-                    if current_price is None:
-                        continue
-                    
-                    triggered = False
-                    if alert.alert_type == "above" and current_price >= alert.target_price:
-                        triggered = True
-                    elif alert.alert_type == "below" and current_price <= alert.target_price:
-                        triggered = True
-                    
-                    if triggered:
-                        # Помечаем алерт как сработавший
-                        alert.triggered_at = dt.datetime.now()
-                        alert.is_active = False
+                    result = trigger_price_alert(alert, get_current_price(alert.coin))
+                    if result:
                         session.add(alert)
-                        
-                        triggered_alerts.append({
-                            "alert_id": alert.id,
-                            "coin": alert.coin,
-                            "target_price": alert.target_price,
-                            "current_price": current_price,
-                            "alert_type": alert.alert_type,
-                            "notes": alert.notes
-                        })
-                        
+                        triggered_alerts.append(result)
                 
                 except Exception as e:
                     print(f"Ошибка проверки алерта {alert.id}: {e}")
@@ -10,9 +10,12 @@ from pathlib import Path
 # Добавляем корневую директорию в путь
 sys.path.append(str(Path(__file__).parent.parent))
 
+from nicegui import app as nicegui_app
 from nicegui import ui
 
-from app.storage.db import init_db
+from app.adapters.http_client import close_http_client
+from app.core.daily_snapshots import start_snapshot_scheduler, stop_snapshot_scheduler
+from app.storage.db import dispose_async_engine, init_db
 from app.ui.pages_step2 import portfolio_page, show_about_page
 
 # from app.core.notifications import start_notifications
@@ -20,6 +23,14 @@ from app.ui.pages_step2 import portfolio_page, show_about_page
 # Инициализация базы данных
 init_db()
 
+# Закрываем пул HTTP-соединений и соединения с БД при остановке приложения
+nicegui_app.on_shutdown(close_http_client)
+nicegui_app.on_shutdown(dispose_async_engine)
+
+# Фоновый пересчет дневных срезов для графиков и дашбордов
+nicegui_app.on_startup(start_snapshot_scheduler)
+nicegui_app.on_shutdown(stop_snapshot_scheduler)
+
 # Запуск системы уведомлений (временно отключено)
 # start_notifications()
 
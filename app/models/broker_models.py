@@ -6,6 +6,7 @@ from datetime import datetime
 from typing import List, Optional
 
 from pydantic import BaseModel
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -59,6 +60,9 @@ class StockInstrument(StockInstrumentBase, table=True):
     """Модель инструмента в базе данных"""
 
     __tablename__ = "stock_instruments"
+    __table_args__ = (
+        Index("ux_stock_instruments_broker_ticker", "broker_id", "ticker", unique=True),
+    )
 
     id: int = Field(primary_key=True)
     broker_id: str = Field(foreign_key="brokers.id", description="ID брокера")
@@ -97,6 +101,15 @@ class StockTransaction(StockTransactionBase, table=True):
     """Модель транзакции в базе данных"""
 
     __tablename__ = "stock_transactions"
+    __table_args__ = (
+        Index(
+            "ix_stock_transactions_broker_ticker_date",
+            "broker_id",
+            "ticker",
+            "transaction_date",
+        ),
+        Index("ix_stock_transactions_broker_date", "broker_id", "transaction_date"),
+    )
 
     id: int = Field(primary_key=True)
     broker_id: str = Field(foreign_key="brokers.id", description="ID брокера")
@@ -24,6 +24,24 @@ from app.storage.db import engine
 logger = logging.getLogger(__name__)
 
 
+def stock_instrument_query(ticker: str, broker_id: str):
+    """Запрос инструмента брокера по тикеру"""
+    return select(StockInstrument).where(
+        StockInstrument.ticker == ticker,
+        StockInstrument.broker_id == broker_id,
+    )
+
+
+def stock_transactions_query(broker_id: Optional[str] = None, ticker: Optional[str] = None):
+    """Запрос транзакций с акциями (новые первыми)"""
+    query = select(StockTransaction)
+    if broker_id:
+        query = query.where(StockTransaction.broker_id == broker_id)
+    if ticker:
+        query = query.where(StockTransaction.ticker == ticker)
+    return query.order_by(StockTransaction.transaction_date.desc())
+
+
 class StockService:
     """Сервис для работы с акциями"""
 
@@ -81,10 +99,7 @@ class StockService:
                 for instrument in broker_instruments:
                     # Проверяем, существует ли инструмент
                     existing = session.exec(
-                        select(StockInstrument).where(
-                            StockInstrument.ticker == instrument.ticker,
-                            StockInstrument.broker_id == broker_id,
-                        )
+                        stock_instrument_query(instrument.ticker, broker_id)
                     ).first()
 
                     if existing:
@@ -142,10 +157,7 @@ class StockService:
             with Session(engine) as session:
                 # Находим инструмент
                 instrument = session.exec(
-                    select(StockInstrument).where(
-                        StockInstrument.ticker == transaction_data.ticker,
-                        StockInstrument.broker_id == transaction_data.broker_id,
-                    )
+                    stock_instrument_query(transaction_data.ticker, transaction_data.broker_id)
                 ).first()
 
                 if not instrument:
@@ -197,17 +209,7 @@ class StockService:
         """Получает транзакции с акциями"""
         try:
             with Session(engine) as session:
-                query = select(StockTransaction)
-
-                if broker_id:
-                    query = query.where(StockTransaction.broker_id == broker_id)
-
-                if ticker:
-                    query = query.where(StockTransaction.ticker == ticker)
-
-                query = query.order_by(StockTransaction.transaction_date.desc())
-
-                transactions = session.exec(query).all()
+                transactions = session.exec(stock_transactions_query(broker_id, ticker)).all()
                 return transactions
 
         except Exception as e:
@@ -1,9 +1,26 @@
+import asyncio
+import functools
 import os
+import random
+import time
 
-from sqlmodel import SQLModel, create_engine
+from sqlalchemy import event
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, create_engine
 
 # Импортируем все модели для создания таблиц
-from app.core.models import Transaction, PriceAlert, SourceMeta
+from app.core.models import (
+    Transaction,
+    PriceAlert,
+    PriceCandle,
+    PriceStore,
+    SourceMeta,
+    PositionCheckpoint,
+    PositionLot,
+    PositionState,
+    RealizedPnlEntry,
+)
 from app.models.broker_models import Broker, StockInstrument, StockTransaction
 
 DB_PATH = os.path.abspath(
@@ -11,9 +28,171 @@ DB_PATH = os.path.abspath(
 )
 DB_URI = f"sqlite:///{DB_PATH}"
 
-engine = create_engine(DB_URI, echo=False)
+# Настройки SQLite и пула соединений (можно переопределить через .env)
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "15"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# UI, поток уведомлений, фоновое обновление цен и запись кэша цен
+# работают одновременно: держим соединение на каждый поток с запасом
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Повторы записи при "database is locked" сверх busy timeout
+DB_BUSY_RETRIES = int(os.getenv("DB_BUSY_RETRIES", "5"))
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Настраивает каждое новое соединение SQLite.
+
+    WAL позволяет читателям работать параллельно с писателем, synchronous=NORMAL
+    в режиме WAL безопасен и не делает fsync на каждый коммит.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(db_uri: str = DB_URI, **kwargs):
+    """Создает движок SQLite с WAL, настроенными pragma и пулом соединений"""
+    options = {
+        "echo": False,
+        "connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT},
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    options.update(kwargs)
+    db_engine = create_engine(db_uri, **options)
+    event.listen(db_engine, "connect", _set_sqlite_pragmas)
+    return db_engine
+
+
+engine = create_db_engine()
+
+# Асинхронный движок (aiosqlite) создается при первом обращении
+_async_engine = None
+
+
+def create_async_db_engine(db_uri: str = DB_URI, **kwargs):
+    """Создает асинхронный движок SQLite (aiosqlite) с теми же pragma и пулом"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    options = {
+        "echo": False,
+        "connect_args": {"timeout": SQLITE_BUSY_TIMEOUT},
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    options.update(kwargs)
+    async_uri = db_uri.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    db_engine = create_async_engine(async_uri, **options)
+    event.listen(db_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return db_engine
+
+
+def get_async_engine():
+    """Общий асинхронный движок процесса"""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_db_engine()
+    return _async_engine
+
+
+async def dispose_async_engine() -> None:
+    """Закрывает соединения асинхронного движка (при завершении приложения)"""
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+
+def is_busy_error(error: Exception) -> bool:
+    """Ошибка блокировки SQLite (database is locked / busy)"""
+    message = str(getattr(error, "orig", error)).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+def retry_on_busy(func=None, *, retries: int = DB_BUSY_RETRIES, base_delay: float = 0.05):
+    """Повторяет операцию записи, если SQLite занят дольше busy timeout.
+
+    Нужен для случаев, когда busy-обработчик SQLite не вызывается (например,
+    при повышении читающей транзакции до пишущей). Повтор безопасен, только
+    если функция сама открывает и закрывает свою сессию.
+    """
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                for attempt in range(retries + 1):
+                    try:
+                        return await fn(*args, **kwargs)
+                    except OperationalError as e:
+                        if attempt == retries or not is_busy_error(e):
+                            raise
+                        await asyncio.sleep(base_delay * (2 ** attempt) * (1 + random.random()))
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            for attempt in range(retries + 1):
+                try:
+                    return fn(*args, **kwargs)
+                except OperationalError as e:
+                    if attempt == retries or not is_busy_error(e):
+                        raise
+                    time.sleep(base_delay * (2 ** attempt) * (1 + random.random()))
+
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
+
+
+def ensure_indexes():
+    """Создает индексы, добавленные в модели после создания таблиц.
+
+    create_all создает индексы только вместе с новой таблицей, поэтому для
+    существующих БД недостающие индексы досоздаются здесь.
+    """
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                with engine.begin() as connection:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+            except Exception as e:
+                # Уникальный индекс не создастся, пока в таблице есть дубликаты
+                print(f"Ошибка создания индекса {index.name}: {e}")
 
 
 def init_db():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     SQLModel.metadata.create_all(engine)
+    ensure_indexes()
+
+    # Прогреваем кэш цен сохраненными значениями, чтобы первая отрисовка
+    # не ждала сети (цены отдаются как устаревшие и обновляются в фоне)
+    try:
+        from app.adapters.prices import warm_start_price_cache
+        warm_start_price_cache()
+    except Exception as e:
+        print(f"Ошибка загрузки сохраненных цен: {e}")
+
+    # Сверяем сохраненное состояние FIFO-лотов со сделками; при расхождении
+    # (сделки записаны в обход сервисного слоя) состояние пересчитывается
+    try:
+        from app.core.lot_engine import ensure_lot_state
+        with Session(engine) as session:
+            ensure_lot_state(session)
+    except Exception as e:
+        print(f"Ошибка проверки состояния лотов: {e}")
@@ -0,0 +1,97 @@
+"""
+Хранилище исторических свечей (таблица PriceCandle)
+"""
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from app.core.models import PriceCandle
+from app.storage.db import engine, retry_on_busy
+
+# Размер пачки строк в одном INSERT (ограничение SQLite на число параметров)
+UPSERT_CHUNK_SIZE = 500
+
+
+@retry_on_busy
+def upsert_candles(rows: list[dict]) -> int:
+    """Сохраняет свечи (upsert по первичному ключу) пачками в одной транзакции.
+
+    Каждая строка: coin, quote, interval, ts, open, high, low, close, volume.
+    """
+    if not rows:
+        return 0
+    table = PriceCandle.__table__
+    with Session(engine) as session:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[start:start + UPSERT_CHUNK_SIZE]
+            stmt = sqlite_insert(table).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["coin", "quote", "interval", "ts"],
+                set_={
+                    "open": stmt.excluded.open,
+                    "high": stmt.excluded.high,
+                    "low": stmt.excluded.low,
+                    "close": stmt.excluded.close,
+                    "volume": stmt.excluded.volume,
+                },
+            )
+            session.exec(stmt)
+        session.commit()
+    return len(rows)
+
+
+def candles_query(
+    coins: list[str],
+    quote: str,
+    interval: str,
+    start_ts: int,
+    end_ts: int,
+    columns: tuple[str, ...] = ("close",),
+):
+    """Запрос строк (coin, ts, *columns) за диапазон по первичному ключу"""
+    table = PriceCandle.__table__
+    return (
+        select(table.c.coin, table.c.ts, *(table.c[name] for name in columns))
+        .where(table.c.coin.in_(coins))
+        .where(table.c.quote == quote)
+        .where(table.c.interval == interval)
+        .where(table.c.ts >= start_ts)
+        .where(table.c.ts <= end_ts)
+        .order_by(table.c.coin, table.c.ts)
+    )
+
+
+def load_candles(
+    coins: list[str],
+    quote: str,
+    interval: str,
+    start_ts: int,
+    end_ts: int,
+    columns: tuple[str, ...] = ("close",),
+) -> list[tuple]:
+    """Возвращает строки (coin, ts, *columns) за диапазон [start_ts, end_ts].
+
+    Запрос идет по первичному ключу (coin, quote, interval, ts) и не
+    обращается к другим структурам таблицы.
+    """
+    if not coins:
+        return []
+    stmt = candles_query(coins, quote, interval, start_ts, end_ts, columns)
+    # Колонки простых типов: строки берем прямо из курсора DB-API, без
+    # построения Row (на сотнях тысяч свечей это основная часть времени)
+    with engine.connect() as connection:
+        return connection.execute(stmt).cursor.fetchall()
+
+
+def get_candle_coverage(quote: str, interval: str) -> dict[str, tuple[int, int]]:
+    """Диапазон сохраненных свечей по монетам: coin -> (min_ts, max_ts)"""
+    from sqlalchemy import func
+
+    table = PriceCandle.__table__
+    stmt = (
+        select(table.c.coin, func.min(table.c.ts), func.max(table.c.ts))
+        .where(table.c.quote == quote)
+        .where(table.c.interval == interval)
+        .group_by(table.c.coin)
+    )
+    with Session(engine) as session:
+        return {coin: (lo, hi) for coin, lo, hi in session.exec(stmt).all()}
@@ -0,0 +1,70 @@
+"""
+Персистентное хранилище последних цен (таблица PriceStore)
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from app.core.models import PriceStore
+from app.storage.db import engine, retry_on_busy
+
+
+@retry_on_busy
+def save_prices(rows: list[dict]) -> int:
+    """Сохраняет (upsert по coin+quote) цены в PriceStore.
+
+    Каждая строка: coin, quote, price, source, ttl, timestamp (unix time).
+    """
+    if not rows:
+        return 0
+    values = [
+        {
+            "coin": row["coin"],
+            "quote": row["quote"],
+            "price": row["price"],
+            "source": row["source"],
+            "ttl": row["ttl"],
+            "fetched_at": datetime.fromtimestamp(row["timestamp"], timezone.utc),
+        }
+        for row in rows
+    ]
+    stmt = sqlite_insert(PriceStore.__table__).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["coin", "quote"],
+        set_={
+            "price": stmt.excluded.price,
+            "source": stmt.excluded.source,
+            "ttl": stmt.excluded.ttl,
+            "fetched_at": stmt.excluded.fetched_at,
+        },
+        # Не перезаписываем более свежую цену более старой
+        where=PriceStore.__table__.c.fetched_at <= stmt.excluded.fetched_at,
+    )
+    with Session(engine) as session:
+        session.exec(stmt)
+        session.commit()
+    return len(values)
+
+
+def load_prices() -> list[dict]:
+    """Загружает все сохраненные цены в формате, обратном save_prices."""
+    with Session(engine) as session:
+        items = session.exec(select(PriceStore)).all()
+    rows = []
+    for item in items:
+        fetched_at = item.fetched_at
+        # SQLite возвращает naive datetime, сохраняли в UTC
+        if fetched_at.tzinfo is None:
+            fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+        rows.append(
+            {
+                "coin": item.coin,
+                "quote": item.quote,
+                "price": item.price,
+                "source": item.source,
+                "ttl": item.ttl,
+                "timestamp": fetched_at.timestamp(),
+            }
+        )
+    return rows
@@ -0,0 +1,145 @@
+"""
+Аудит планов горячих запросов (EXPLAIN QUERY PLAN)
+
+Горячие запросы строятся теми же функциями-построителями, которые вызывают
+сервисы (list_transactions_page, positions_as_of, load_candles и др.), поэтому
+аудит проверяет реальные выражения, а не их копии. Аудит выполняет
+EXPLAIN QUERY PLAN и помечает полные проходы по таблицам и временные
+B-деревья для сортировки, чтобы пропавший или неподходящий индекс был виден
+до того, как таблицы вырастут.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+
+@dataclass
+class HotQuery:
+    """Горячий запрос: имя, построитель выражения и допустимость полного прохода"""
+
+    name: str
+    build: Callable[[], Any]
+    # Запросы, читающие всю таблицу, могут проходить ее целиком, но без сортировки
+    allow_full_scan: bool = False
+
+
+def _sample_ts() -> datetime:
+    return datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def get_hot_queries() -> List[HotQuery]:
+    """Горячие запросы сервисов, движка лотов, хранилищ цен и акций"""
+    from app.core.lot_engine import (
+        key_transactions_query,
+        ledger_rollback_query,
+        open_lots_query,
+        transactions_history_query,
+    )
+    from app.core.positions_history import as_of_replay_query, nearest_checkpoint_query
+    from app.core.services import (
+        transactions_by_source_query,
+        transactions_list_query,
+        transactions_page_query,
+    )
+    from app.services.broker_service import stock_instrument_query, stock_transactions_query
+    from app.storage.price_history import candles_query
+
+    ts = _sample_ts()
+    key = ("BTC", "long_term")
+    return [
+        HotQuery(
+            "transactions: полная история FIFO (ts_utc, id)",
+            transactions_history_query,
+            allow_full_scan=True,
+        ),
+        HotQuery(
+            "transactions: список по id desc",
+            transactions_list_query,
+            allow_full_scan=True,
+        ),
+        HotQuery(
+            "transactions: страница сделок (keyset по ts_utc, id)",
+            lambda: transactions_page_query(after=(ts, 1)),
+        ),
+        HotQuery(
+            "transactions: страница сделок монеты upper(coin)",
+            lambda: transactions_page_query(after=(ts, 1), coin="BTC"),
+        ),
+        HotQuery(
+            "transactions: позиция на дату от контрольной точки",
+            lambda: as_of_replay_query(ts, (ts, 1)),
+        ),
+        HotQuery(
+            "transactions: сделки монеты upper(coin) для движка лотов",
+            lambda: key_transactions_query(key),
+        ),
+        HotQuery(
+            "transactions: сделки источника",
+            lambda: transactions_by_source_query("Binance"),
+        ),
+        HotQuery(
+            "position lots: открытые лоты позиции",
+            lambda: open_lots_query(key),
+        ),
+        HotQuery(
+            "realized pnl: откат журнала позиции с момента",
+            lambda: ledger_rollback_query(key, ts, 1),
+        ),
+        HotQuery(
+            "checkpoints: ближайшая точка не позже даты",
+            lambda: nearest_checkpoint_query(ts),
+        ),
+        HotQuery(
+            "price candles: матрица цен за период",
+            lambda: candles_query(["BTC", "ETH"], "usd", "1d", 0, 1),
+        ),
+        HotQuery(
+            "stock transactions: брокер + тикер по дате",
+            lambda: stock_transactions_query("tinkoff", "SBER"),
+        ),
+        HotQuery(
+            "stock transactions: брокер по дате",
+            lambda: stock_transactions_query("tinkoff"),
+        ),
+        HotQuery(
+            "stock instruments: поиск тикера у брокера",
+            lambda: stock_instrument_query("SBER", "tinkoff"),
+        ),
+    ]
+
+
+def _explain(connection, statement) -> List[str]:
+    compiled = statement.compile(
+        dialect=connection.dialect, compile_kwargs={"render_postcompile": True}
+    )
+    params = compiled.construct_params()
+    names = compiled.positiontup or []
+    values = tuple(
+        params[name].isoformat(" ") if isinstance(params[name], datetime) else params[name]
+        for name in names
+    )
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", values).all()
+    return [row[-1] for row in rows]
+
+
+def audit_query_plans(db_engine=None, queries: Optional[List[HotQuery]] = None) -> List[Dict[str, Any]]:
+    """Выполняет EXPLAIN QUERY PLAN для горячих запросов.
+
+    Для каждого запроса возвращает план и найденные проблемы: полный проход
+    таблицы (SCAN без индекса) и временное B-дерево для сортировки.
+    """
+    if db_engine is None:
+        from app.storage.db import engine as db_engine
+
+    results = []
+    with db_engine.connect() as connection:
+        for query in queries or get_hot_queries():
+            plan = _explain(connection, query.build())
+            issues = []
+            for detail in plan:
+                if detail.startswith("SCAN ") and " USING " not in detail and not query.allow_full_scan:
+                    issues.append(f"полный проход: {detail}")
+                if "TEMP B-TREE" in detail:
+                    issues.append(f"сортировка без индекса: {detail}")
+            results.append({"name": query.name, "plan": plan, "issues": issues, "ok": not issues})
+    return results
@@ -5,11 +5,10 @@
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
-import pandas as pd
 from datetime import datetime, timedelta
 from nicegui import ui
-from app.core.services import list_transactions, get_portfolio_stats, positions_fifo
-from app.adapters.prices import get_current_price
+from app.core.services import get_portfolio_stats, positions_fifo
+from app.core.daily_snapshots import get_daily_series
 
 
 def create_advanced_analytics_tab():
@@ -63,74 +62,43 @@ def create_pnl_timeline_chart():
         ui.label("📈 P&L по времени").classes("text-lg font-semibold text-gray-800 mb-4")
         
         try:
-            # Получаем данные транзакций
-            transactions = list_transactions()
+            # Дневной ряд портфеля из предрасчитанных срезов: O(дней) строк
+            df = get_daily_series()
             
-            if not transactions:
+            if df.empty:
                 ui.label("Нет данных для построения графика").classes("text-gray-500 text-center py-8")
                 return
             
-            # Создаем DataFrame для анализа
-            df = pd.DataFrame(transactions)
-            df['created_at'] = pd.to_datetime(df['created_at'])
-            df = df.sort_values('created_at')
-            
-            # Рассчитываем кумулятивный P&L
-            df['cumulative_invested'] = 0.0
-            df['cumulative_value'] = 0.0
-            df['cumulative_pnl'] = 0.0
-            
-            total_invested = 0.0
-            total_value = 0.0
-            
-            for idx, row in df.iterrows():
-                if row['type'] in ['buy', 'deposit', 'exchange_in']:
-                    total_invested += row['quantity'] * row['price']
-                elif row['type'] in ['sell', 'withdrawal', 'exchange_out']:
-                    total_invested -= row['quantity'] * row['price']
-                
-                # Получаем текущую цену для расчета стоимости
-                current_price = get_current_price(row['coin']) or row['price']
-                if row['type'] in ['buy', 'deposit', 'exchange_in']:
-                    total_value += row['quantity'] * current_price
-                elif row['type'] in ['sell', 'withdrawal', 'exchange_out']:
-                    total_value -= row['quantity'] * current_price
-                
-                df.at[idx, 'cumulative_invested'] = total_invested
-                df.at[idx, 'cumulative_value'] = total_value
-                df.at[idx, 'cumulative_pnl'] = total_value - total_invested
+            df['pnl'] = df['value'] - df['invested']
             
             # Создаем график
             fig = go.Figure()
             
             # Линия инвестиций
             fig.add_trace(go.Scatter(
-                x=df['created_at'],
-                y=df['cumulative_invested'],
-                mode='lines+markers',
+                x=df.index,
+                y=df['invested'],
+                mode='lines',
                 name='Инвестировано',
-                line=dict(color='blue', width=2),
-                marker=dict(size=6)
+                line=dict(color='blue', width=2)
             ))
             
             # Линия текущей стоимости
             fig.add_trace(go.Scatter(
-                x=df['created_at'],
-                y=df['cumulative_value'],
-                mode='lines+markers',
+                x=df.index,
+                y=df['value'],
+                mode='lines',
                 name='Текущая стоимость',
-                line=dict(color='green', width=2),
-                marker=dict(size=6)
+                line=dict(color='green', width=2)
             ))
             
             # Линия P&L
             fig.add_trace(go.Scatter(
-                x=df['created_at'],
-                y=df['cumulative_pnl'],
-                mode='lines+markers',
+                x=df.index,
+                y=df['pnl'],
+                mode='lines',
                 name='P&L',
                 line=dict(color='red', width=2),
-                marker=dict(size=6),
                 fill='tonexty'
             ))
             
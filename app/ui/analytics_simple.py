@@ -3,7 +3,8 @@
 """
 
 from nicegui import ui
-from app.core.services import list_transactions, get_portfolio_stats, positions_fifo
+from app.core.daily_snapshots import get_rollup_totals
+from app.core.services import get_portfolio_stats, positions_fifo
 
 
 def create_analytics_tab():
@@ -46,8 +47,8 @@ def create_analytics_tab():
             
             def clear_portfolio_cache():
                 try:
-                    from app.core.cache import cache_manager
-                    cache_manager.delete("portfolio_stats")
+                    from app.core.services import get_portfolio_stats
+                    get_portfolio_stats.invalidate()
                     ui.notify("✅ Кэш портфеля очищен", type="positive")
                     update_diagnostic()
                 except Exception as e:
@@ -64,17 +65,14 @@ def create_analytics_tab():
                 with metrics_container:
                     try:
                         # Получаем данные
-                        transactions = list_transactions()
+                        # Итоги по стратегиям из дневных срезов, без чтения всех сделок
+                        strategy_totals = get_rollup_totals("strategy")
                         portfolio_stats = get_portfolio_stats()
                         positions = positions_fifo()
                         
                         # Простые расчеты
-                        from app.core.taxonomy import INBOUND_POSITION_TYPES, normalize_transaction_type
-                        total_invested = sum(
-                            tx['quantity'] * tx['price']
-                            for tx in transactions
-                            if normalize_transaction_type(tx.get('type')) in INBOUND_POSITION_TYPES
-                        )
+                        total_invested = sum(t['bought'] for t in strategy_totals.values())
+                        transactions_count = sum(t['tx_count'] for t in strategy_totals.values())
                         # ИСПРАВЛЕНИЕ: правильный путь к total_value
                         current_value = portfolio_stats.get('totals', {}).get('total_value', 0)
                         total_pnl = current_value - total_invested
@@ -108,7 +106,7 @@ def create_analytics_tab():
                     with ui.row().classes("w-full gap-6 mt-4"):
                         with ui.column().classes("flex-1 text-center"):
                             ui.label("📝 Сделок").classes("text-sm text-gray-500")
-                            ui.label(f"{len(transactions)}").classes("text-lg font-semibold text-gray-700")
+                            ui.label(f"{transactions_count}").classes("text-lg font-semibold text-gray-700")
                         
                         with ui.column().classes("flex-1 text-center"):
                             ui.label("🪙 Монет").classes("text-sm text-gray-500")
@@ -116,9 +114,8 @@ def create_analytics_tab():
                         
                         with ui.column().classes("flex-1 text-center"):
                             ui.label("🏆 Стратегия").classes("text-sm text-gray-500")
-                            from app.core.taxonomy import normalize_strategy, STRATEGY_META
-                            strategies = [normalize_strategy(tx.get('strategy', 'unknown')) for tx in transactions]
-                            main_strategy = max(set(strategies), key=strategies.count) if strategies else 'unknown'
+                            from app.core.taxonomy import STRATEGY_META
+                            main_strategy = max(strategy_totals, key=lambda s: strategy_totals[s]['tx_count']) if strategy_totals else 'unknown'
                             strategy_label = STRATEGY_META.get(main_strategy).label if main_strategy in STRATEGY_META else main_strategy
                             ui.label(f"{strategy_label}").classes("text-lg font-semibold text-purple-600")
             
@@ -181,7 +178,6 @@ def create_analytics_tab():
         def clear_all_cache():
             try:
                 from app.core.cache import cache_manager
-                cache_manager.delete("portfolio_stats")
                 cache_manager.clear()  # Очищаем весь кэш
                 ui.notify("✅ Весь кэш очищен", type="positive")
                 refresh_metrics()
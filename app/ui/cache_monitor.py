@@ -4,6 +4,7 @@
 from nicegui import ui
 from app.core.cache import cache_manager
 from app.adapters.prices import get_cache_stats, clean_expired_cache, preload_popular_coins
+from app.adapters.source_health import get_source_health_stats, source_registry
 
 
 def create_cache_monitor_tab():
@@ -56,21 +57,24 @@ def create_cache_monitor_tab():
                             with ui.column().classes("space-y-2"):
                                 ui.label("Содержимое кэша:").classes("font-semibold")
                                 
-                                if cache_manager._cache:
-                                    for key, entry in cache_manager._cache.items():
+                                entries = cache_manager.entries()
+                                if entries:
+                                    for key, entry in reversed(entries):
                                         with ui.card().classes("p-2 bg-gray-50"):
                                             with ui.row().classes("justify-between items-center"):
                                                 ui.label(f"Ключ: {key}").classes("font-mono text-sm")
                                                 ui.label(f"TTL: {int(entry['expires_at'] - entry['created_at'])}с").classes("text-xs text-gray-500")
                                             
                                             # Показываем размер значения
-                                            value_size = len(str(entry['value']))
-                                            ui.label(f"Размер: {value_size} байт").classes("text-xs text-gray-500")
+                                            ui.label(f"Размер: ~{entry['size']} байт").classes("text-xs text-gray-500")
                                             
                                             # Показываем время создания
                                             import datetime
                                             created_time = datetime.datetime.fromtimestamp(entry['created_at']).strftime("%H:%M:%S")
                                             ui.label(f"Создано: {created_time}").classes("text-xs text-gray-500")
+                                            if entry.get('tags'):
+                                                tags_text = ", ".join(tag for tag, _ in entry['tags'])
+                                                ui.label(f"Теги: {tags_text}").classes("text-xs text-gray-500")
                                 else:
                                     ui.label("Кэш пуст").classes("text-gray-500 italic")
                         
@@ -94,15 +98,15 @@ def create_cache_monitor_tab():
                     with ui.column().classes("space-y-3"):
                         stats = cache_manager.get_stats()
                         
-                        # Расчет эффективности кэша
-                        total_entries = stats['total_entries']
+                        # Эффективность кэша по попаданиям и промахам
                         active_entries = stats['active_entries']
-                        hit_rate = (active_entries / total_entries * 100) if total_entries > 0 else 0
+                        hit_rate = stats['hit_rate']
                         
-                        ui.label(f"Эффективность кэша: {hit_rate:.1f}%")
-                        ui.label(f"Активных записей: {active_entries}")
+                        ui.label(f"Эффективность кэша: {hit_rate:.1f}% ({stats['hits']} попаданий, {stats['misses']} промахов)")
+                        ui.label(f"Активных записей: {active_entries} из {stats['max_entries']}")
                         ui.label(f"Истекших записей: {stats['expired_entries']}")
-                        ui.label(f"Использование памяти: {stats['memory_usage']} байт")
+                        ui.label(f"Вытеснено записей: {stats['evictions']}")
+                        ui.label(f"Использование памяти: {stats['memory_usage']} из {stats['max_bytes']} байт")
                         
                         # Рекомендации
                         ui.separator()
@@ -115,7 +119,7 @@ def create_cache_monitor_tab():
                         else:
                             ui.label("• Хорошая эффективность кэша.").classes("text-blue-600")
                         
-                        if stats['memory_usage'] > 1024 * 1024:  # 1MB
+                        if stats['memory_usage'] > stats['max_bytes'] * 0.9:
                             ui.label("• Высокое использование памяти. Рассмотрите очистку.").classes("text-orange-600")
                     
                     with ui.row().classes("justify-end mt-4"):
@@ -177,6 +181,15 @@ def create_cache_monitor_tab():
                                 hit_rate = stats['hit_rate'] * 100
                                 ui.label(f"{hit_rate:.1f}%").classes("text-xl font-bold text-purple-600")
                         
+                        # Объединенные одновременные запросы
+                        coalescing = stats.get('coalescing', {})
+                        if coalescing:
+                            executions = sum(c['executions'] for c in coalescing.values())
+                            coalesced = sum(c['coalesced'] for c in coalescing.values())
+                            ui.label(
+                                f"Сетевых запросов: {executions}, объединено параллельных: {coalesced}"
+                            ).classes("text-sm text-gray-600 mb-2")
+                        
                         # Статистика по источникам
                         if stats['sources']:
                             ui.label("Источники данных:").classes("text-sm font-semibold text-gray-700 mb-2")
@@ -212,3 +225,67 @@ def create_cache_monitor_tab():
             
             # Загружаем статистику при открытии
             refresh_prices_stats()
+
+        # Состояние источников цен
+        with ui.card().classes("p-4 bg-white shadow-sm rounded-lg mt-4"):
+            ui.label("🩺 Состояние источников цен").classes("text-lg font-semibold text-gray-800 mb-4")
+            
+            sources_health_container = ui.column().classes("w-full")
+            
+            def refresh_sources_health():
+                """Обновляет статистику здоровья источников"""
+                sources_health_container.clear()
+                
+                with sources_health_container:
+                    try:
+                        health = get_source_health_stats()
+                        if not health:
+                            ui.label("Источники еще не опрашивались").classes("text-gray-500 italic")
+                            return
+                        
+                        state_labels = {
+                            "closed": "✅ работает",
+                            "half_open": "🟡 пробный запрос",
+                            "open": "⛔ отключен",
+                        }
+                        rows = []
+                        for name, item in sorted(health.items(), key=lambda x: x[1]["score"], reverse=True):
+                            rows.append({
+                                "source": name,
+                                "state": state_labels.get(item["state"], item["state"]),
+                                "score": f"{item['score']:.2f}",
+                                "success_rate": f"{item['success_rate'] * 100:.0f}%",
+                                "p50": f"{item['p50_ms']:.0f} мс" if item["p50_ms"] is not None else "—",
+                                "p95": f"{item['p95_ms']:.0f} мс" if item["p95_ms"] is not None else "—",
+                                "failures": item["consecutive_failures"],
+                                "cooldown": f"{item['cooldown_left']:.0f}с" if item["cooldown_left"] else "—",
+                            })
+                        
+                        ui.table(
+                            columns=[
+                                {"name": "source", "label": "Источник:монета", "field": "source", "align": "left"},
+                                {"name": "state", "label": "Состояние", "field": "state", "align": "left"},
+                                {"name": "score", "label": "Оценка", "field": "score"},
+                                {"name": "success_rate", "label": "Успешность", "field": "success_rate"},
+                                {"name": "p50", "label": "p50", "field": "p50"},
+                                {"name": "p95", "label": "p95", "field": "p95"},
+                                {"name": "failures", "label": "Ошибок подряд", "field": "failures"},
+                                {"name": "cooldown", "label": "Пауза", "field": "cooldown"},
+                            ],
+                            rows=rows,
+                            row_key="source",
+                        ).classes("w-full")
+                    except Exception as e:
+                        ui.label(f"Ошибка загрузки статистики источников: {e}").classes("text-red-500")
+            
+            def reset_sources_health():
+                """Сбрасывает статистику и circuit breaker всех источников"""
+                source_registry.reset()
+                ui.notify("🔄 Статистика источников сброшена", type="positive")
+                refresh_sources_health()
+            
+            with ui.row().classes("gap-2 mb-4"):
+                ui.button("🔄 Обновить", icon="refresh").classes("bg-blue-500 text-white").on("click", refresh_sources_health)
+                ui.button("♻️ Сбросить", icon="restart_alt").classes("bg-gray-500 text-white").on("click", reset_sources_health)
+            
+            refresh_sources_health()
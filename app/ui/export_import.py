@@ -154,6 +154,8 @@ def create_export_import_tab():
                         
                         if file_type == "CSV":
                             ui.label(f"Импортировано транзакций: {result['imported']}").classes("text-gray-700")
+                            if result.get('rows_per_sec'):
+                                ui.label(f"Скорость импорта: {result['rows_per_sec']:.0f} строк/с").classes("text-gray-500 text-sm")
                         else:  # JSON
                             ui.label(f"Импортировано транзакций: {result['imported_transactions']}").classes("text-gray-700")
                             ui.label(f"Импортировано алертов: {result['imported_alerts']}").classes("text-gray-700")
@@ -188,7 +190,7 @@ def create_export_import_tab():
             with ui.column().classes("space-y-2"):
                 ui.label("📄 CSV формат:").classes("text-md font-semibold text-gray-700")
                 ui.label("• Обязательные колонки: Монета, Количество, Цена").classes("text-sm text-gray-600")
-                ui.label("• Дополнительные: Источник, Тип, Заметки").classes("text-sm text-gray-600")
+                ui.label("• Дополнительные: Источник, Тип, Стратегия, Дата, Заметки").classes("text-sm text-gray-600")
                 ui.label("• Тип: 'buy' или 'sell'").classes("text-sm text-gray-600")
                 
                 ui.label("💾 JSON формат:").classes("text-md font-semibold text-gray-700 mt-3")
@@ -5,14 +5,18 @@
 
 import os
 
-from nicegui import ui
-
+from nicegui import run, ui
+
+from app.core.async_services import (
+    add_price_alert_async,
+    add_transaction_async,
+    check_price_alerts_async,
+    delete_price_alert_async,
+    get_portfolio_stats_async,
+    get_price_alerts_async,
+)
 from app.core.models import PriceAlertIn, TransactionIn
-from app.core.services import (  # Алерты
-    add_price_alert,
-    add_transaction,
-    check_price_alerts,
-    delete_price_alert,
+from app.core.services import (
     delete_source_from_transactions,
     delete_transaction,
     enrich_positions_with_market,
@@ -20,12 +24,12 @@ from app.core.services import (  # Алерты
     export_transactions_csv,
     get_alert_statistics,
     get_portfolio_stats,
-    get_price_alerts,
     get_source_statistics,
     get_sources_with_frequency,
     get_transaction,
     get_transaction_stats,
-    list_transactions,
+    get_coin_frequency,
+    list_transactions_page,
     positions_fifo,
     update_price_alert,
     update_source_name,
@@ -501,7 +505,7 @@ def open_enhanced_add_dialog():
 
                 stats_dialog.open()
 
-        def get_current_price():
+        async def get_current_price():
             """Получает текущую цену монеты"""
             if not coin.value or not coin.value.strip():
                 ui.notify("❌ Сначала введите символ монеты", type="negative")
@@ -518,7 +522,8 @@ def open_enhanced_add_dialog():
                     type="info",
                 )
 
-                price_data = get_aggregated_price(coin_symbol)
+                # Опрос источников выполняется в пуле потоков, чтобы не блокировать UI
+                price_data = await run.io_bound(get_aggregated_price, coin_symbol)
 
                 if price_data and price_data["price"]:
                     current_price = price_data["price"]
@@ -564,7 +569,7 @@ def open_enhanced_add_dialog():
             except Exception as e:
                 ui.notify(f"❌ Ошибка получения цены: {e}", type="negative")
 
-        def on_add():
+        async def on_add():
             """Добавляет сделку"""
             # Валидация полей
             if not coin.value or not coin.value.strip():
@@ -599,7 +604,7 @@ def open_enhanced_add_dialog():
                 )
 
                 # Добавляем транзакцию в базу данных
-                result = add_transaction(data)
+                result = await add_transaction_async(data)
 
                 if result:
                     ui.notify("✅ Сделка успешно добавлена", type="positive")
@@ -646,14 +651,11 @@ def open_enhanced_add_dialog():
 
                         # Получаем монеты из истории торговли
                         try:
-                            transactions = list_transactions()
-                            coin_counts = {}
-                            for tx in transactions:
-                                coin_symbol = tx.get("coin", "").strip().upper()
-                                if coin_symbol:
-                                    coin_counts[coin_symbol] = (
-                                        coin_counts.get(coin_symbol, 0) + 1
-                                    )
+                            coin_counts = {
+                                coin_symbol.strip(): frequency
+                                for coin_symbol, frequency in get_coin_frequency()
+                                if coin_symbol and coin_symbol.strip()
+                            }
 
                             # Базовые популярные монеты
                             popular_coins = [
@@ -1543,12 +1545,12 @@ def portfolio_page():
                         # Контейнер для позиций
                         positions_container = ui.column().classes("w-full")
 
-                        def refresh_positions_data():
+                        async def refresh_positions_data():
                             positions_container.clear()
                             with positions_container:
                                 try:
                                     # Получаем обогащенные позиции
-                                    portfolio_stats = get_portfolio_stats()
+                                    portfolio_stats = await get_portfolio_stats_async()
                                     positions = portfolio_stats.get("top_positions", [])
 
                                     if not positions:
@@ -1748,8 +1750,8 @@ def portfolio_page():
                                             "text-sm text-red-500"
                                         )
 
-                        # Загружаем данные при открытии
-                        refresh_positions_data()
+                        # Загружаем данные при открытии, не блокируя построение страницы
+                        ui.timer(0, refresh_positions_data, once=True)
 
                 def create_transactions_tab():
                     with ui.column().classes(
@@ -1757,83 +1759,177 @@ def portfolio_page():
                     ):
                         ui.label("Сделки").classes("text-2xl font-bold text-gray-800")
                         with ui.card().classes("p-4 bg-white shadow-sm rounded-lg"):
-                            # Получаем список сделок
+                            # Фильтры выполняются на сервере, в браузер уходит только страница
                             try:
-                                transactions = list_transactions()
-                                if transactions:
-                                    # Создаем таблицу сделок
-                                    columns = [
-                                        {
-                                            "name": "id",
-                                            "label": "ID",
-                                            "field": "id",
-                                            "sortable": True,
-                                        },
-                                        {
-                                            "name": "coin",
-                                            "label": "Монета",
-                                            "field": "coin",
-                                            "sortable": True,
-                                        },
-                                        {
-                                            "name": "type",
-                                            "label": "Тип",
-                                            "field": "type",
-                                            "sortable": True,
-                                        },
-                                        {
-                                            "name": "quantity",
-                                            "label": "Количество",
-                                            "field": "quantity",
-                                            "sortable": True,
-                                        },
-                                        {
-                                            "name": "price",
-                                            "label": "Цена",
-                                            "field": "price",
-                                            "sortable": True,
-                                        },
-                                        {
-                                            "name": "source",
-                                            "label": "Источник",
-                                            "field": "source",
-                                            "sortable": True,
-                                        },
-                                        {
-                                            "name": "strategy",
-                                            "label": "Стратегия",
-                                            "field": "strategy",
-                                            "sortable": True,
-                                        },
-                                        {
-                                            "name": "created_at",
-                                            "label": "Дата",
-                                            "field": "created_at",
-                                            "sortable": True,
-                                        },
-                                        {
-                                            "name": "notes",
-                                            "label": "Заметки",
-                                            "field": "notes",
-                                            "sortable": True,
-                                        },
-                                    ]
+                                source_options = [
+                                    name for name, _ in get_sources_with_frequency()
+                                ]
+                            except Exception:
+                                source_options = []
+                            with ui.row().classes("w-full gap-3 items-end flex-wrap mb-2"):
+                                coin_filter = ui.input("Монета").props("clearable debounce=400").classes("w-28")
+                                type_filter = ui.select(
+                                    TYPES, label="Тип", clearable=True
+                                ).classes("w-36")
+                                strategy_filter = ui.select(
+                                    STRATS, label="Стратегия", clearable=True
+                                ).classes("w-36")
+                                source_filter = ui.select(
+                                    source_options, label="Источник", clearable=True
+                                ).classes("w-40")
+                                date_from_filter = ui.input("С даты").props(
+                                    "type=date clearable"
+                                ).classes("w-40")
+                                date_to_filter = ui.input("По дату").props(
+                                    "type=date clearable"
+                                ).classes("w-40")
+
+                            columns = [
+                                {"name": "id", "label": "ID", "field": "id", "sortable": True},
+                                {"name": "coin", "label": "Монета", "field": "coin", "sortable": True},
+                                {"name": "type", "label": "Тип", "field": "type", "sortable": True},
+                                {
+                                    "name": "quantity",
+                                    "label": "Количество",
+                                    "field": "quantity",
+                                    "sortable": True,
+                                },
+                                {"name": "price", "label": "Цена", "field": "price", "sortable": True},
+                                {
+                                    "name": "source",
+                                    "label": "Источник",
+                                    "field": "source",
+                                    "sortable": True,
+                                },
+                                {
+                                    "name": "strategy",
+                                    "label": "Стратегия",
+                                    "field": "strategy",
+                                    "sortable": True,
+                                },
+                                {
+                                    "name": "created_at",
+                                    "label": "Дата",
+                                    "field": "created_at",
+                                    "sortable": True,
+                                },
+                                {"name": "notes", "label": "Заметки", "field": "notes"},
+                            ]
+                            transactions_table = ui.table(
+                                columns=columns,
+                                rows=[],
+                                row_key="id",
+                                pagination={
+                                    "page": 1,
+                                    "rowsPerPage": 50,
+                                    "sortBy": "created_at",
+                                    "descending": True,
+                                    "rowsNumber": 0,
+                                },
+                            ).classes("w-full")
+                            transactions_table.props(
+                                ':rows-per-page-options="[25, 50, 100]" no-data-label="Нет сделок"'
+                            )
 
-                                    ui.table(
-                                        columns=columns, rows=transactions, row_key="id"
-                                    ).classes("w-full")
+                            # Ключи первой и последней строки текущей страницы:
+                            # соседние страницы читаются от них (keyset), без OFFSET
+                            page_state = {"page": 1, "page_args": {}, "first_key": None, "last_key": None}
+
+                            def current_filters() -> dict:
+                                return {
+                                    "coin": coin_filter.value or None,
+                                    "tx_type": type_filter.value or None,
+                                    "strategy": strategy_filter.value or None,
+                                    "source": source_filter.value or None,
+                                    "date_from": date_from_filter.value or None,
+                                    "date_to": date_to_filter.value or None,
+                                }
+
+                            async def load_transactions_page(pagination: dict | None = None, reset: bool = False):
+                                current = transactions_table.pagination
+                                requested = {**current, **(pagination or {})}
+                                rows_per_page = requested.get("rowsPerPage") or 50
+                                sort_by = requested.get("sortBy") or "created_at"
+                                descending = bool(requested.get("descending"))
+                                page_num = requested.get("page") or 1
+                                total = current.get("rowsNumber") or 0
+                                last_page = max(1, -(-total // rows_per_page))
+
+                                same_order = (sort_by, descending, rows_per_page) == (
+                                    current.get("sortBy"),
+                                    bool(current.get("descending")),
+                                    current.get("rowsPerPage"),
+                                )
+                                if reset or not same_order or page_num == 1:
+                                    page_num, page_args = 1, {}
+                                elif page_num == page_state["page"]:
+                                    page_args = page_state["page_args"]
+                                elif page_num == page_state["page"] + 1:
+                                    page_args = {"after": page_state["last_key"]}
+                                elif page_num == page_state["page"] - 1:
+                                    page_args = {"before": page_state["first_key"]}
+                                elif page_num >= last_page:
+                                    page_num = last_page
+                                    page_args = {
+                                        "from_end": True,
+                                        "limit": total - (last_page - 1) * rows_per_page,
+                                    }
                                 else:
-                                    with ui.row().classes(
-                                        "h-48 items-center justify-center bg-gray-50 rounded-lg"
-                                    ):
-                                        ui.label("Нет сделок").classes("text-gray-500")
-                            except Exception as e:
-                                with ui.row().classes(
-                                    "h-48 items-center justify-center bg-gray-50 rounded-lg"
-                                ):
-                                    ui.label(f"Ошибка загрузки: {e}").classes(
-                                        "text-red-500"
+                                    # Прыжок на несоседнюю страницу — через OFFSET,
+                                    # дальше соседние страницы снова по ключам
+                                    page_args = {"offset": (page_num - 1) * rows_per_page}
+
+                                try:
+                                    page = await run.io_bound(
+                                        list_transactions_page,
+                                        **{
+                                            "limit": rows_per_page,
+                                            "sort_by": sort_by,
+                                            "descending": descending,
+                                            **current_filters(),
+                                            **page_args,
+                                        },
                                     )
+                                except Exception as e:
+                                    ui.notify(f"Ошибка загрузки сделок: {e}", type="negative")
+                                    return
+
+                                page_state.update(
+                                    page=page_num,
+                                    page_args=page_args,
+                                    first_key=page["first_key"],
+                                    last_key=page["last_key"],
+                                )
+                                transactions_table.rows = page["rows"]
+                                transactions_table.pagination = {
+                                    "page": page_num,
+                                    "rowsPerPage": rows_per_page,
+                                    "sortBy": sort_by,
+                                    "descending": descending,
+                                    "rowsNumber": page["total"],
+                                }
+                                transactions_table.update()
+
+                            transactions_table.on(
+                                "request",
+                                lambda e: load_transactions_page(e.args["pagination"]),
+                                ["pagination"],
+                            )
+
+                            async def reload_from_first_page():
+                                await load_transactions_page(reset=True)
+
+                            for filter_input in (
+                                coin_filter,
+                                type_filter,
+                                strategy_filter,
+                                source_filter,
+                                date_from_filter,
+                                date_to_filter,
+                            ):
+                                filter_input.on_value_change(reload_from_first_page)
+
+                            ui.timer(0, reload_from_first_page, once=True)
 
                 def create_analytics_tab_local():
                     # Используем новую функцию аналитики
@@ -1917,12 +2013,12 @@ def create_alerts_tab():
             # Контейнер для списка алертов
             alerts_container = ui.column().classes("w-full")
 
-            def refresh_alerts_list():
+            async def refresh_alerts_list():
                 """Обновляет список алертов"""
                 alerts_container.clear()
 
                 try:
-                    alerts = get_price_alerts(active_only=True)
+                    alerts = await get_price_alerts_async(active_only=True)
                     if alerts:
                         for alert in alerts:
                             with alerts_container:
@@ -1974,7 +2070,7 @@ def create_alerts_tab():
                             ui.label(f"Ошибка загрузки: {e}").classes("text-red-500")
 
             # Инициализируем список
-            refresh_alerts_list()
+            ui.timer(0, refresh_alerts_list, once=True)
 
             # Функции для работы с алертами
             def open_add_alert_dialog():
@@ -1999,7 +2095,7 @@ def create_alerts_tab():
                         "w-full mb-4"
                     )
 
-                    def add_alert():
+                    async def add_alert():
                         try:
                             coin = coin_input.value.strip().upper()
                             target_price = float(price_input.value)
@@ -2021,10 +2117,10 @@ def create_alerts_tab():
                                 notes=notes,
                             )
 
-                            add_price_alert(alert_data)
+                            await add_price_alert_async(alert_data)
                             ui.notify(f"Алерт для {coin} создан", type="positive")
                             dialog.close()
-                            refresh_alerts_list()
+                            await refresh_alerts_list()
 
                         except Exception as e:
                             ui.notify(f"Ошибка создания алерта: {e}", type="negative")
@@ -2041,21 +2137,21 @@ def create_alerts_tab():
                 """Редактирует алерт"""
                 ui.notify("Функция редактирования в разработке", type="info")
 
-            def delete_alert(alert):
+            async def delete_alert(alert):
                 """Удаляет алерт"""
                 try:
-                    if delete_price_alert(alert.id):
+                    if await delete_price_alert_async(alert.id):
                         ui.notify(f"Алерт для {alert.coin} удален", type="positive")
-                        refresh_alerts_list()
+                        await refresh_alerts_list()
                     else:
                         ui.notify("Ошибка удаления алерта", type="negative")
                 except Exception as e:
                     ui.notify(f"Ошибка: {e}", type="negative")
 
-            def check_alerts():
+            async def check_alerts():
                 """Проверяет все алерты"""
                 try:
-                    triggered = check_price_alerts()
+                    triggered = await check_price_alerts_async()
                     if triggered:
                         for alert in triggered:
                             ui.notify(
@@ -2063,7 +2159,7 @@ def create_alerts_tab():
                                 type="positive",
                                 timeout=10000,
                             )
-                        refresh_alerts_list()
+                        await refresh_alerts_list()
                     else:
                         ui.notify("Активных алертов не найдено", type="info")
                 except Exception as e:
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Бенчмарк расчета FIFO-позиций: чистый Python против NumPy"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+COINS = ["BTC", "ETH", "SOL", "ADA", "DOT", "AVAX", "LINK", "MATIC", "ATOM", "XRP"]
+STRATEGIES = ["long", "swing", "scalp"]
+TYPES = ["buy", "buy", "sell", "sell", "deposit", "withdrawal", "fee", "airdrop"]
+
+
+def generate_fills(count: int, seed: int = 42) -> list:
+    """Синтетическая история сделок в хронологическом порядке"""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    return [
+        SimpleNamespace(
+            id=i + 1,
+            coin=rng.choice(COINS),
+            strategy=rng.choice(STRATEGIES),
+            type=rng.choice(TYPES),
+            quantity=rng.uniform(0.01, 5.0),
+            price=rng.uniform(1.0, 1000.0),
+            ts_utc=start + timedelta(minutes=i),
+        )
+        for i in range(count)
+    ]
+
+
+def run_benchmark(sizes: list[int], repeat: int = 3) -> None:
+    from app.core.fifo_vectorized import compute_positions_fifo
+    from app.core.services import replay_positions_fifo
+
+    print(f"{'сделок':>10} {'python, с':>12} {'numpy, с':>12} {'ускорение':>10}")
+    for size in sizes:
+        fills = generate_fills(size)
+        columns = (
+            [t.coin for t in fills],
+            [t.strategy for t in fills],
+            [t.type for t in fills],
+            [t.quantity for t in fills],
+            [t.price for t in fills],
+        )
+
+        python_time = numpy_time = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            expected = replay_positions_fifo(fills)
+            python_time = min(python_time, time.perf_counter() - started)
+
+            started = time.perf_counter()
+            actual = compute_positions_fifo(*columns)
+            numpy_time = min(numpy_time, time.perf_counter() - started)
+
+        if actual != expected:
+            print(f"❌ Результаты расходятся на {size} сделках")
+            return
+        print(f"{size:>10} {python_time:>12.3f} {numpy_time:>12.3f} {python_time / numpy_time:>9.1f}x")
+    print("✅ Результаты совпадают")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.repeat)
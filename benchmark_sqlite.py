@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Бенчмарк конкурентного чтения/записи SQLite: настройки по умолчанию против WAL и pragma"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+
+def _run_workload(db_engine, writers: int, readers: int, duration: float) -> dict:
+    from sqlalchemy import func
+    from sqlmodel import Session, SQLModel, select
+
+    from app.core.models import Transaction
+    from app.storage.db import is_busy_error
+
+    SQLModel.metadata.create_all(db_engine)
+    counters = {"writes": 0, "reads": 0, "busy_errors": 0}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def count(name: str) -> None:
+        with lock:
+            counters[name] += 1
+
+    def writer(seed: int) -> None:
+        rng = random.Random(seed)
+        while time.perf_counter() < stop_at:
+            try:
+                with Session(db_engine) as session:
+                    session.add(
+                        Transaction(
+                            coin=rng.choice(["BTC", "ETH", "SOL"]),
+                            type="trade_buy",
+                            quantity=rng.uniform(0.1, 2.0),
+                            price=rng.uniform(10.0, 100.0),
+                            strategy="long_term",
+                            ts_utc=datetime.now(timezone.utc),
+                        )
+                    )
+                    session.commit()
+                count("writes")
+            except Exception as e:
+                if not is_busy_error(e):
+                    raise
+                count("busy_errors")
+
+    def reader() -> None:
+        while time.perf_counter() < stop_at:
+            try:
+                with Session(db_engine) as session:
+                    session.exec(
+                        select(Transaction.coin, func.sum(Transaction.quantity)).group_by(Transaction.coin)
+                    ).all()
+                count("reads")
+            except Exception as e:
+                if not is_busy_error(e):
+                    raise
+                count("busy_errors")
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db_engine.dispose()
+    return {name: value / duration for name, value in counters.items()}
+
+
+def run_benchmark(writers: int, readers: int, duration: float) -> None:
+    from sqlmodel import create_engine
+
+    from app.storage.db import create_db_engine
+
+    configs = {
+        "по умолчанию": lambda uri: create_engine(uri, connect_args={"check_same_thread": False}),
+        "WAL + pragma": create_db_engine,
+    }
+    print(f"Писателей: {writers}, читателей: {readers}, длительность: {duration} с\n")
+    print(f"{'режим':<14} {'записей/с':>10} {'чтений/с':>10} {'busy/с':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (name, factory) in enumerate(configs.items()):
+            path = os.path.join(tmp, f"bench_{i}.db")
+            result = _run_workload(factory(f"sqlite:///{path}"), writers, readers, duration)
+            print(
+                f"{name:<14} {result['writes']:>10.0f} {result['reads']:>10.0f} {result['busy_errors']:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+    run_benchmark(args.writers, args.readers, args.duration)
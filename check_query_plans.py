@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""Проверка планов горячих запросов: полные проходы таблиц и сортировки без индекса"""
+import sys
+
+
+def check_query_plans() -> bool:
+    """Печатает EXPLAIN QUERY PLAN горячих запросов; False при найденных проблемах"""
+    from app.storage.db import init_db
+    from app.storage.query_audit import audit_query_plans
+
+    init_db()
+    results = audit_query_plans()
+    for result in results:
+        print(f"{'✅' if result['ok'] else '❌'} {result['name']}")
+        for detail in result["plan"]:
+            print(f"     {detail}")
+        for issue in result["issues"]:
+            print(f"   ⚠️ {issue}")
+
+    failed = [r for r in results if not r["ok"]]
+    print(f"\n📊 Запросов: {len(results)}, с проблемами: {len(failed)}")
+    return not failed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_query_plans() else 1)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Тест массового импорта сделок: ошибки строк, границы пачек, сверка лотов"""
+import datetime as dt
+import os
+import tempfile
+
+
+def test_bulk_import():
+    print("🔄 Тестируем массовый импорт сделок...")
+    from sqlmodel import SQLModel
+
+    import app.core.services as services
+    from app.storage.db import create_db_engine
+
+    # Отдельная временная база, чтобы не трогать рабочую
+    tmp_dir = tempfile.mkdtemp()
+    test_engine = create_db_engine(f"sqlite:///{os.path.join(tmp_dir, 'bulk.db')}")
+    SQLModel.metadata.create_all(test_engine)
+    original_engine = services.engine
+    services.engine = test_engine
+    try:
+        day = dt.datetime(2024, 1, 1, tzinfo=dt.timezone.utc)
+        first = services.add_transactions_bulk(
+            [
+                {"coin": "BTC", "type": "buy", "quantity": 1, "price": 100, "strategy": "long", "ts_utc": day},
+                {"coin": "BTC", "type": "sell", "quantity": 1, "price": 300, "strategy": "long",
+                 "ts_utc": (day + dt.timedelta(days=10)).isoformat()},
+            ]
+        )
+        assert first["inserted"] == 2 and not first["errors"]
+
+        # Задним числом, с ошибочными строками, пачками по 2 строки
+        result = services.add_transactions_bulk(
+            [
+                {"coin": "BTC", "type": "buy", "quantity": 2, "price": 50, "strategy": "long",
+                 "ts_utc": "2023-12-01T00:00:00Z"},
+                {"coin": "BTC", "type": "buy", "quantity": 1, "price": 100, "strategy": "long", "ts_utc": "garbage"},
+                {"coin": "ETH", "type": "buy", "quantity": "bad", "price": 10, "strategy": "long"},
+                {"coin": "ETH", "type": "buy", "quantity": 3, "price": 10, "strategy": "long",
+                 "ts_utc": day + dt.timedelta(days=1)},
+                {"coin": "BTC", "type": "buy", "quantity": 1, "price": 100, "strategy": "long", "ts_utc": 12345},
+                {"coin": "ETH", "type": "sell", "quantity": 1, "price": 20, "strategy": "long",
+                 "ts_utc": day + dt.timedelta(days=2)},
+                {"coin": "BTC", "type": "buy", "quantity": 1, "price": 200, "strategy": "long",
+                 "ts_utc": dt.datetime(2024, 1, 5)},
+            ],
+            chunk_size=2,
+        )
+        assert result["inserted"] == 4, result
+        assert [error.split(":")[0] for error in result["errors"]] == ["Строка 2", "Строка 3", "Строка 5"]
+        print("✅ Ошибочные строки пропущены - OK")
+
+        positions = services.positions_fifo()
+        assert positions == services.positions_fifo_replay()
+        btc = next(p for p in positions if p["coin"] == "BTC")
+        # Продажа списывает лот от 2023-12-01 по цене 50, а не лот по 100
+        assert btc["quantity"] == 3.0 and btc["realized"] == 250.0
+        print("✅ Лоты совпадают с полным повтором истории - OK")
+    finally:
+        services.engine = original_engine
+        test_engine.dispose()
+    return True
+
+
+if __name__ == "__main__":
+    test_bulk_import()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Тест кэша: запись во время вычисления не оставляет старое значение"""
+import threading
+
+
+def test_invalidation_during_compute():
+    print("🔄 Тестируем инвалидацию во время вычисления...")
+    from app.core.cache import (
+        TAG_TRANSACTIONS,
+        TRANSACTIONS_CACHE_TAGS,
+        cache_manager,
+        cache_transactions,
+        cached,
+        get_cached_transactions,
+        invalidate_data_cache,
+    )
+
+    data = {"v": 1}
+    started, release = threading.Event(), threading.Event()
+
+    @cached(ttl=60, tags=(TAG_TRANSACTIONS,))
+    def read_value():
+        value = data["v"]
+        started.set()
+        release.wait(5)
+        return value
+
+    worker = threading.Thread(target=read_value)
+    worker.start()
+    started.wait(5)
+    # Запись и инвалидация, пока значение вычисляется
+    data["v"] = 2
+    invalidate_data_cache()
+    release.set()
+    worker.join(5)
+    assert read_value() == 2
+    print("✅ @cached - OK")
+
+    # Хелперы сервисов: поколения снимаются до чтения из БД
+    generations = cache_manager.generations(TRANSACTIONS_CACHE_TAGS)
+    rows = [{"id": 1}]
+    invalidate_data_cache()
+    cache_transactions(rows, tag_generations=generations)
+    assert get_cached_transactions() is None
+    cache_transactions(rows, tag_generations=cache_manager.generations(TRANSACTIONS_CACHE_TAGS))
+    assert get_cached_transactions() == rows
+    print("✅ cache_transactions - OK")
+
+
+if __name__ == "__main__":
+    test_invalidation_during_compute()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Тест методов учета себестоимости и векторизованного FIFO"""
+from types import SimpleNamespace
+
+
+def _tx(coin, tx_type, qty, price, strategy="long"):
+    return SimpleNamespace(coin=coin, type=tx_type, quantity=qty, price=price, strategy=strategy)
+
+
+def test_cost_basis_methods():
+    print("🔄 Тестируем методы учета себестоимости...")
+    from app.core.cost_basis import positions_by_method
+    from app.core.fifo_vectorized import compute_positions_fifo
+    from app.core.services import replay_positions_fifo
+
+    items = [
+        _tx("btc", "buy", 1.0, 100.0),
+        _tx("BTC", "buy", 1.0, 300.0),
+        _tx("BTC", "buy", 1.0, 200.0),
+        _tx("BTC", "sell", 1.5, 400.0),
+        _tx("ETH", "sell", 1.0, 50.0),  # продажа без лотов игнорируется
+        _tx("BTC", "deposit", 0.5, 10.0, "swing"),
+    ]
+    result = {
+        method: positions[0]
+        for method, positions in positions_by_method(items, ("fifo", "lifo", "hifo", "average")).items()
+    }
+
+    assert result["fifo"]["realized"] == 350.0
+    assert result["lifo"]["realized"] == 250.0
+    assert result["hifo"]["realized"] == 200.0
+    assert result["average"]["realized"] == 300.0
+    assert result["fifo"]["cost_basis"] == 350.0
+    assert result["hifo"]["cost_basis"] == 200.0
+    for position in result.values():
+        assert position["quantity"] == 1.5
+    print("✅ FIFO/LIFO/HIFO/average - OK")
+
+    columns = (
+        [t.coin for t in items],
+        [t.strategy for t in items],
+        [t.type for t in items],
+        [t.quantity for t in items],
+        [t.price for t in items],
+    )
+    assert compute_positions_fifo(*columns) == replay_positions_fifo(items)
+    print("✅ Векторизованный FIFO совпадает с эталоном - OK")
+    return True
+
+
+if __name__ == "__main__":
+    test_cost_basis_methods()